@@ -7,6 +7,8 @@ from .section_planner import Section_Planner
 from .generator.generate import Webpage_Builder
 from tools import exit_loop
 from google.adk.tools import AgentTool
+from utils.model_routing import model_for
+from utils.state_projection import projected_instruction
 
 # Wrap Web_info as a tool
 web_info_tool = AgentTool(Web_info)
@@ -14,13 +16,13 @@ web_info_tool = AgentTool(Web_info)
 # Root coordinator agent
 Base = LlmAgent(
     name="Base_agent",
-    model="gemini-2.5-flash",
+    model=model_for("Base_agent"),
     description=(
         "Root agent that coordinates the process of building a static web page. "
         "It collects requirements, gathers external references, generates "
         "a structured section plan, and then runs an iterative loop to build the HTML."
     ),
-    instruction=(
+    instruction=projected_instruction(
     "Step 1. Call `Requirement_gatherer` to collect all user input into {problem_config}.\n"
     "Step 2. Use the `web_info_tool` to gather external references into {web_info_output}.\n"
     "Step 3. Call `Section_Planner` using {problem_config} and {web_info_output}, store in {section_plan}.\n"
@@ -31,7 +33,10 @@ Base = LlmAgent(
     "Important: If the user asks a question unrelated to webpage creation, provide a short, polite answer, "
     "then remind them the main task is to build their webpage. Do not generate anything outside the webpage content.\n"
     "Step 7. Once exit_loop is called, ensure {generated_code} is returned as the final response to the user. "
-    "Include it as a code block in the output message."
+    "Include it as a code block in the output message.\n"
+    "Step 8. If the user changes requirements after the page is built, call `Requirement_gatherer` to record them. "
+    "{regeneration?} then lists what the edit affects: call `Section_Planner` again only if its replan flag is true, "
+    "otherwise go straight to `Webpage_Builder`, which regenerates only the listed sections and keeps the rest."
     ),
     sub_agents=[Requirement_gatherer, Section_Planner, Webpage_Builder],
     tools=[web_info_tool]
@@ -0,0 +1,127 @@
+# budgeted_loop.py
+
+import hashlib
+import time
+from typing import AsyncGenerator, Optional
+from google.adk.agents import LoopAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.utils.context_utils import Aclosing
+from google.genai import types
+from tools.html_validator import validate_html
+from utils.metrics import BUILD_OUTCOMES
+from utils.page_document import build_page_index
+
+# {build_outcome} statuses
+COMPLETED, CONVERGED, MAX_ITERATIONS, MAX_SECONDS, MAX_TOKENS = "completed", "converged", "max_iterations", "max_seconds", "max_tokens"
+
+
+def _fingerprint(html: Optional[str]) -> str:
+    return hashlib.sha256((html or "").encode("utf-8")).hexdigest()
+
+
+def _page_score(html: Optional[str], section_plan) -> tuple:
+    """ Lower is better: (validation errors, empty sections). """
+    report = validate_html(html, section_plan)
+    return report["errors"], len(report["pending_sections"])
+
+
+class BudgetedLoopAgent(LoopAgent):
+    """
+    LoopAgent with iteration, wall-clock and token budgets and convergence detection.
+
+    The loop stops when a sub-agent escalates (Determiner's exit_loop) or sets
+    {build_complete} (Determiner's deterministic pass), when
+    {generated_code} has not changed for `convergence_rounds` rounds, or when a
+    budget runs out; budgets are checked after every event, so an exhausted build
+    stops without waiting for the rest of the round. The best page seen in any
+    round (fewest validation errors, then fewest empty sections) is restored if
+    the last one is worse, and the outcome is stored in {build_outcome}.
+    A budget of 0 means no limit.
+    """
+
+    max_seconds: float = 0
+    """ Wall-clock budget of one build. """
+
+    max_tokens: int = 0
+    """ Model token budget (prompt + completion) of one build. """
+
+    convergence_rounds: int = 2
+    """ Rounds without a change to {generated_code} after which the loop stops. """
+
+    def _over_budget(self, started: float, tokens: int, rounds: Optional[int] = None) -> Optional[str]:
+        """ The budget that ran out, if any; the iteration budget is only checked between rounds. """
+        if rounds is not None and self.max_iterations and rounds >= self.max_iterations:
+            return MAX_ITERATIONS
+        if self.max_seconds and time.perf_counter() - started >= self.max_seconds:
+            return MAX_SECONDS
+        if self.max_tokens and tokens >= self.max_tokens:
+            return MAX_TOKENS
+        return None
+
+    def _state_event(self, ctx: InvocationContext, state_delta: dict, text: Optional[str] = None) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=text)]) if text else None,
+            actions=EventActions(state_delta=state_delta)
+        )
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        started = time.perf_counter()
+        rounds, tokens, unchanged = 0, 0, 0
+        status = None
+        fingerprint = _fingerprint(state.get("generated_code"))
+        best_html, best_score = None, None
+
+        while status is None:
+            for sub_agent in self.sub_agents:
+                escalated = False
+                async with Aclosing(sub_agent.run_async(ctx)) as agen:
+                    async for event in agen:
+                        yield event
+                        if event.usage_metadata and not event.partial:
+                            tokens += event.usage_metadata.total_token_count or 0
+                        # Like LoopAgent, let an escalating sub-agent finish its turn
+                        escalated = escalated or bool(event.actions.escalate) or bool(event.actions.state_delta.get("build_complete"))
+                        status = None if escalated else self._over_budget(started, tokens)
+                        if status:
+                            break
+                if escalated:
+                    status = COMPLETED
+                if status:
+                    break
+            rounds += 1
+
+            html = state.get("generated_code")
+            if html:
+                score = _page_score(html, state.get("section_plan"))
+                if best_score is None or score <= best_score:
+                    best_html, best_score = html, score
+
+            current = _fingerprint(html)
+            unchanged = unchanged + 1 if current == fingerprint else 0
+            fingerprint = current
+            if status is None and self.convergence_rounds and unchanged >= self.convergence_rounds:
+                status = CONVERGED
+            status = status or self._over_budget(started, tokens, rounds)
+
+        outcome = {
+            "status": status,
+            "iterations": rounds,
+            "seconds": round(time.perf_counter() - started, 3),
+            "tokens": tokens
+        }
+        state_delta = {"build_outcome": outcome}
+        text = None
+        html = state.get("generated_code")
+        if status != COMPLETED:
+            # Out of budget or stuck: hand back the best page seen, not necessarily the last one
+            if best_html is not None and best_html != html and best_score < _page_score(html, state.get("section_plan")):
+                state_delta.update({"generated_code": best_html, "page_index": build_page_index(best_html)})
+                outcome["restored_best"] = True
+            text = f"The build stopped early ({status}) after {rounds} round(s); returning the best page so far."
+        BUILD_OUTCOMES.labels(status).inc()
+        yield self._state_event(ctx, state_delta, text)
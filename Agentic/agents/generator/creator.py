@@ -1,29 +1,43 @@
 # creator_agent.py
 
 from google.adk.agents import LlmAgent
+from utils.page_document import apply_creator_output, skip_idle_round
+from utils.template_library import start_from_template
+from utils.model_routing import model_for
+from utils.state_projection import projected_instruction
 
 Creator = LlmAgent(
     name="Creator",
-    model="gemini-2.5-flash",
+    model=model_for("Creator"),
     description=(
         "Generates HTML boilerplate code and sections of a static webpage based on instructions. "
         "All CSS is inline. Inline JS can be added per element, but the main <script> block will be "
-        "generated at the end of the body tag. Stores generated code in {generated_code}."
+        "generated at the end of the body tag. Returns only the changed sections, which are merged into {generated_code}."
     ),
-    instruction=(
+    # Unset requirement fields are left out of the prompt (utils/state_projection.py)
+    instruction=projected_instruction(
         "Always use {problem_config} and {web_info_output} to gather relevant information "
         "for titles, meta tags, headings, links, and default content.\n\n"
-        "Step 1: If state {generated_code} is empty, generate the full HTML boilerplate including:\n"
+        "{page_index?} describes the current page: whether it exists, its skeleton (head and layout with "
+        "empty section placeholders) and which sections are filled.\n\n"
+        "Step 1: If there is no page yet, generate the full HTML boilerplate including:\n"
         "  - <!DOCTYPE html> declaration\n"
         "  - <html> and <head> tags\n"
         "  - <title> and meta description/keywords from {web_info_output} or {problem_config}\n"
-        "  - <body> tag with placeholders for sections (empty divs or comments) corresponding to {section_plan}\n"
+        "  - <body> tag with one empty placeholder per section of {section_plan}, written as the comment pair "
+        "<!-- section:<id> --><!-- /section:<id> --> where <id> is the section name in lowercase with dashes\n"
         "  - At this stage, do NOT generate section contents yet\n"
         "  - Add an empty <script></script> tag at the end of body for future JS\n\n"
-        "Step 2: If {generated_code} exists and state {instruct} contains section instructions, "
-        "update {generated_code} by adding the new section(s) as per instructions. "
+        "Step 2: If the page exists and state {instruct} contains instructions, do NOT re-send the page. "
+        "Return only the section(s) you add or change, each wrapped in its placeholder comments:\n"
+        "<!-- section:<id> -->\n...section HTML...\n<!-- /section:<id> -->\n"
+        "Sections you do not return stay unchanged. "
         "Use {web_info_output} and {problem_config} if needed to fill content (like header titles, links, or default text). "
-        "Maintain all existing code and inline CSS. "
-        "Update the code in {generated_code} state after each addition."
-    )
+        "Use inline CSS and keep the main <script> at the end of body.\n"
+        "Only if {instruct} requires changes outside the section placeholders (for example <head> metadata), "
+        "return the full skeleton with those changes; the filled sections are kept automatically."
+    ),
+    output_key="creator_output",
+    before_agent_callback=[start_from_template, skip_idle_round],
+    after_agent_callback=apply_creator_output
 )
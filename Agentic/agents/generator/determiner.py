@@ -1,11 +1,71 @@
 # determiner_agent.py
 
+import json
+from typing import Optional
 from google.adk.agents import LlmAgent
-from tools import exit_loop
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+from tools import exit_loop, validate_generated_code
+from tools.html_validator import validate_html
+from utils.page_dependencies import regeneration_instruction
+from utils.page_document import parse_section_plan, section_slots
+from utils.model_routing import model_for
+from utils.state_projection import FieldProjection, page_around_findings, projected_instruction
+
+
+def deterministic_review(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    before_agent_callback: run the local HTML checks before spending a model turn.
+
+    - Findings with errors: the model runs and turns {validation_report} into fix instructions.
+    - Valid page with empty sections: the next section's instruction is written to {instruct}
+      directly and the model is skipped.
+    - Valid page with regions queued in {regeneration} after a requirement edit: the next
+      one is sent to Creator directly, and the final model review is skipped afterwards.
+    - Valid, complete page: the model runs once for the final semantic review; if the page is
+      still valid and complete afterwards, the loop is ended without another model turn.
+    """
+    section_plan = parse_section_plan(callback_context.state.get("section_plan"))
+    report = validate_html(callback_context.state.get("generated_code"), section_plan)
+    callback_context.state["validation_report"] = report
+    # Consecutive failed checks; model routing escalates Creator and Determiner on it
+    failures = 0 if report["valid"] else (callback_context.state.get("validation_failures") or 0) + 1
+    if failures != callback_context.state.get("validation_failures"):
+        callback_context.state["validation_failures"] = failures
+
+    if not report["valid"]:
+        return None
+
+    instruct = regeneration_instruction(callback_context.state)
+    if instruct:
+        callback_context.state["instruct"] = instruct
+        return types.Content(role="model", parts=[types.Part(text=instruct)])
+    if report["pending_sections"]:
+        name = report["pending_sections"][0]
+        slug = section_slots(section_plan)[name]
+        instruct = (
+            f"Add the '{name}' section inside its <!-- section:{slug} --> placeholder. "
+            f"Section plan content: {json.dumps(section_plan[name], default=str)}. "
+            "Use relevant details from web_info_output and problem_config. "
+            "Use inline CSS and alt text on images, and keep the main <script> at the end of body."
+        )
+        callback_context.state["instruct"] = instruct
+        return types.Content(role="model", parts=[types.Part(text=instruct)])
+
+    if not callback_context.state.get("final_review_done"):
+        callback_context.state["final_review_done"] = True
+        return None
+
+    # Already reviewed and nothing left to add: stop the loop without a model call.
+    # CallbackContext has no public escalate, so Webpage_Builder watches for build_complete instead.
+    callback_context.state["instruct"] = None
+    callback_context.state["regeneration"] = None
+    callback_context.state["build_complete"] = True
+    return types.Content(role="model", parts=[types.Part(text="All sections are complete and the page passed validation.")])
 
 Determiner = LlmAgent(
     name="Determiner",
-    model="gemini-2.5-flash",
+    model=model_for("Determiner"),
     description=(
         "Validates the HTML code generated by Creator. "
         "If the code is incorrect or incomplete, returns instructions in {instruct} "
@@ -14,7 +74,10 @@ Determiner = LlmAgent(
         "After all sections are completed, performs a final refinement pass to ensure clean, valid, and optimized HTML. "
         "Finally, it calls the exit_loop tool when everything is complete."
     ),
-    instruction=(
+    instruction=projected_instruction(
+        "Step 0: {validation_report} holds a deterministic check of {generated_code} (DOCTYPE, balanced tags, "
+        "final <script>, image alt text, section placeholders). If it lists errors, turn each finding into a precise "
+        "fix instruction for Creator in {instruct} first. Call `validate_generated_code` to re-run the check if needed.\n"
         "Step 1: Review the state {generated_code}.\n"
         "  - Check for valid HTML boilerplate: <!DOCTYPE html>, <html>, <head>, <body>, and empty <script> tag at the end.\n"
         "  - Ensure <title> and meta tags are present and use {web_info_output} and {problem_config} for relevant info.\n"
@@ -46,8 +109,15 @@ Determiner = LlmAgent(
         "  - If refinement is needed, populate {instruct} with clear corrections for Creator.\n\n"
         
         "Step 6: If refinement is complete and no issues remain:\n"
-        "  - Call the exit_loop tool to stop the generation loop."
+        "  - Call the exit_loop tool to stop the generation loop.",
+        {
+            # Fix rounds see the sections with errors in full; the final review sees the whole page
+            "generated_code": FieldProjection(transform=page_around_findings),
+            "validation_report": FieldProjection(keys=("valid", "findings", "pending_sections"))
+        }
     ),
     sub_agents=[],
-    tools=[exit_loop]
+    tools=[exit_loop, validate_generated_code],
+    output_key="instruct",
+    before_agent_callback=deterministic_review
 )
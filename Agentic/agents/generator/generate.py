@@ -1,23 +1,55 @@
 # loop_agent.py
 
-from google.adk.agents import LoopAgent
+import os
 
 # Import your agents
 from .creator import Creator
 from .determiner import Determiner
+from .parallel_builder import ParallelSectionBuilder
+from .budgeted_loop import BudgetedLoopAgent
+from utils.page_dependencies import reconcile_page, record_dependencies
+from utils.page_document import close_build
+from utils.template_library import learn_from_page
 
-# LoopAgent Definition
-Webpage_Builder = LoopAgent(
-    name="Webpage_Builder",
-    description=(
-        "Coordinates Creator and Determiner agents to iteratively build the HTML page. "
-        "1. Starts with Creator generating the boilerplate code and storing it in {generated_code}. "
-        "2. Determiner validates {generated_code}. If incorrect, Determiner sends {instruct} to Creator. "
-        "3. If correct, Determiner provides {instruct} for adding the next section from {section_plan}. "
-        "4. Creator updates {generated_code} with each instruction. "
-        "5. Repeat until all sections are complete. "
-        "6. Determiner calls the exit_loop tool to stop the loop once no instructions remain."
-    ),
-    sub_agents=[Creator, Determiner]
-)
+# BUILD_MODE=loop (default) builds one section per Creator/Determiner round;
+# BUILD_MODE=parallel generates all sections concurrently and validates once.
+BUILD_MODE = os.getenv("BUILD_MODE", "loop").lower()
 
+if BUILD_MODE == "parallel":
+    Webpage_Builder = ParallelSectionBuilder(
+        name="Webpage_Builder",
+        description=(
+            "Builds the HTML page in one fan-out round. "
+            "1. Generates the boilerplate (unless the template library has a close match) and every section "
+            "of {section_plan} concurrently with Creator. "
+            "2. Stitches the section fragments into the boilerplate placeholders and stores the page in {generated_code}. "
+            "3. Determiner validates the page once; if it returns {instruct}, Creator applies the fixes once."
+        ),
+        max_concurrency=int(os.getenv("SECTION_CONCURRENCY", 4)),
+        sub_agents=[Creator, Determiner],
+        before_agent_callback=reconcile_page,
+        after_agent_callback=[close_build, record_dependencies, learn_from_page]
+    )
+else:
+    # LoopAgent Definition, bounded by BUILD_MAX_* budgets (0 = no limit)
+    Webpage_Builder = BudgetedLoopAgent(
+        name="Webpage_Builder",
+        description=(
+            "Coordinates Creator and Determiner agents to iteratively build the HTML page. "
+            "1. Starts with Creator generating the boilerplate code (or taking the closest match from the template "
+            "library) and storing it in {generated_code}. "
+            "2. Determiner validates {generated_code}. If incorrect, Determiner sends {instruct} to Creator. "
+            "3. If correct, Determiner provides {instruct} for adding the next section from {section_plan}. "
+            "4. Creator updates {generated_code} with each instruction. "
+            "5. Repeat until all sections are complete. "
+            "6. Determiner calls the exit_loop tool to stop the loop once no instructions remain. "
+            "The loop also stops when {generated_code} stops changing or a budget runs out; {build_outcome} records why."
+        ),
+        max_iterations=int(os.getenv("BUILD_MAX_ITERATIONS", 30)),
+        max_seconds=float(os.getenv("BUILD_MAX_SECONDS", 600)),
+        max_tokens=int(os.getenv("BUILD_MAX_TOKENS", 0)),
+        convergence_rounds=int(os.getenv("BUILD_CONVERGENCE_ROUNDS", 2)),
+        sub_agents=[Creator, Determiner],
+        before_agent_callback=reconcile_page,
+        after_agent_callback=[close_build, record_dependencies, learn_from_page]
+    )
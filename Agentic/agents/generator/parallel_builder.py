@@ -0,0 +1,194 @@
+# parallel_builder.py
+
+import asyncio
+import json
+from typing import AsyncGenerator, Optional
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+from utils.page_document import (
+    build_page_index, ensure_slots, fill_slots, list_slots, parse_section_plan, section_slots, strip_code_fence
+)
+from utils.template_library import template_boilerplate
+from utils.state_projection import DEFAULT_PROJECTION, project_value
+
+
+def _context_json(ctx: ReadonlyContext, key: str) -> str:
+    """ Render a state entry for a prompt, unset fields left out. """
+    return json.dumps(project_value(ctx.state.get(key), DEFAULT_PROJECTION, ctx.state), separators=(",", ":"), default=str)
+
+
+def boilerplate_instruction(slots: dict):
+    """ Instruction for the fan-out call that produces only the page skeleton. """
+    placeholders = "\n".join(f"  <!-- section:{slug} --><!-- /section:{slug} -->" for slug in slots.values())
+
+    def provider(ctx: ReadonlyContext) -> str:
+        return (
+            "Generate the full HTML boilerplate of a static webpage.\n"
+            f"Requirements (problem_config): {_context_json(ctx, 'problem_config')}\n"
+            f"External references (web_info_output): {_context_json(ctx, 'web_info_output')}\n\n"
+            "Include the <!DOCTYPE html> declaration, <html>, <head> with <title>, meta description and keywords, "
+            "and a <body> that contains exactly these section placeholders, in this order, with nothing inside them:\n"
+            f"{placeholders}\n"
+            "Add an empty <script></script> tag at the end of body for future JS. All CSS is inline. "
+            "Do NOT generate section contents. Return only the HTML."
+        )
+
+    return provider
+
+
+def section_instruction(section_name: str, section_content, slug: str):
+    """ Instruction for the fan-out call that produces one section fragment. """
+
+    def provider(ctx: ReadonlyContext) -> str:
+        return (
+            f"Generate the HTML for the '{section_name}' section of a static webpage.\n"
+            f"Section plan entry: {json.dumps(section_content, default=str)}\n"
+            f"Requirements (problem_config): {_context_json(ctx, 'problem_config')}\n"
+            f"External references (web_info_output): {_context_json(ctx, 'web_info_output')}\n\n"
+            f"Return ONLY the fragment that goes inside the '{slug}' placeholder, wrapped in a single "
+            f"<section id=\"{slug}\"> element. Do not include <html>, <head>, <body> or <script> blocks. "
+            "All CSS is inline; inline JS may be added per element. Use alt text on images."
+        )
+
+    return provider
+
+
+class ParallelSectionBuilder(BaseAgent):
+    """
+    Builds the page with one concurrent Creator call per section instead of a Creator/Determiner loop.
+
+    The boilerplate and every entry of {section_plan} are generated at the same
+    time (at most `max_concurrency` model calls in flight); when the template
+    library has a close match, its skeleton is used and the boilerplate call is
+    skipped. When the page already exists (a requirement edit), only its empty
+    sections and those queued in {regeneration} are generated, into the current
+    page. The fragments are stitched into the boilerplate's section slots. A single validation pass
+    follows: Determiner reviews the page and, if it asks for fixes, Creator
+    applies them once.
+    """
+
+    max_concurrency: int = 4
+    """ Upper bound on concurrent section generation calls. """
+
+    @property
+    def creator(self) -> LlmAgent:
+        return self.sub_agents[0]
+
+    @property
+    def determiner(self) -> LlmAgent:
+        return self.sub_agents[1]
+
+    def _fragment_agent(self, name: str, instruction) -> LlmAgent:
+        """ A history-free copy of Creator with its own instruction. """
+        return self.creator.clone(update={
+            "name": name,
+            "instruction": instruction,
+            "output_key": None,
+            "include_contents": "none",
+            "before_agent_callback": None,
+            "after_agent_callback": None
+        })
+
+    def _branch_context(self, ctx: InvocationContext, agent: BaseAgent) -> InvocationContext:
+        """ Give each fan-out call its own branch so the calls do not see each other's events. """
+        branch_ctx = ctx.model_copy()
+        branch_suffix = f"{self.name}.{agent.name}"
+        branch_ctx.branch = f"{ctx.branch}.{branch_suffix}" if ctx.branch else branch_suffix
+        return branch_ctx
+
+    async def _run_fan_out(self, ctx: InvocationContext, agents: dict) -> AsyncGenerator[tuple, None]:
+        """ Run the agents concurrently, yielding (slot, event) pairs as they arrive. """
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def run_one(slug: str, agent: LlmAgent):
+            try:
+                async with semaphore:
+                    async for event in agent.run_async(self._branch_context(ctx, agent)):
+                        await queue.put((slug, event))
+            finally:
+                await queue.put((slug, done))
+
+        tasks = [asyncio.create_task(run_one(slug, agent)) for slug, agent in agents.items()]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                slug, event = await queue.get()
+                if event is done:
+                    remaining -= 1
+                    continue
+                yield slug, event
+            # Surface the first failure, if any
+            for task in tasks:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _state_event(self, ctx: InvocationContext, state_delta: dict, text: Optional[str] = None) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=text)]) if text else None,
+            actions=EventActions(state_delta=state_delta)
+        )
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        section_plan = parse_section_plan(ctx.session.state.get("section_plan"))
+        if not section_plan:
+            yield self._state_event(ctx, {}, "No section plan is available yet; run Section_Planner first.")
+            return
+
+        slots = section_slots(section_plan)
+        state = ctx.session.state
+        existing = state.get("generated_code")
+        agents = {}
+        if existing:
+            boilerplate = existing
+            current = list_slots(existing)
+            stale = set((state.get("regeneration") or {}).get("sections") or ())
+            targets = [name for name, slug in slots.items() if not current.get(slug) or slug in stale]
+        else:
+            template = template_boilerplate(state, section_plan)
+            boilerplate = template[0] if template else None
+            if template is None:
+                agents["__boilerplate__"] = self._fragment_agent("Creator_boilerplate", boilerplate_instruction(slots))
+            targets = list(section_plan)
+        for index, (name, content) in enumerate(section_plan.items()):
+            if name in targets:
+                agents[slots[name]] = self._fragment_agent(f"Creator_section_{index}", section_instruction(name, content, slots[name]))
+
+        outputs = {}
+        async for slug, event in self._run_fan_out(ctx, agents):
+            yield event
+            if event.is_final_response() and event.content and event.content.parts:
+                outputs[slug] = "".join(part.text for part in event.content.parts if part.text)
+
+        # Stitch the fragments into the boilerplate slots
+        if boilerplate is None:
+            boilerplate = strip_code_fence(outputs.pop("__boilerplate__", ""))
+        html = ensure_slots(boilerplate, slots.values())
+        html = fill_slots(html, {slug: strip_code_fence(fragment) for slug, fragment in outputs.items()})
+        state_delta = {"generated_code": html, "page_index": build_page_index(html), "instruct": None}
+        if existing and state.get("regeneration"):
+            state_delta["regeneration"] = {**state["regeneration"], "sections": []}
+        yield self._state_event(ctx, state_delta)
+
+        # Single validation pass: Determiner reviews once, Creator fixes once if asked to
+        escalated = False
+        async for event in self.determiner.run_async(ctx):
+            yield event
+            if event.actions.escalate or event.actions.state_delta.get("build_complete"):
+                escalated = True
+
+        if not escalated and ctx.session.state.get("instruct"):
+            async for event in self.creator.run_async(ctx):
+                yield event
+        # A requirement edit is fully handled by this single pass
+        if ctx.session.state.get("regeneration"):
+            yield self._state_event(ctx, {"regeneration": None})
@@ -1,15 +1,17 @@
 from google.adk.agents import LlmAgent
-from tools import update_problem_config_tool
+from tools import update_problem_config_tool, update_problem_config_batch_tool, prefill_requirements
+from utils.model_routing import model_for
+from utils.state_projection import FieldProjection, projected_instruction
 
 Requirement_gatherer = LlmAgent(
     name="requirement_gatherer",
-    model="gemini-2.5-flash",
+    model=model_for("requirement_gatherer"),
     description=(
         "This agent collects all necessary information to generate a static web page. "
         "It first fills the {details} fields by asking the user for input, then maps these details "
         "to populate the {problem_config} mandatory fields and optional fields wherever possible."
     ),
-    instruction=(
+    instruction=projected_instruction(
         "1. Start by collecting all values for the {details} fields: "
         "'Page Purpose', 'Content', 'Layout & Styling', 'Images', "
         "'External Resources', and 'Simple Interactivity'. "
@@ -25,13 +27,23 @@ Requirement_gatherer = LlmAgent(
         "'Animations / Effects') can be filled if the {details} provide relevant information.\n\n"
 
         "3. Continuously check if the user updates any {details} mid-conversation. "
-        "If updates occur, immediately update the corresponding {problem_config} values using update_problem_config_tool.\n\n"
+        "If updates occur, immediately update the corresponding {problem_config} values using update_problem_config_tool.\n"
+        "When several fields change at once, set them all in a single update_problem_config_batch_tool call. "
+        "Some fields may already be prefilled from the user's message by simple pattern matching. "
+        "Check them against what the user said, mention them in your summary so the user can confirm them, "
+        "and overwrite any that are wrong.\n\n"
 
         "4. If the user cannot provide a value for a detail or leaves it blank, infer a reasonable value "
         "based on other provided details. Do not invent unrelated content.\n\n"
 
         "5. Do not generate the final HTML/CSS yet. After mapping {details} to {problem_config}, "
-        "ask the user to review and approve the collected information before proceeding."
+        "ask the user to review and approve the collected information before proceeding.",
+        # Unset fields stay in: they are what is left to ask for
+        {
+            "details": FieldProjection(drop_empty=False),
+            "problem_config": FieldProjection(drop_empty=False)
+        }
     ),
-    tools=[update_problem_config_tool]
+    tools=[update_problem_config_tool, update_problem_config_batch_tool],
+    before_agent_callback=prefill_requirements
 )
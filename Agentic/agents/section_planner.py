@@ -1,21 +1,35 @@
 # section_planner_agent.py
 
 from google.adk.agents import LlmAgent
+from utils.response_cache import make_stage_cache_callbacks
+from utils.model_routing import model_for
+from utils.state_projection import projected_instruction
+
+section_plan_cache_before, section_plan_cache_after = make_stage_cache_callbacks(
+    stage="Section_Planner",
+    output_key="section_plan",
+    # The plan is built from the web resources as well as the requirements
+    input_keys=("web_info_output",)
+)
 
 Section_Planner = LlmAgent(
     name="Section_Planner",
-    model="gemini-2.5-flash",
+    model=model_for("Section_Planner"),
     description=(
         "Agent that organizes webpage content into structured sections. "
         "It uses both {problem_config} (requirements) and {web_info_output} (external resources). "
         "The output is stored in {section_plan} as a dictionary where keys are section names "
         "and values are the corresponding content."
     ),
-    instruction=(
+    instruction=projected_instruction(
         "1. Analyze {problem_config} and {web_info_output}.\n"
         "2. Create a section plan for the static webpage.\n"
         "3. Each section must be a dictionary entry: {section_name: section_content}.\n"
         "4. Ensure content is concise, clear, and directly usable for webpage generation.\n"
         "5. Store the final dictionary in {section_plan}."
-    )
+    ),
+    # {section_plan} holds the model's reply text; readers go through parse_section_plan
+    output_key="section_plan",
+    before_agent_callback=section_plan_cache_before,
+    after_agent_callback=section_plan_cache_after
 )
@@ -1,18 +1,31 @@
 from google.adk.agents import LlmAgent
-from google.adk.tools import google_search
+from tools.web_search import web_search
+from utils.response_cache import make_stage_cache_callbacks
+from utils.model_routing import model_for
+from utils.state_projection import FieldProjection, projected_instruction
+
+# Web_info only looks at these problem_config keys, so only they form the cache key
+WEB_INFO_CONFIG_FIELDS = ("Page Title", "Main Content", "Page Structure")
+
+web_info_cache_before, web_info_cache_after = make_stage_cache_callbacks(
+    stage="Web_info",
+    output_key="web_info_output",
+    config_fields=WEB_INFO_CONFIG_FIELDS
+)
 
 # Web_info agent to gather external resources for static pages
 Web_info = LlmAgent(
     name="Web_info",
-    model="gemini-2.5-flash",
+    model=model_for("Web_info"),
     description=(
         "An agent that performs targeted web searches to gather supporting links, images, "
-        "and references for static web pages. Designed to suggest content without exceeding quota limits."
+        "and references for static web pages. Searches are cached and shared across sessions to stay within quota limits."
     ),
-    instruction=(
+    instruction=projected_instruction(
     "1. Use ONLY the 'Page Title', 'Main Content', and 'Page Structure' from {problem_config} "
     "to form concise search queries.\n"
-    "2. Perform searches using the `google_search` tool, limiting results to the top 5 most relevant links and media.\n"
+    "2. Perform searches using the `web_search` tool (at most 3 queries), keeping the top 5 most relevant links and media "
+    "from its 'results'.\n"
     "3. Collect only the essential URLs or inspiration for design, colors, components, or external references.\n"
     "4. Store the final collected links and media in web_info_output, structured as a dictionary with keys:\n"
     "   - 'design_inspiration': list of links to design inspiration or example sites\n"
@@ -20,7 +33,11 @@ Web_info = LlmAgent(
     "   - 'component_examples': list of links to UI/component examples\n"
     "   - 'external_links': list of other reference URLs\n"
     "5. Return {web_info_output} with content related to the topics or fields described in {problem_config}.\n"
-    "6. Avoid repeating searches for the same query in the same session."
+    "6. Avoid repeating searches for the same query in the same session.",
+    {"problem_config": FieldProjection(keys=WEB_INFO_CONFIG_FIELDS)}
     ),
-    tools=[google_search]
+    tools=[web_search],
+    output_key="web_info_output",
+    before_agent_callback=web_info_cache_before,
+    after_agent_callback=web_info_cache_after
 )
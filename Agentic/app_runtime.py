@@ -0,0 +1,139 @@
+# app_runtime.py
+# Everything that needs google.adk. main.py imports this module in the background
+# (see startup.Prewarm), so the server accepts connections before it is loaded.
+import asyncio
+import os
+from google.adk.agents import LlmAgent
+from google.adk.models.google_llm import Gemini
+from google.adk.tools import AgentTool
+from logger_config import setup_logger
+from utils import call_agent_query_async, stream_agent_query_async, create_runner, SessionManager, build_session_service
+from utils import JobQueue, QueueFullError, build_job_store, build_context_compactor
+from utils.job_queue import FAILED, SUCCEEDED
+from utils.response_cache import response_cache_stats
+from utils.template_library import get_template_library, template_library_stats
+from utils.metrics import MetricsPlugin, metrics_payload
+from utils.model_routing import ModelRoutingPlugin
+from utils.page_artifact import render_artifact
+from utils.rate_limiter import BACKGROUND, QuotaExceededError, rate_limiter_stats, request_priority
+from utils.idempotency import IdempotencyConflictError, IdempotencyStore, MAX_KEY_LENGTH, NEW, REPLAYED, request_fingerprint
+
+# Importing the agents
+from agents import Base
+
+APP_NAME = os.getenv("APP_NAME")
+
+logging = setup_logger("orion_logs")
+
+# Session configuration (SESSION_BACKEND=memory|sqlite)
+session_service = build_session_service(logging)
+
+session_manager = SessionManager(
+    session_service=session_service,
+    app_name=APP_NAME,
+    logging=logging,
+    # Compacts histories past CONTEXT_TOKEN_BUDGET before the next turn (CONTEXT_COMPACTION=0 to disable)
+    compactor=build_context_compactor(session_service, logging)
+)
+
+# Per-stage latency/token metrics; TRACE_DIR additionally dumps one JSON trace per request
+metrics_plugin = MetricsPlugin(trace_dir=os.getenv("TRACE_DIR") or None)
+
+# Per-stage models come from model_routes.json; this escalates struggling stages to their stronger model
+routing_plugin = ModelRoutingPlugin(logging)
+
+# ------------------ Global runner ------------------
+# A single runner serves every session; per-session state lives in the session service.
+runner = None
+
+async def run_job(job):
+    """ Job handler: run one queued query like /agent/query does, behind interactive turns at the rate limiter. """
+    async with session_manager.lock(job.user_id, job.session_id):
+        await session_manager.ensure_session(job.user_id, job.session_id)
+        with request_priority(BACKGROUND):
+            return await call_agent_query_async(
+                query=job.prompt,
+                runner=runner,
+                user_id=job.user_id,
+                session_id=job.session_id,
+                logging=logging
+            )
+
+# Background builds (JOB_STORE=memory|sqlite); workers start with the runner
+job_queue = JobQueue(
+    store=build_job_store(logging),
+    handler=run_job,
+    logging=logging,
+    workers=int(os.getenv("JOB_WORKERS", 2)),
+    max_queued=int(os.getenv("JOB_QUEUE_SIZE", 100)),
+    max_per_user=int(os.getenv("JOB_MAX_PER_USER", 10)),
+    result_ttl=float(os.getenv("JOB_RESULT_TTL", 3600)),
+    # With JOB_STORE=sqlite shared by several processes: how long a claimed job survives without a heartbeat
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", 60))
+)
+
+# Agent queries sent with an Idempotency-Key run once: duplicates join the run in flight,
+# replays within IDEMPOTENCY_TTL seconds get its stored result
+idempotency = IdempotencyStore(
+    logging=logging,
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", 600)),
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 1000))
+)
+
+
+def _llm_agents(agent):
+    """ Every LlmAgent of the graph, agents wrapped in an AgentTool included. """
+    if isinstance(agent, LlmAgent):
+        yield agent
+        for tool in agent.tools:
+            if isinstance(tool, AgentTool):
+                yield from _llm_agents(tool.agent)
+    for sub_agent in agent.sub_agents:
+        yield from _llm_agents(sub_agent)
+
+
+def warm_model_clients() -> int:
+    """
+    Create the API client of every Gemini model up front (about 40 ms each), so the
+    first request does not pay for it. Skipped when no credentials are configured.
+    """
+    warmed = 0
+    for agent in _llm_agents(Base):
+        model = agent.model
+        if isinstance(model, Gemini):
+            try:
+                model.api_client
+            except ValueError as e:
+                logging.warning(f"Model clients not prewarmed: {e}")
+                break
+            warmed += 1
+    return warmed
+
+
+async def start(prewarm):
+    """ Create the runner, start the job workers and warm the caches; `prewarm` records each phase. """
+    global runner
+    runner = await create_runner(
+        agent=Base,
+        app_name=APP_NAME,
+        session_service=session_service,
+        logging=logging,
+        # Routing first, so the metrics see the model that actually serves each call
+        plugins=[routing_plugin, metrics_plugin]
+    )
+    logging.info("Runner initialized successfully")
+    prewarm.mark("runner")
+
+    await job_queue.start()
+    prewarm.mark("jobs")
+
+    # Client construction and the template library read are blocking: keep them off the event loop
+    await asyncio.to_thread(warm_model_clients)
+    await asyncio.to_thread(get_template_library)
+    prewarm.mark("warm")
+
+
+async def stop():
+    await job_queue.stop()
+    if hasattr(session_service, "close"):
+        session_service.close()
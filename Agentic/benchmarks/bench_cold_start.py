@@ -0,0 +1,155 @@
+# bench_cold_start.py
+"""
+Cold-start benchmark: how long a fresh server process takes to become ready.
+
+Each run starts `uvicorn main:app` in a new process with throwaway session,
+job and template storage, then polls it until `/` answers (live: the port is
+open) and until `/ready` returns 200 (ready: agent graph and runner built).
+It also times the first request that needs the runner (/cache/stats), which
+with STARTUP_PREWARM=0 (--lazy) is where the build happens instead.
+
+Run from the Agentic folder:
+    python -m benchmarks.bench_cold_start --runs 5 --max-ready-seconds 6
+
+With --max-ready-seconds the script exits with status 1 when the median
+time to ready is above it, so it can guard cold starts in CI. Results are
+printed and written as JSON to benchmarks/results/ (or --output).
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+AGENTIC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+POLL_INTERVAL = 0.02
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time from process start to a ready server.")
+    parser.add_argument("--runs", type=int, default=3, help="Server processes to start, one after another.")
+    parser.add_argument("--lazy", action="store_true", help="Run with STARTUP_PREWARM=0 (build on the first request).")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for one server to become ready.")
+    parser.add_argument("--max-ready-seconds", type=float, help="Fail when the median time to ready is above this.")
+    parser.add_argument("--output", help="JSON result path (default: benchmarks/results/cold-start-<timestamp>.json).")
+    return parser.parse_args(argv)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_environment(args: argparse.Namespace, work_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "APP_NAME": env.get("APP_NAME") or "pagegenie_bench",
+        "SESSION_BACKEND": "memory",
+        "JOB_STORE": "memory",
+        "TEMPLATE_LIBRARY_PATH": os.path.join(work_dir, "template_library.json"),
+        "RESPONSE_CACHE_DIR": "",
+        "WEB_SEARCH_CACHE_DIR": "",
+        "STARTUP_PREWARM": "0" if args.lazy else "1"
+    })
+    env.pop("TRACE_DIR", None)
+    return env
+
+
+def wait_for(client: httpx.Client, url: str, started: float, deadline: float, status: int = 200) -> float:
+    """ Seconds from `started` until GET url returns `status`. """
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == status:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError(f"{url} did not return {status} in time")
+
+
+def cold_start(args: argparse.Namespace) -> Dict[str, Any]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="pagegenie_cold_") as work_dir:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=AGENTIC_DIR, env=server_environment(args, work_dir),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = started + args.timeout
+        try:
+            with httpx.Client(base_url=base_url, timeout=args.timeout) as client:
+                live = wait_for(client, "/", started, deadline)
+                ready = wait_for(client, "/ready", started, deadline)
+                request_started = time.perf_counter()
+                client.get("/cache/stats").raise_for_status()
+                first_request = time.perf_counter() - request_started
+                status = client.get("/ready").json()
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "live_seconds": live,
+        "ready_seconds": ready,
+        "first_request_seconds": first_request,
+        "phases": status.get("seconds"),
+        "import_seconds": status.get("imports", {}).get("total_seconds"),
+        "slowest_imports": status.get("imports", {}).get("slowest", [])[:5]
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    runs = [cold_start(args) for _ in range(args.runs)]
+
+    def median(key: str) -> float:
+        return statistics.median(run[key] for run in runs)
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "runs": runs,
+        "median": {key: median(key) for key in ("live_seconds", "ready_seconds", "first_request_seconds")}
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"cold-start-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+
+    medians = result["median"]
+    print(
+        f"{args.runs} cold starts ({'lazy' if args.lazy else 'prewarm'}) | median live {medians['live_seconds']:.2f}s "
+        f"ready {medians['ready_seconds']:.2f}s first request {medians['first_request_seconds'] * 1000:.0f}ms"
+    )
+    print(f"Results written to {output}")
+
+    if args.max_ready_seconds is not None and medians["ready_seconds"] > args.max_ready_seconds:
+        print(f"FAIL: median time to ready {medians['ready_seconds']:.2f}s is above {args.max_ready_seconds:.2f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# bench_pipeline.py
+"""
+Offline throughput benchmark of the /agent/query pipeline.
+
+Every model (Base, Requirement_gatherer, Web_info, Section_Planner, Creator,
+Determiner) is replaced by a FakeLlm, so no Gemini or Google Search quota is
+used. N simulated users talk to the app in-process at the same time; each one
+opens sessions seeded with gathered requirements and runs a two-turn
+conversation: the first turn plans the page, the second builds it.
+
+Run from the Agentic folder:
+    python -m benchmarks.bench_pipeline --users 20 --sessions 2 --latency 0.05
+
+Results (p50/p95/p99 latency, requests/sec, peak RSS) are printed and written
+as JSON to benchmarks/results/ (or --output) so runs can be compared.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIXTURE_PROBLEM_CONFIG = {
+    "Page Title": "Bloom & Brew Coffee House",
+    "Main Content": "Specialty coffee shop with a seasonal menu, events and online ordering.",
+    "Page Structure": "Header, hero, menu, events, testimonials, contact and footer.",
+    "Navigation Menu": "Home, Menu, Events, Contact",
+    "Primary Media": "Hero photo of the coffee bar",
+    "Meta Description": "Bloom & Brew serves specialty coffee and pastries in the heart of town.",
+    "Keywords": "coffee, cafe, espresso, pastries",
+    "Footer Content": "Opening hours, address and social links"
+}
+FIXTURE_SECTION_PLAN = {
+    "Header": "Logo and the navigation menu.",
+    "Hero": "Headline, tagline and the hero photo with an order button.",
+    "Menu": "Seasonal drinks and pastries with prices.",
+    "Events": "Upcoming tastings and live music nights.",
+    "Testimonials": "Three short customer quotes.",
+    "Contact": "Address, map link and a contact form.",
+    "Footer": "Opening hours, address and social links."
+}
+CONVERSATION = (
+    "Build my coffee shop landing page with the details you already have.",
+    "The section plan looks good, build the page."
+)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline /agent/query throughput benchmark with fake models.")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users.")
+    parser.add_argument("--sessions", type=int, default=1, help="Conversations each user runs, one after another.")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured conversations before the run.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every fake model call takes.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency per call, up to this many seconds.")
+    parser.add_argument("--output-bytes", type=int, default=2000, help="Size of each generated section.")
+    parser.add_argument("--build-mode", choices=("loop", "parallel"), default=os.getenv("BUILD_MODE", "loop"))
+    parser.add_argument("--session-backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--shared-config", action="store_true",
+                        help="Give every user the same problem_config so the response caches can hit.")
+    parser.add_argument("--templates", action="store_true",
+                        help="Start pages from the template library (seeds plus pages finished during the run).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON result path (default: benchmarks/results/pipeline-<timestamp>.json).")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace):
+    """ Settings the app reads at import time; must run before main is imported. """
+    os.environ["APP_NAME"] = os.getenv("APP_NAME") or "pagegenie_bench"
+    os.environ["BUILD_MODE"] = args.build_mode
+    os.environ["SESSION_BACKEND"] = args.session_backend
+    # Benchmark sessions and learned templates go to a throwaway directory, never the app's own
+    bench_dir = tempfile.mkdtemp(prefix="pagegenie_bench_")
+    os.environ["SESSION_DB_PATH"] = os.path.join(bench_dir, "sessions.db")
+    os.environ["TEMPLATE_LIBRARY_ENABLED"] = "1" if args.templates else "0"
+    os.environ["TEMPLATE_LIBRARY_PATH"] = os.path.join(bench_dir, "template_library.json")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "1" if args.shared_config else "0"
+    # Keep the benchmark from reading or growing an on-disk response or search cache
+    os.environ["RESPONSE_CACHE_DIR"] = ""
+    os.environ["WEB_SEARCH_CACHE_DIR"] = ""
+    os.environ.pop("TRACE_DIR", None)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """ Nearest-rank percentile. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def model_calls_by_stage() -> Dict[str, float]:
+    from utils.metrics import MODEL_CALLS
+    return {
+        sample.labels["stage"]: sample.value
+        for metric in MODEL_CALLS.collect() for sample in metric.samples if sample.name.endswith("_total")
+    }
+
+
+def web_searches_by_result() -> Dict[str, float]:
+    from utils.metrics import WEB_SEARCHES
+    return {
+        sample.labels["result"]: sample.value
+        for metric in WEB_SEARCHES.collect() for sample in metric.samples if sample.name.endswith("_total")
+    }
+
+
+async def seed_session(server, user_id: str, session_id: str, user_index: int, shared_config: bool):
+    """ Create the session with the requirements already gathered, as after Requirement_gatherer. """
+    from utils import build_initial_state
+
+    state = build_initial_state()
+    state["problem_config"].update(FIXTURE_PROBLEM_CONFIG)
+    if not shared_config:
+        state["problem_config"]["Page Title"] = f"{FIXTURE_PROBLEM_CONFIG['Page Title']} #{user_index}"
+    await server.session_service.create_session(
+        app_name=server.APP_NAME, user_id=user_id, session_id=session_id, state=state
+    )
+
+
+async def run_conversation(client, server, user_index: int, args: argparse.Namespace, samples: Optional[list]):
+    user_id = f"bench_user_{user_index}"
+    session_id = uuid.uuid4().hex
+    await seed_session(server, user_id, session_id, user_index, args.shared_config)
+
+    for turn, prompt in enumerate(CONVERSATION):
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                "/agent/query", json={"prompt": prompt, "user_id": user_id, "session_id": session_id}
+            )
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        if samples is not None:
+            samples.append({"turn": turn, "status": status, "latency": time.perf_counter() - started})
+
+    if samples is not None:
+        session = await server.session_service.get_session(
+            app_name=server.APP_NAME, user_id=user_id, session_id=session_id
+        )
+        samples.append({"turn": "page", "bytes": len((session.state.get("generated_code") or "") if session else "")})
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    from benchmarks.fake_llm import install_fake_models
+
+    app = importlib.import_module("main").app
+    # The agent graph main builds at startup; imported here first so the fakes are in place before it runs
+    server = importlib.import_module("app_runtime")
+    logging.getLogger("orion_logs").setLevel(logging.WARNING)
+    agents = install_fake_models(
+        server.Base, FIXTURE_SECTION_PLAN,
+        latency=args.latency, jitter=args.jitter, output_bytes=args.output_bytes, seed=args.seed
+    )
+
+    samples: List[Dict[str, Any]] = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for index in range(args.warmup):
+                await run_conversation(client, server, -1 - index, args, None)
+
+            calls_before = model_calls_by_stage()
+            searches_before = web_searches_by_result()
+            started = time.perf_counter()
+
+            async def user(index: int):
+                for _ in range(args.sessions):
+                    await run_conversation(client, server, index, args, samples)
+
+            await asyncio.gather(*(user(index) for index in range(args.users)))
+            elapsed = time.perf_counter() - started
+
+    requests = [sample for sample in samples if sample["turn"] != "page"]
+    pages = [sample["bytes"] for sample in samples if sample["turn"] == "page"]
+    latencies = [sample["latency"] for sample in requests if sample["status"] == 200]
+    calls = {stage: count - calls_before.get(stage, 0) for stage, count in model_calls_by_stage().items()}
+    searches = {result: count - searches_before.get(result, 0) for result, count in web_searches_by_result().items()}
+
+    def latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+        return {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "mean": sum(values) / len(values) if values else None,
+            "max": max(values) if values else None
+        }
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "fake_models": agents,
+        "requests": len(requests),
+        "errors": len(requests) - len(latencies),
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(requests) / elapsed if elapsed else None,
+        "latency_seconds": latency_summary(latencies),
+        "latency_seconds_by_turn": {
+            str(turn): latency_summary([s["latency"] for s in requests if s["turn"] == turn and s["status"] == 200])
+            for turn in range(len(CONVERSATION))
+        },
+        "pages_built": sum(1 for size in pages if size),
+        "mean_page_bytes": sum(pages) / len(pages) if pages else None,
+        "model_calls_by_stage": calls,
+        "web_searches": searches,
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    configure_environment(args)
+    result = asyncio.run(run(args))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"pipeline-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+
+    latency = result["latency_seconds"]
+    rss = result["peak_rss_bytes"]
+
+    def fmt(value):
+        return f"{value * 1000:.0f}ms" if value is not None else "n/a"
+
+    print(
+        f"{result['requests']} requests ({result['errors']} errors) in {result['elapsed_seconds']:.2f}s | "
+        f"{result['requests_per_second']:.1f} req/s | p50 {fmt(latency['p50'])} p95 {fmt(latency['p95'])} "
+        f"p99 {fmt(latency['p99'])} | peak RSS {f'{rss / 2**20:.0f} MiB' if rss else 'n/a'}"
+    )
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
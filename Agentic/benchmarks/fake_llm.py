@@ -0,0 +1,195 @@
+# fake_llm.py
+
+import asyncio
+import json
+import random
+import re
+from typing import AsyncGenerator, Dict, List, Optional
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.tools import AgentTool
+from google.genai import types
+from tools.web_search import SEARCH_MODELS
+from utils.page_document import TARGET_SLOT_PATTERN, section_slots
+
+# Instruction fragments the fake Creator keys off (see parallel_builder.py and {page_index})
+FRAGMENT_SLOT_PATTERN = re.compile(r"inside the '([\w-]+)' placeholder")
+HAS_DOCUMENT_PATTERN = re.compile(r"""["']has_document["']:\s*(?:True|true)""")
+EMPTY_SLOT_PATTERN = re.compile(r"""["']([\w-]+)["']:\s*["']empty["']""")
+# Section named by Determiner's {instruct}: "... inside its <!-- section:footer --> placeholder"
+INSTRUCT_SLOT_PATTERN = re.compile(r"inside its <!-- section:([\w-]+) -->")
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+# Every fake Web_info searches for the same topic, like users asking for similar pages
+SEARCH_QUERY = "Landing page design inspiration"
+
+
+def _text_response(text: str, llm_request: LlmRequest) -> LlmResponse:
+    return LlmResponse(
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+        usage_metadata=_usage(llm_request, text)
+    )
+
+
+def _call_response(name: str, args: dict, llm_request: LlmRequest) -> LlmResponse:
+    return LlmResponse(
+        content=types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))]),
+        usage_metadata=_usage(llm_request, json.dumps(args))
+    )
+
+
+def _usage(llm_request: LlmRequest, output: str) -> types.GenerateContentResponseUsageMetadata:
+    """ Rough token counts (4 characters per token) so the token metrics move like they would live. """
+    prompt = _instruction(llm_request) + "".join(
+        part.text or "" for content in llm_request.contents or [] for part in content.parts or []
+    )
+    return types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=len(prompt) // 4,
+        candidates_token_count=len(output) // 4,
+        total_token_count=(len(prompt) + len(output)) // 4
+    )
+
+
+def _instruction(llm_request: LlmRequest) -> str:
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    return instruction if isinstance(instruction, str) else ""
+
+
+def _answered_call(llm_request: LlmRequest) -> Optional[str]:
+    """ Name of the function whose response ends the request contents, if any. """
+    if not llm_request.contents:
+        return None
+    for part in llm_request.contents[-1].parts or []:
+        if part.function_response:
+            return part.function_response.name
+    return None
+
+
+def _has_own_reply(llm_request: LlmRequest) -> bool:
+    """ True when the agent already answered with text earlier in the conversation. """
+    return any(
+        content.role == "model" and any(part.text for part in content.parts or [])
+        for content in llm_request.contents or []
+    )
+
+
+class FakeLlm(BaseLlm):
+    """
+    Deterministic stand-in for Gemini used by the offline benchmark.
+
+    Each instance plays one agent (`role`) and replies the way that agent would:
+    Base calls web_info_tool then hands off to Section_Planner, Web_info calls
+    web_search once and returns its links, the search model returns grounded
+    results, Section_Planner
+    returns `section_plan` and on the next turn hands off to Webpage_Builder,
+    Creator writes the boilerplate or the next empty section, and Determiner
+    calls exit_loop. Every call sleeps `latency` seconds (plus up to `jitter`)
+    and section fragments are padded to `output_bytes`.
+    """
+
+    role: str
+    section_plan: Dict[str, str]
+    latency: float = 0.05
+    jitter: float = 0.0
+    output_bytes: int = 2000
+    seed: int = 0
+
+    def model_post_init(self, __context):
+        self._random = random.Random(f"{self.seed}:{self.role}")
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"gemini-fake-.*"]
+
+    def _slots(self) -> List[str]:
+        return list(section_slots(self.section_plan).values())
+
+    def _section(self, slug: str) -> str:
+        body = (FILLER * (self.output_bytes // len(FILLER) + 1))[:self.output_bytes]
+        return f"<section id=\"{slug}\" style=\"padding: 24px;\">\n<h2>{slug}</h2>\n<p>{body}</p>\n</section>"
+
+    def _boilerplate(self, slots: List[str]) -> str:
+        placeholders = "\n".join(f"<!-- section:{slug} --><!-- /section:{slug} -->" for slug in slots)
+        return (
+            "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<title>Benchmark Page</title>\n"
+            "<meta name=\"description\" content=\"Benchmark page\">\n<meta name=\"keywords\" content=\"benchmark\">\n"
+            f"</head>\n<body style=\"margin: 0;\">\n{placeholders}\n<script></script>\n</body>\n</html>"
+        )
+
+    def _reply(self, llm_request: LlmRequest) -> LlmResponse:
+        instruction = _instruction(llm_request)
+        answered = _answered_call(llm_request)
+
+        if self.role == "Base_agent":
+            # web_info_tool is an AgentTool, exposed to the model under the wrapped agent's name
+            if answered == "Web_info":
+                return _call_response("transfer_to_agent", {"agent_name": "Section_Planner"}, llm_request)
+            return _call_response("Web_info", {"request": "Collect references for the page."}, llm_request)
+
+        if self.role == "Web_info":
+            if answered != "web_search":
+                return _call_response("web_search", {"query": SEARCH_QUERY}, llm_request)
+            links = [f"https://example.com/reference/{index}" for index in range(5)]
+            return _text_response(json.dumps({
+                "design_inspiration": links[:2], "color_palettes": links[2:3],
+                "component_examples": links[3:4], "external_links": links[4:]
+            }), llm_request)
+
+        if self.role == "web_search":
+            response = _text_response("- Example result", llm_request)
+            response.grounding_metadata = types.GroundingMetadata(grounding_chunks=[
+                types.GroundingChunk(web=types.GroundingChunkWeb(uri=f"https://example.com/reference/{index}", title=f"Reference {index}"))
+                for index in range(5)
+            ])
+            return response
+
+        if self.role == "Section_Planner":
+            # The plan was given on the previous turn; the user approved it
+            if _has_own_reply(llm_request):
+                return _call_response("transfer_to_agent", {"agent_name": "Webpage_Builder"}, llm_request)
+            return _text_response(json.dumps(self.section_plan), llm_request)
+
+        if self.role == "Determiner":
+            if answered == "exit_loop":
+                return _text_response("The page is complete.", llm_request)
+            return _call_response("exit_loop", {}, llm_request)
+
+        if self.role == "Creator":
+            fragment = FRAGMENT_SLOT_PATTERN.search(instruction)
+            if fragment:
+                return _text_response(self._section(fragment.group(1)), llm_request)
+            if HAS_DOCUMENT_PATTERN.search(instruction):
+                target = INSTRUCT_SLOT_PATTERN.search(instruction)
+                empty = EMPTY_SLOT_PATTERN.findall(instruction)
+                slug = target.group(1) if target else empty[0] if empty else self._slots()[0]
+                return _text_response(f"<!-- section:{slug} -->\n{self._section(slug)}\n<!-- /section:{slug} -->", llm_request)
+            slots = TARGET_SLOT_PATTERN.findall(instruction) or self._slots()
+            return _text_response(self._boilerplate(slots), llm_request)
+
+        return _text_response("OK", llm_request)
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+        yield self._reply(llm_request)
+
+
+def install_fake_models(root: BaseAgent, section_plan: Dict[str, str], **settings) -> List[str]:
+    """
+    Replace the model of every LlmAgent under `root` (agents wrapped in an
+    AgentTool included) and the web_search model with a FakeLlm playing that
+    agent. Returns the agent names.
+    """
+    replaced = []
+    SEARCH_MODELS["default"] = FakeLlm(model="gemini-fake-web_search", role="web_search", section_plan=section_plan, **settings)
+
+    def visit(agent: BaseAgent):
+        if isinstance(agent, LlmAgent):
+            agent.model = FakeLlm(model=f"gemini-fake-{agent.name}", role=agent.name, section_plan=section_plan, **settings)
+            replaced.append(agent.name)
+            for tool in agent.tools:
+                if isinstance(tool, AgentTool):
+                    visit(tool.agent)
+        for sub_agent in agent.sub_agents:
+            visit(sub_agent)
+
+    visit(root)
+    return replaced
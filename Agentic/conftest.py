@@ -0,0 +1,2 @@
+# Puts Agentic/ on sys.path for pytest, so tests import utils/tools/agents the way main.py does.
+# Run from this directory: python -m pytest tests
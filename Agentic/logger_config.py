@@ -1,6 +1,10 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
 
 # Optional: Use colorlog for colored console output
 try:
@@ -12,18 +16,90 @@ except ImportError:
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# Background threads writing the queued records, stopped (and flushed) at exit
+_LISTENERS = []
+
+
+class PayloadFilter(logging.Filter):
+    """
+    Keep large payloads out of the log pipeline.
+
+    String arguments and messages longer than `max_chars` are cut down before
+    the record is formatted, and records logged with extra={"sampled": True}
+    (one per agent event) are only kept with probability `sample_rate`.
+    """
+
+    def __init__(self, max_chars: int = 2000, sample_rate: float = 1.0):
+        super().__init__()
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+
+    def _truncate(self, value):
+        if isinstance(value, str) and self.max_chars and len(value) > self.max_chars:
+            return f"{value[:self.max_chars]}... [+{len(value) - self.max_chars} chars]"
+        return value
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        record.msg = self._truncate(record.msg)
+        if isinstance(record.args, tuple):
+            record.args = tuple(self._truncate(arg) for arg in record.args)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line, for log shippers. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _stop_listeners():
+    while _LISTENERS:
+        _LISTENERS.pop().stop()
+
+
+atexit.register(_stop_listeners)
+
+
 def setup_logger(name: str) -> logging.Logger:
+    """
+    Build the app logger.
+
+    Settings (read from the environment):
+        LOG_ASYNC=1          handlers run on a background thread behind a queue (default)
+        LOG_FORMAT=text|json structured JSON lines instead of text
+        LOG_MAX_CHARS=2000   longest message/argument kept, 0 for no limit
+        LOG_EVENT_SAMPLE_RATE=1.0 share of per-event agent logs that are kept
+    """
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)  # Set lowest level to capture all logs
 
+    # Avoid duplicate handlers
+    if logger.handlers:
+        return logger
+
+    json_format = os.getenv("LOG_FORMAT", "text").lower() == "json"
+
     # Formatter for file logs
-    file_formatter = logging.Formatter(
+    file_formatter = JsonFormatter() if json_format else logging.Formatter(
         '%(asctime)s | %(name)s | %(levelname)s | %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
 
     # Formatter for console logs (colored if available)
-    if COLORLOG_AVAILABLE:
+    if json_format:
+        console_formatter = JsonFormatter()
+    elif COLORLOG_AVAILABLE:
         console_formatter = ColoredFormatter(
             "%(log_color)s%(levelname)-8s%(reset)s | %(white)s%(message)s",
             log_colors={
@@ -49,9 +125,24 @@ def setup_logger(name: str) -> logging.Logger:
     console_handler.setFormatter(console_formatter)
     console_handler.setLevel(logging.INFO)
 
-    # Avoid duplicate handlers
-    if not logger.handlers:
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+    payload_filter = PayloadFilter(
+        max_chars=int(os.getenv("LOG_MAX_CHARS", 2000)),
+        sample_rate=float(os.getenv("LOG_EVENT_SAMPLE_RATE", 1.0))
+    )
+
+    if os.getenv("LOG_ASYNC", "1") == "0":
+        for handler in (file_handler, console_handler):
+            handler.addFilter(payload_filter)
+            logger.addHandler(handler)
+        return logger
+
+    # The event loop only enqueues records; disk and console writes happen on the listener thread
+    queue = SimpleQueue()
+    queue_handler = QueueHandler(queue)
+    queue_handler.addFilter(payload_filter)
+    listener = QueueListener(queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    _LISTENERS.append(listener)
+    logger.addHandler(queue_handler)
 
-    return logger
\ No newline at end of file
+    return logger
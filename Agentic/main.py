@@ -1,111 +1,70 @@
 # Import necessary libraries
+# The import profiler goes first, so the startup report covers everything imported after it
+import startup
+startup.PROFILER.install()
+
+import asyncio
+import importlib
 import os
-import regex
-import sys
+import uuid
 import json
-import base64
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Generator
+from typing import Optional
 from dotenv import load_dotenv
 from logger_config import setup_logger
-from utils import call_agent_query_async, create_session, retrieve_session, create_runner
-from google.adk.sessions import InMemorySessionService
-
-# Importing the agents
-from agents import Base
 
-# Load the .env file
+# Load the .env file (before the agents, which read their settings at import time)
 load_dotenv()
 
 # Default User
 APP_NAME = os.getenv("APP_NAME")
-USER_ID = "user_1"
-SESSION_ID = "session_001"
+DEFAULT_USER_ID = "user_1"
 
 # Configure logging
 logging = setup_logger("orion_logs")
 
-# Session configuration
-session_service_memory = InMemorySessionService()
+# ------------------ Agent graph and runner ------------------
+# google.adk, the agents, the session service, the runner and the job workers live in
+# app_runtime. It is built in the background once the server is up (STARTUP_PREWARM=0:
+# on the first request instead), so the port opens without waiting for it; /ready tells
+# when it is done.
+async def build_runtime(prewarm: startup.Prewarm):
+    # Importing is blocking: do it on a thread so the event loop keeps answering
+    runtime = await asyncio.to_thread(importlib.import_module, "app_runtime")
+    prewarm.mark("import")
+    await runtime.start(prewarm)
+
+    startup.PROFILER.uninstall()
+    slowest = ", ".join(f"{entry['module']} {entry['cumulative_ms']:.0f}ms" for entry in startup.PROFILER.report(5))
+    logging.info(f"Imports took {startup.PROFILER.total_seconds:.2f}s; slowest: {slowest}")
+    return runtime
 
-session_service = session_service_memory
+prewarm = startup.Prewarm(build_runtime, logging)
 
-# ------------------ Global runner ------------------
-runner = None
+async def get_runtime():
+    """ The built app_runtime module, waiting for (or starting) the startup build. """
+    try:
+        return await prewarm.get()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Service is not available: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # ------------------ Initialize session and runner ------------------
-    global runner
-    session = await retrieve_session(
-        session_service=session_service,
-        app_name=APP_NAME,
-        user_id=USER_ID,
-        session_id=SESSION_ID,
-        logging=logging
-    )
-
-    if not session:
-        session = await create_session(
-            session_service=session_service,
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=SESSION_ID,
-            logging=logging,
-            state={
-                "details":  {
-                    "Page Purpose": None,
-                    "Content": None,
-                    "Layout & Styling": None, 
-                    "Images": None, 
-                    "External Resources": None, 
-                    "Simple Interactivity": None
-                },
-                "problem_config":   {    
-                    #Mandatory keys 
-                    "Page Title": None, 
-                    "Main Content": None, 
-                    "Page Structure": None, 
-                    "Navigation Menu": None, 
-                    "Primary Media": None,
-
-                    #Optional keys 
-                    "Meta Description": None, 
-                    "Keywords": None, 
-                    "Favicon": None, 
-                    "Secondary Content": None, 
-                    "Footer Content": None,
-                    "External Scripts": None,
-                    "Custom Fonts": None, 
-                    "Accessibility Attributes": None, 
-                    "Social Sharing Metadata": None, 
-                    "Forms": None, 
-                    "Animations / Effects": None
-                },
-                "web_info_output": None,
-                "section_plan": {},
-                "generated_code": None,
-                "instruct": None
-        }
-    )
-
-    runner = await create_runner(
-        agent=Base,
-        app_name=APP_NAME,
-        session_service=session_service,
-        logging=logging
-    )
-
-    logging.info("Session and runner initialized successfully")
+    if os.getenv("STARTUP_PREWARM", "1") != "0":
+        prewarm.start()
 
     try:
         yield  # the app runs here
     finally:
         # Optional: cleanup if needed
         logging.info("Lifespan ending, cleaning up resources...")
+        await prewarm.stop()
+        if prewarm.ready:
+            await (await prewarm.get()).stop()
 
 # Server configuration
 app = FastAPI(lifespan=lifespan)
@@ -125,31 +84,259 @@ app.add_middleware(
 ###################################################################################
 # Importing routes
 
-# Home Route
+# Home Route (liveness: answers as soon as the server is up)
 @app.get("/")
 async def root():
     return {"message": f"Server is running at port: {os.getenv("PORT", 8000)}!"}
 
+# Readiness: 200 once the agent graph and runner are built, 503 before (or if the build failed).
+# With STARTUP_PREWARM=0 the build waits for the first request, so the server counts as ready.
+@app.get("/ready")
+async def ready():
+    status = prewarm.status()
+    lazy = os.getenv("STARTUP_PREWARM", "1") == "0"
+    is_ready = prewarm.ready or (lazy and status["phase"] == startup.PENDING)
+    status["imports"] = {
+        "total_seconds": round(startup.PROFILER.total_seconds, 3),
+        "slowest": startup.PROFILER.report(int(os.getenv("STARTUP_IMPORT_REPORT", 15)))
+    }
+    return JSONResponse(status_code=200 if is_ready else 503, content=status)
+
+# Prometheus metrics: per-stage latency, time to first event, tokens, tool calls, loop iterations
+@app.get("/metrics")
+async def metrics():
+    runtime = await get_runtime()
+    body, content_type = runtime.metrics_payload()
+    return Response(content=body, media_type=content_type)
+
+# Hit/miss counters of the Section_Planner and Web_info response caches and the template library,
+# plus the state of the model/search rate limiters and of the Idempotency-Key store
+@app.get("/cache/stats")
+async def cache_stats():
+    runtime = await get_runtime()
+    return {
+        "caches": runtime.response_cache_stats(),
+        "templates": runtime.template_library_stats(),
+        "rate_limits": runtime.rate_limiter_stats(),
+        "idempotency": runtime.idempotency.stats()
+    }
+
     # Request body model
 class PromptRequest(BaseModel):
     prompt: str
+    user_id: str = Field(default=DEFAULT_USER_ID, min_length=1, max_length=128)
+    session_id: Optional[str] = Field(default=None, min_length=1, max_length=128)
+
+
+def check_idempotency_key(runtime, idempotency_key: Optional[str]):
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= runtime.MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {runtime.MAX_KEY_LENGTH} characters")
+
+def query_fingerprint(runtime, request: PromptRequest) -> str:
+    # The requested session, not the one assigned: a retried first turn must join the first run
+    return runtime.request_fingerprint(prompt=request.prompt, session_id=request.session_id)
 
 
+# With an Idempotency-Key header, a retried or double-submitted query does not start a second
+# agent run: it waits for the one in flight, or gets its stored result (Idempotent-Replayed: true).
 @app.post("/agent/query")
-async def agent_query(request: PromptRequest):
+async def agent_query(request: PromptRequest, idempotency_key: Optional[str] = Header(default=None)):
+    # New clients get a fresh session id which they send back on later turns
+    session_id = request.session_id or uuid.uuid4().hex
+    runtime = await get_runtime()
+    check_idempotency_key(runtime, idempotency_key)
+
+    async def run_query():
+        async with runtime.session_manager.lock(request.user_id, session_id):
+            await runtime.session_manager.ensure_session(request.user_id, session_id)
+            response = await runtime.call_agent_query_async(
+                query=request.prompt,
+                runner=runtime.runner,
+                user_id=request.user_id,
+                session_id=session_id,
+                logging=logging
+            )
+        return {
+            "status": "success",
+            "response": response,
+            "user_id": request.user_id,
+            "session_id": session_id
+        }
+
     try:
-        response = await call_agent_query_async(
-            query=request.prompt,
-            runner=runner,
-            user_id=USER_ID,
-            session_id=SESSION_ID,
-            logging=logging
-        )       
-        return {"status": "success", "response": response}
+        if idempotency_key is None:
+            return await run_query()
+        result, outcome = await runtime.idempotency.run(
+            request.user_id, idempotency_key, query_fingerprint(runtime, request), run_query
+        )
+        return JSONResponse(content=result, headers={
+            "Idempotency-Key": idempotency_key,
+            "Idempotent-Replayed": "false" if outcome == runtime.NEW else "true"
+        })
+    except runtime.IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except runtime.QuotaExceededError as e:
+        # Provider quota or our own rate limit: the client should come back later, not treat it as a crash
+        logging.warning(f"Agent query rate limited: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logging.error(f"Agent query failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def format_sse(payload: dict) -> str:
+    """ Serialize a payload as one Server-Sent Events frame. """
+    return f"data: {json.dumps(payload, default=str)}\n\n"
+
+
+@app.post("/agent/query/stream")
+async def agent_query_stream(request: PromptRequest, idempotency_key: Optional[str] = Header(default=None)):
+    # Same contract as /agent/query, but every agent event is forwarded as an SSE frame.
+    # A duplicate of a query with the same Idempotency-Key gets only the run's final frame (replayed: true).
+    session_id = request.session_id or uuid.uuid4().hex
+    runtime = await get_runtime()
+    check_idempotency_key(runtime, idempotency_key)
+
+    async def event_stream():
+        outcome = None
+        if idempotency_key is not None:
+            try:
+                outcome, shared = runtime.idempotency.claim(request.user_id, idempotency_key, query_fingerprint(runtime, request))
+            except runtime.IdempotencyConflictError as e:
+                yield format_sse({"type": "error", "status": 422, "detail": str(e)})
+                return
+            if outcome != runtime.NEW:
+                try:
+                    result = await asyncio.shield(shared)
+                except Exception as e:
+                    yield format_sse({"type": "error", "detail": str(e)})
+                    return
+                yield format_sse({"type": "session", "user_id": result["user_id"], "session_id": result["session_id"]})
+                yield format_sse({"type": "final", "response": result["response"], "replayed": True})
+                return
+
+        # Send the session first so the client gets its first byte before the agents start
+        yield format_sse({"type": "session", "user_id": request.user_id, "session_id": session_id})
+        error: BaseException = RuntimeError("The original request with this Idempotency-Key ended without a response")
+        try:
+            async with runtime.session_manager.lock(request.user_id, session_id):
+                await runtime.session_manager.ensure_session(request.user_id, session_id)
+                async for payload in runtime.stream_agent_query_async(
+                    query=request.prompt,
+                    runner=runtime.runner,
+                    user_id=request.user_id,
+                    session_id=session_id,
+                    logging=logging
+                ):
+                    if outcome == runtime.NEW and payload.get("type") == "final":
+                        runtime.idempotency.complete(request.user_id, idempotency_key, {
+                            "status": "success",
+                            "response": payload["response"],
+                            "user_id": request.user_id,
+                            "session_id": session_id
+                        })
+                    yield format_sse(payload)
+        except runtime.QuotaExceededError as e:
+            error = e
+            logging.warning(f"Agent stream rate limited: {e}")
+            yield format_sse({"type": "error", "status": 429, "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            error = e
+            logging.error(f"Agent stream failed: {e}")
+            yield format_sse({"type": "error", "detail": str(e)})
+        finally:
+            # Failed or disconnected before the final frame: let the duplicates fail and a retry run again
+            if outcome == runtime.NEW:
+                runtime.idempotency.release(request.user_id, idempotency_key, error)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ------------------ Page artifact ------------------
+# The session's latest page as an HTML document: compressed (br/gzip), with an ETag so
+# clients revalidate with If-None-Match and get 304 while the page is unchanged.
+# Sessions are looked up under user_id, so other users' pages are not found.
+# optimize=true hoists repeated inline styles and minifies it; without the parameter
+# ARTIFACT_OPTIMIZE=1 turns that on (off by default). It is opt-in because hoisting
+# cannot see rules in linked stylesheets: an id rule there may outrank a hoisted style.
+@app.get("/sessions/{session_id}/page")
+async def session_page(
+    session_id: str,
+    user_id: str = DEFAULT_USER_ID,
+    optimize: Optional[bool] = None,
+    accept_encoding: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    runtime = await get_runtime()
+    session = await runtime.session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+    html = session.state.get("generated_code") if session else None
+    if not html:
+        raise HTTPException(status_code=404, detail="No page has been generated for this session")
+
+    if optimize is None:
+        optimize = os.getenv("ARTIFACT_OPTIMIZE", "0") == "1"
+    status, body, headers = runtime.render_artifact(html, accept_encoding, if_none_match, optimize)
+    if status == 304:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
+
+# ------------------ Background jobs ------------------
+# Submit returns at once; poll the status/result routes instead of holding the connection open.
+# A job is only visible to the user_id that submitted it (pass it as a query parameter).
+# Until there is authentication, user_id is asserted by the client, not verified.
+@app.post("/jobs", status_code=202)
+async def submit_job(request: PromptRequest):
+    session_id = request.session_id or uuid.uuid4().hex
+    runtime = await get_runtime()
+    try:
+        job = await runtime.job_queue.submit(request.user_id, session_id, request.prompt)
+    except runtime.QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return {
+        "status": job.status,
+        "job_id": job.job_id,
+        "user_id": job.user_id,
+        "session_id": job.session_id
+    }
+
+@app.get("/jobs/stats")
+async def job_stats():
+    runtime = await get_runtime()
+    return runtime.job_queue.stats()
+
+async def get_user_job(runtime, job_id: str, user_id: str):
+    """ The job, or 404 when it does not exist or was submitted by another user. """
+    job = await runtime.job_queue.get(job_id)
+    # Same answer for both, so job ids of other users cannot be probed
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, user_id: str = DEFAULT_USER_ID):
+    runtime = await get_runtime()
+    job = await get_user_job(runtime, job_id, user_id)
+    return job.to_dict(include_result=False)
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, user_id: str = DEFAULT_USER_ID):
+    runtime = await get_runtime()
+    job = await get_user_job(runtime, job_id, user_id)
+    if job.status == runtime.FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != runtime.SUCCEEDED:
+        # Not done yet: 202 with the current status
+        return JSONResponse(status_code=202, content=job.to_dict(include_result=False))
+    return {
+        "status": "success",
+        "response": job.response,
+        "user_id": job.user_id,
+        "session_id": job.session_id,
+        "job_id": job.job_id
+    }
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
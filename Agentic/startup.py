@@ -0,0 +1,177 @@
+import asyncio
+import importlib
+import importlib.abc
+import logging
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Only the standard library here: this module is imported first, to time everything else
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """ Wraps a module's loader to time its execution (nested imports included). """
+
+    def __init__(self, loader, profiler: "ImportProfiler"):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profiler._enter(module.__name__)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler._leave(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    In-process equivalent of `python -X importtime`.
+
+    While installed, every module imported for the first time is timed: `self`
+    is the time spent in its own body, `cumulative` includes the imports it
+    triggered. report() returns the slowest modules, so the startup log shows
+    where a cold start goes without restarting the process with -X importtime.
+    """
+
+    def __init__(self):
+        # module -> [self seconds, cumulative seconds]
+        self.timings: Dict[str, List[float]] = {}
+        # Time spent in top-level imports, i.e. not counting an import twice when another triggered it
+        self.total_seconds = 0.0
+        self._stack = threading.local()
+        self._finding = threading.local()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        # Ask the other finders, without coming back here
+        if getattr(self._finding, "active", False):
+            return None
+        self._finding.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.active = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def _enter(self, name: str):
+        stack = self._stack.__dict__.setdefault("frames", [])
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def _leave(self, name: str):
+        stack = self._stack.frames
+        _, started, children = stack.pop()
+        elapsed = time.perf_counter() - started
+        self.timings[name] = [elapsed - children, elapsed]
+        if stack:
+            stack[-1][2] += elapsed
+        else:
+            self.total_seconds += elapsed
+
+    def report(self, limit: int = 15) -> List[Dict[str, Any]]:
+        """ The `limit` slowest imports by cumulative time, in milliseconds. """
+        slowest = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [
+            {"module": name, "self_ms": round(own * 1000, 1), "cumulative_ms": round(cumulative * 1000, 1)}
+            for name, (own, cumulative) in slowest
+        ]
+
+
+# Started as the first import of main.py
+PROFILER = ImportProfiler()
+
+# Readiness phases
+PENDING, BUILDING, READY, FAILED = "pending", "building", "ready", "failed"
+
+
+class Prewarm:
+    """
+    Build the expensive part of the app once, in the background or on first use.
+
+    `build` is an async callable returning the built object (for the app, the
+    app_runtime module with its runner started). start() launches it without
+    waiting, so the server can accept connections (and answer liveness checks)
+    while it runs; get() waits for it, starting it if nobody did. The time of
+    each phase reported through mark() is kept for the /ready route.
+    """
+
+    def __init__(self, build: Callable[["Prewarm"], Awaitable[Any]], logging: logging.Logger):
+        self.build = build
+        self.logging = logging
+        self.phase = PENDING
+        self.error: Optional[str] = None
+        self.seconds: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._started: Optional[float] = None
+        self._last_mark: Optional[float] = None
+
+    def start(self) -> asyncio.Task:
+        """ Launch the build, or launch it again after it failed. """
+        if self._task is None or self.phase == FAILED:
+            self.error = None
+            self._started = self._last_mark = time.perf_counter()
+            self.phase = BUILDING
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def _run(self) -> Any:
+        try:
+            built = await self.build(self)
+        except Exception as e:
+            self.phase, self.error = FAILED, str(e)
+            self.logging.error(f"Startup failed after {time.perf_counter() - self._started:.2f}s: {e}")
+            raise
+        self.seconds["total"] = round(time.perf_counter() - self._started, 3)
+        self.phase = READY
+        self.logging.info(f"Ready in {self.seconds['total']:.2f}s ({self.seconds})")
+        return built
+
+    def mark(self, phase: str):
+        """ Record the time since the previous mark as `phase`. """
+        now = time.perf_counter()
+        self.seconds[phase] = round(now - self._last_mark, 3)
+        self._last_mark = now
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == READY
+
+    async def get(self) -> Any:
+        return await asyncio.shield(self.start())
+
+    async def stop(self):
+        """ Cancel a build still running at shutdown. """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def status(self) -> Dict[str, Any]:
+        status = {"ready": self.ready, "phase": self.phase, "seconds": dict(self.seconds)}
+        if self.error:
+            status["error"] = self.error
+        if self._started is not None and not self.ready:
+            status["elapsed"] = round(time.perf_counter() - self._started, 3)
+        return status
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+import pytest
+from utils.job_queue import (
+    FAILED, QUEUED, RUNNING, SUCCEEDED, InMemoryJobStore, Job, JobQueue, QueueFullError, SqliteJobStore
+)
+
+logger = logging.getLogger("test_job_queue")
+
+
+def make_job(user_id: str = "user_1", prompt: str = "Build a page") -> Job:
+    return Job(job_id=f"{user_id}-{prompt}-{time.time_ns()}", user_id=user_id, session_id="session", prompt=prompt)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """ Two stores on one database file, as two worker processes would open it. """
+    db_path = str(tmp_path / "jobs.db")
+    first, second = SqliteJobStore(db_path), SqliteJobStore(db_path)
+    yield first, second
+    first.close()
+    second.close()
+
+
+async def wait_for_status(store, job_id: str, status: str, timeout: float = 5) -> Job:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = await store.get(job_id)
+        if job is not None and job.status == status:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"Job {job_id} never reached status '{status}'")
+
+
+def test_only_one_store_claims_a_job(stores):
+    first, second = stores
+
+    async def scenario():
+        job = make_job()
+        await first.save(job)
+        lease = time.time() + 60
+        claims = await asyncio.gather(
+            first.claim(await first.get(job.job_id), "worker-a", lease),
+            second.claim(await second.get(job.job_id), "worker-b", lease)
+        )
+        return claims, await first.get(job.job_id)
+
+    claims, stored = asyncio.run(scenario())
+    assert sorted(claims) == [False, True]
+    assert stored.status == RUNNING
+    assert stored.owner == ("worker-a" if claims[0] else "worker-b")
+
+
+def test_expired_lease_is_requeued_and_late_result_discarded(stores):
+    first, second = stores
+
+    async def scenario():
+        job = make_job()
+        await first.save(job)
+        assert await first.claim(job, "worker-a", time.time() - 1)
+
+        # worker-a stopped renewing: the other process takes the job over
+        assert await second.requeue_expired(time.time()) == 1
+        taken = await second.get(job.job_id)
+        assert taken.status == QUEUED and taken.owner is None
+        assert await second.claim(taken, "worker-b", time.time() + 60)
+
+        # worker-a finishing late must not overwrite worker-b's run
+        job.status, job.response, job.finished_at = SUCCEEDED, "late", time.time()
+        assert not await first.finish(job, "worker-a")
+        stored = await first.get(job.job_id)
+        assert stored.status == RUNNING and stored.owner == "worker-b" and stored.response is None
+
+        taken.status, taken.response, taken.finished_at = SUCCEEDED, "page", time.time()
+        assert await second.finish(taken, "worker-b")
+        return await first.get(job.job_id)
+
+    finished = asyncio.run(scenario())
+    assert finished.status == SUCCEEDED and finished.response == "page" and finished.owner is None
+
+
+def test_renewed_lease_is_not_requeued(stores):
+    first, second = stores
+
+    async def scenario():
+        job = make_job()
+        await first.save(job)
+        assert await first.claim(job, "worker-a", time.time() + 0.05)
+        await first.renew([job.job_id], "worker-a", time.time() + 60)
+        await asyncio.sleep(0.1)
+        return await second.requeue_expired(time.time()), await second.get(job.job_id)
+
+    requeued, stored = asyncio.run(scenario())
+    assert requeued == 0
+    assert stored.status == RUNNING and stored.owner == "worker-a"
+
+
+def test_queue_runs_jobs_of_a_stopped_worker(stores):
+    first, second = stores
+
+    async def handler(job: Job) -> str:
+        return f"done: {job.prompt}"
+
+    async def scenario():
+        orphan, live = make_job(prompt="orphan"), make_job(prompt="live")
+        for job in (orphan, live):
+            await first.save(job)
+        # orphan's process died long ago; live is held by a process still renewing its lease
+        assert await first.claim(orphan, "dead-worker", time.time() - 1)
+        assert await first.claim(live, "live-worker", time.time() + 60)
+
+        queue = JobQueue(second, handler, logger, workers=1, lease_seconds=0.3)
+        await queue.start()
+        try:
+            recovered = await wait_for_status(second, orphan.job_id, SUCCEEDED)
+            untouched = await second.get(live.job_id)
+        finally:
+            await queue.stop()
+        return recovered, untouched
+
+    recovered, untouched = asyncio.run(scenario())
+    assert recovered.response == "done: orphan"
+    assert untouched.status == RUNNING and untouched.owner == "live-worker"
+
+
+def test_workers_take_users_round_robin():
+    order = []
+
+    async def handler(job: Job) -> str:
+        order.append(job.prompt)
+        return job.prompt
+
+    async def scenario():
+        store = InMemoryJobStore()
+        queue = JobQueue(store, handler, logger, workers=1)
+        submitted = [
+            await queue.submit(user_id, "session", prompt)
+            for user_id, prompt in (("alice", "a1"), ("alice", "a2"), ("alice", "a3"), ("bob", "b1"), ("carol", "c1"))
+        ]
+        await queue.start()
+        try:
+            for job in submitted:
+                await wait_for_status(store, job.job_id, SUCCEEDED)
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_failed_handler_marks_job_failed():
+    async def handler(job: Job) -> str:
+        raise RuntimeError("model unavailable")
+
+    async def scenario():
+        store = InMemoryJobStore()
+        queue = JobQueue(store, handler, logger, workers=1)
+        job = await queue.submit("alice", "session", "prompt")
+        await queue.start()
+        try:
+            return await wait_for_status(store, job.job_id, FAILED)
+        finally:
+            await queue.stop()
+
+    failed = asyncio.run(scenario())
+    assert failed.error == "model unavailable"
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def handler(job: Job) -> str:
+        return ""
+
+    async def scenario():
+        # Not started: submitted jobs stay queued
+        queue = JobQueue(InMemoryJobStore(), handler, logger, workers=2, max_queued=2, max_per_user=5)
+        await queue.submit("alice", "session", "one")
+        await queue.submit("bob", "session", "two")
+        with pytest.raises(QueueFullError) as full:
+            await queue.submit("carol", "session", "three")
+        return full.value, queue
+
+    error, queue = asyncio.run(scenario())
+    # Average job duration (30s to start with) times the jobs ahead, shared by the workers
+    assert error.retry_after == 45
+    assert queue.stats()["queued"] == 2
+
+
+def test_user_limit_rejects_with_retry_after():
+    async def handler(job: Job) -> str:
+        return ""
+
+    async def scenario():
+        queue = JobQueue(InMemoryJobStore(), handler, logger, workers=1, max_queued=10, max_per_user=1)
+        await queue.submit("alice", "session", "one")
+        with pytest.raises(QueueFullError) as limited:
+            await queue.submit("alice", "session", "two")
+        # Other users still get in
+        await queue.submit("bob", "session", "three")
+        return limited.value
+
+    error = asyncio.run(scenario())
+    assert "alice" in str(error)
+    assert error.retry_after == 60
@@ -1,2 +1,5 @@
-from .problem_state_manager import update_problem_config_tool
-from .exit_loop import exit_loop
\ No newline at end of file
+from .problem_state_manager import update_problem_config_tool, update_problem_config_batch_tool
+from .exit_loop import exit_loop
+from .html_validator import validate_generated_code
+from .requirement_extractor import prefill_requirements
+from .web_search import web_search
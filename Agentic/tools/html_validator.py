@@ -0,0 +1,153 @@
+# html_validator_tool.py
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+from google.adk.tools.tool_context import ToolContext
+from utils.page_document import list_slots, parse_section_plan, section_slots
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr"
+}
+# Elements whose closing tag HTML allows to be omitted
+OPTIONAL_END_TAGS = {
+    "p", "li", "dt", "dd", "tr", "td", "th", "thead", "tbody", "tfoot",
+    "option", "optgroup", "colgroup", "caption", "rt", "rp"
+}
+REQUIRED_ELEMENTS = ("html", "head", "title", "body")
+
+
+class _PageParser(HTMLParser):
+    """ Single streaming pass over the document collecting everything the checks need. """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.findings: List[Dict[str, Any]] = []
+        self.stack: List[tuple] = []
+        self.seen = set()
+        self.doctype = False
+        self.content_before_doctype = False
+        self.body_children: List[str] = []
+        self.meta_names = set()
+
+    def add(self, severity: str, code: str, message: str, line: Optional[int] = None):
+        self.findings.append({"severity": severity, "code": code, "message": message, "line": line})
+
+    def handle_decl(self, decl):
+        if decl.lower().replace(" ", "") == "doctypehtml":
+            self.doctype = True
+
+    def handle_starttag(self, tag, attrs):
+        line = self.getpos()[0]
+        if not self.doctype:
+            self.content_before_doctype = True
+        self.seen.add(tag)
+        attributes = dict(attrs)
+
+        if self.stack and self.stack[-1][0] == "body":
+            self.body_children.append(tag)
+        if tag == "img" and not (attributes.get("alt") or "").strip():
+            self.add("error", "img-alt", f"<img src='{attributes.get('src', '')}'> has no alt text.", line)
+        if tag == "meta" and attributes.get("name"):
+            self.meta_names.add(attributes["name"].lower())
+
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, line))
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/> is complete on its own
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS and self.stack and self.stack[-1][0] == tag:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        line = self.getpos()[0]
+        if tag in VOID_ELEMENTS:
+            return
+        open_tags = [name for name, _ in self.stack]
+        if tag not in open_tags:
+            self.add("error", "unexpected-close", f"</{tag}> has no matching opening tag.", line)
+            return
+        # Close implicitly-ended elements; anything else left open is an error
+        while self.stack and self.stack[-1][0] != tag:
+            name, opened_at = self.stack.pop()
+            if name not in OPTIONAL_END_TAGS:
+                self.add("error", "unclosed-tag", f"<{name}> opened on line {opened_at} is not closed before </{tag}>.", opened_at)
+        self.stack.pop()
+
+    def close(self):
+        super().close()
+        for name, opened_at in self.stack:
+            if name not in OPTIONAL_END_TAGS:
+                self.add("error", "unclosed-tag", f"<{name}> opened on line {opened_at} is never closed.", opened_at)
+
+
+def validate_html(html: Optional[str], section_plan: Any = None) -> Dict[str, Any]:
+    """
+    Check a generated page without calling a model.
+
+    Verifies the DOCTYPE, the required elements, balanced tags, alt text on
+    images, a <script> block at the end of <body>, and one placeholder per
+    {section_plan} entry. Returns the findings plus which sections are still empty.
+    """
+    plan = parse_section_plan(section_plan)
+    slots = section_slots(plan)
+
+    if not html or not html.strip():
+        return {
+            "valid": False,
+            "errors": 1,
+            "warnings": 0,
+            "findings": [{"severity": "error", "code": "empty", "message": "generated_code is empty.", "line": None}],
+            "pending_sections": list(plan),
+            "filled_sections": []
+        }
+
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+
+    if not parser.doctype:
+        parser.add("error", "doctype", "Missing <!DOCTYPE html> declaration.", 1)
+    elif parser.content_before_doctype:
+        parser.add("error", "doctype", "<!DOCTYPE html> must come before any element.", 1)
+    for element in REQUIRED_ELEMENTS:
+        if element not in parser.seen:
+            parser.add("error", "missing-element", f"Missing <{element}> element.")
+    if not parser.body_children or parser.body_children[-1] != "script":
+        parser.add("error", "script-position", "The last element of <body> must be the main <script> block.")
+    for name in ("description", "keywords"):
+        if name not in parser.meta_names:
+            parser.add("warning", "meta", f"Missing <meta name='{name}'>.")
+
+    present = list_slots(html)
+    pending, filled = [], []
+    for name, slug in slots.items():
+        if slug not in present:
+            parser.add("error", "missing-placeholder", f"No <!-- section:{slug} --> placeholder for section '{name}'.")
+            pending.append(name)
+        elif not present[slug]:
+            pending.append(name)
+        else:
+            filled.append(name)
+
+    errors = sum(1 for finding in parser.findings if finding["severity"] == "error")
+    return {
+        "valid": errors == 0,
+        "errors": errors,
+        "warnings": len(parser.findings) - errors,
+        "findings": parser.findings,
+        "pending_sections": pending,
+        "filled_sections": filled
+    }
+
+
+def validate_generated_code(tool_context: ToolContext):
+    """
+    Call this tool to run the deterministic HTML checks on {generated_code}.
+    Returns structured findings (DOCTYPE, balanced tags, final <script>, image alt text,
+    section placeholders) and the sections that are still empty.
+    """
+    report = validate_html(tool_context.state.get("generated_code"), tool_context.state.get("section_plan"))
+    tool_context.state["validation_report"] = report
+    return report
@@ -1,5 +1,7 @@
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 from google.adk.tools import ToolContext
+from pydantic import BaseModel, Field, ValidationError
+from utils.page_dependencies import describe_regeneration, plan_regeneration
 
 # Define which fields are expected to be lists
 LIST_FIELDS = {
@@ -9,6 +11,61 @@ LIST_FIELDS = {
     "interactive_elements"     # multiple interactive components
 }
 
+def _normalize(key: str, value: Any) -> Tuple[Optional[Any], Optional[str]]:
+    """ Coerce a value to the type its field expects. Returns (value, error). """
+    if key in LIST_FIELDS:
+        if isinstance(value, str):
+            return [v.strip() for v in value.split(",") if v.strip()], None
+        if not isinstance(value, list):
+            return None, f"Invalid type for '{key}': expected list or comma-separated string."
+        return value, None
+    return str(value), None
+
+def apply_config_updates(state, updates: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Write several problem_config/details keys to the session state at once.
+
+    Returns {"changed": {key: new value}, "unchanged": [keys], "errors": {key: message},
+    "regeneration": {...} or None}. Each touched dict is written back to the state once,
+    so the update costs a single state delta per dict. When a page already exists, the
+    regions built from the changed keys are queued for regeneration.
+    """
+    problem_config = dict(state.get("problem_config") or {})
+    details = dict(state.get("details") or {})
+    changed, unchanged, errors, previous = {}, [], {}, {}
+    touched = set()
+
+    for key, value in updates.items():
+        if key in problem_config:
+            target, name = problem_config, "problem_config"
+        elif key in details:
+            target, name = details, "details"
+        else:
+            errors[key] = f"Key '{key}' is not a valid problem_config or details field."
+            continue
+
+        value, error = _normalize(key, value)
+        if error:
+            errors[key] = error
+            continue
+
+        if target.get(key) == value:
+            unchanged.append(key)
+            continue
+        previous[key] = target.get(key)
+        target[key] = value
+        changed[key] = value
+        touched.add(name)
+
+    # Save back to state
+    if "problem_config" in touched:
+        state["problem_config"] = problem_config
+    if "details" in touched:
+        state["details"] = details
+
+    regeneration = plan_regeneration(state, previous) if previous else None
+    return {"changed": changed, "unchanged": unchanged, "errors": errors, "regeneration": regeneration}
+
 def update_problem_config_tool(
     key: str,
     value: Any,
@@ -16,56 +73,50 @@ def update_problem_config_tool(
 ) -> Dict[str, Any]:
     """
     Updates the session's problem_config or details state with a new value for the given key.
-    Returns a plain dict instead of the raw State object to avoid serialization errors.
+    Returns only the change, not the whole configuration, to keep the conversation small.
+    To set several keys, use update_problem_config_batch_tool instead.
     """
-    # Determine target dict
-    target_dict = None
-    if "problem_config" in tool_context.state and key in tool_context.state["problem_config"]:
-        target_dict = tool_context.state["problem_config"]
-    elif "details" in tool_context.state and key in tool_context.state["details"]:
-        target_dict = tool_context.state["details"]
-    else:
-        return {
-            "status": "error",
-            "message": f"Key '{key}' is not a valid problem_config or details field.",
-            "updated_config": {
-                "problem_config": dict(tool_context.state.get("problem_config", {})),
-                "details": dict(tool_context.state.get("details", {}))
-            }
-        }
-
-    previous_value = target_dict.get(key)
-
-    # Type validation
-    if key in LIST_FIELDS:
-        if isinstance(value, str):
-            value = [v.strip() for v in value.split(",") if v.strip()]
-        elif not isinstance(value, list):
-            return {
-                "status": "error",
-                "message": f"Invalid type for '{key}': expected list or comma-separated string.",
-                "updated_config": {
-                    "problem_config": dict(tool_context.state.get("problem_config", {})),
-                    "details": dict(tool_context.state.get("details", {}))
-                }
-            }
-    else:
-        value = str(value)
-
-    # Update the target dict
-    target_dict[key] = value
+    result = apply_config_updates(tool_context.state, {key: value})
 
-    # Save back to state
-    if target_dict is tool_context.state.get("problem_config"):
-        tool_context.state["problem_config"] = target_dict
-    else:
-        tool_context.state["details"] = target_dict
-
-    return {
-        "status": "success",
-        "message": f"Updated '{key}' from '{previous_value}' to '{value}'",
-        "updated_config": {
-            "problem_config": dict(tool_context.state.get("problem_config", {})),
-            "details": dict(tool_context.state.get("details", {}))
-        }
+    if key in result["errors"]:
+        return {"status": "error", "message": result["errors"][key]}
+    if key in result["changed"]:
+        response = {"status": "success", "changed": result["changed"]}
+        if result["regeneration"]:
+            response["next_step"] = describe_regeneration(result["regeneration"])
+        return response
+    return {"status": "success", "message": f"'{key}' already had this value.", "changed": {}}
+
+class ConfigUpdate(BaseModel):
+    """ One key of a batch update. A model rather than a dict, so the tool schema declares its properties. """
+
+    key: str = Field(description="problem_config or details field name, e.g. 'Page Title'")
+    value: str = Field(description="New value; comma-separated for list fields")
+
+
+def update_problem_config_batch_tool(
+    updates: List[ConfigUpdate],
+    tool_context: ToolContext
+) -> Dict[str, Any]:
+    """
+    Updates several problem_config or details keys in one call.
+    `updates` is a list of {"key": ..., "value": ...} items, e.g.
+    [{"key": "Page Title", "value": "..."}, {"key": "Keywords", "value": "..."}].
+    Returns only the keys whose value changed, plus any keys that could not be set.
+    """
+    # The model's arguments arrive as plain dicts
+    try:
+        items = [ConfigUpdate.model_validate(item) for item in updates or []]
+    except ValidationError:
+        return {"status": "error", "message": "Each update must be an object with a 'key' and a 'value'."}
+    result = apply_config_updates(tool_context.state, {item.key: item.value for item in items})
+
+    response: Dict[str, Union[str, Dict[str, Any]]] = {
+        "status": "error" if result["errors"] and not (result["changed"] or result["unchanged"]) else "success",
+        "changed": result["changed"]
     }
+    if result["errors"]:
+        response["errors"] = result["errors"]
+    if result["regeneration"]:
+        response["next_step"] = describe_regeneration(result["regeneration"])
+    return response
@@ -0,0 +1,124 @@
+# requirement_extractor.py
+import re
+from typing import Any, Dict, List, Optional
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+from .problem_state_manager import apply_config_updates
+
+# Only explicit cues count: a quoted name, or a "title:" label
+TITLE_PATTERNS = (
+    # titled "Bloom & Brew", called 'Bloom & Brew', the title should be "Bloom & Brew"
+    re.compile(r"""\b(?:titled|called|named|title\s*(?:is|should be|=))\s+["“'‘]([^"”'’\n]{2,80})["”'’]""", re.IGNORECASE),
+    # title: Bloom & Brew
+    re.compile(r"""\btitle\s*:\s*["“'‘]?([^"”'’\n.;,]{2,80})""", re.IGNORECASE),
+)
+URL_PATTERN = re.compile(r"https?://[^\s<>\"'()\[\]]+")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".avif")
+HEX_COLOR_PATTERN = re.compile(r"(?<![\w&])#(?:[0-9a-fA-F]{6}|[0-9a-fA-F]{3})\b")
+COLOR_WORDS = (
+    "red", "orange", "yellow", "green", "blue", "purple", "violet", "pink", "brown", "black", "white",
+    "gray", "grey", "navy", "teal", "cyan", "magenta", "maroon", "olive", "lime", "indigo", "gold",
+    "silver", "beige", "coral", "turquoise", "lavender", "mint", "peach", "cream", "burgundy", "charcoal"
+)
+COLOR_PATTERN = re.compile(r"\b(" + "|".join(COLOR_WORDS) + r")\b", re.IGNORECASE)
+# Color words only count after an explicit cue ("colors: ...", "a palette of ...", "color scheme ..."),
+# up to the end of that sentence: "the White House" or "orange juice" name no colors
+COLOR_CUE_PATTERN = re.compile(r"\b(?:colou?rs?\s*:|colou?r\s+scheme|palette)([^.;\n]*)", re.IGNORECASE)
+# "sections: about, services and contact" / "with sections like hero, menu, events"
+SECTION_LIST_PATTERN = re.compile(
+    r"\bsections\b\s*(?:like|such as|for|including|:|-)\s*([^.;\n]+)", re.IGNORECASE
+)
+SECTION_NAMES = (
+    "header", "navbar", "hero", "banner", "about us", "about", "services", "features", "products",
+    "gallery", "projects", "testimonials", "reviews", "pricing", "team", "faq",
+    "events", "contact", "footer"
+)
+SECTION_NAME_PATTERN = re.compile(r"\b(" + "|".join(SECTION_NAMES) + r")\b", re.IGNORECASE)
+
+
+def _unique(items: List[str]) -> List[str]:
+    seen, result = set(), []
+    for item in items:
+        if item.lower() not in seen:
+            seen.add(item.lower())
+            result.append(item)
+    return result
+
+
+def _extract_title(text: str) -> Optional[str]:
+    for pattern in TITLE_PATTERNS:
+        match = pattern.search(text)
+        if match and match.group(1).strip():
+            return match.group(1).strip()
+    return None
+
+
+def _extract_sections(text: str) -> List[str]:
+    match = SECTION_LIST_PATTERN.search(text)
+    if match:
+        items = [item.strip(" '\"") for item in re.split(r",|/|&|\band\b", match.group(1))]
+        items = [item for item in items if item and len(item.split()) <= 3]
+        if len(items) >= 2:
+            return _unique([item[0].upper() + item[1:] for item in items])
+    # No explicit list: fall back to well-known section names, if the prompt names several
+    names = _unique([name.title() for name in SECTION_NAME_PATTERN.findall(text)])
+    return names if len(names) >= 3 else []
+
+
+def extract_requirements(text: str) -> Dict[str, Any]:
+    """
+    Pull the obvious requirement values out of a user message without a model:
+    an explicitly cued page title and colors, a list of sections and URLs
+    (images vs. other references). Returns {field name: value} for
+    problem_config/details fields; fields with nothing found are left out.
+    """
+    if not text or not text.strip():
+        return {}
+    found: Dict[str, Any] = {}
+
+    title = _extract_title(text)
+    if title:
+        found["Page Title"] = title
+
+    cued = " ".join(match.group(1) for match in COLOR_CUE_PATTERN.finditer(text))
+    colors = _unique([color.lower() for color in COLOR_PATTERN.findall(cued)] + HEX_COLOR_PATTERN.findall(cued))
+    if colors:
+        found["Layout & Styling"] = f"Colors: {', '.join(colors)}"
+
+    sections = _extract_sections(text)
+    if sections:
+        found["Page Structure"] = ", ".join(sections)
+
+    urls = _unique([url.rstrip(".,!?") for url in URL_PATTERN.findall(text)])
+    images = [url for url in urls if url.lower().split("?")[0].endswith(IMAGE_EXTENSIONS)]
+    links = [url for url in urls if url not in images]
+    if images:
+        found["Images"] = ", ".join(images)
+        found["Primary Media"] = images[0]
+    if links:
+        found["External Resources"] = ", ".join(links)
+
+    return found
+
+
+def prefill_requirements(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    before_agent_callback for Requirement_gatherer: fill empty {details}/{problem_config}
+    fields that can be read straight off the user message, so the model does not spend
+    tool calls setting them. The model is told to confirm these values and may overwrite
+    them; values already set are never overwritten here.
+    """
+    user_content = callback_context.user_content
+    if not user_content or not user_content.parts:
+        return None
+    text = "\n".join(part.text for part in user_content.parts if part.text)
+
+    problem_config = callback_context.state.get("problem_config") or {}
+    details = callback_context.state.get("details") or {}
+    updates = {
+        key: value for key, value in extract_requirements(text).items()
+        if (key in problem_config and not problem_config[key]) or (key in details and not details[key])
+    }
+    if updates:
+        apply_config_updates(callback_context.state, updates)
+    return None
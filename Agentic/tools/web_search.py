@@ -0,0 +1,116 @@
+# web_search_tool.py
+import asyncio
+import os
+import re
+import unicodedata
+from typing import Any, Dict
+from google.adk.models import BaseLlm, LlmRequest, LLMRegistry
+from google.genai import errors, types
+from utils.metrics import WEB_SEARCHES
+from utils.model_routing import model_for
+from utils.rate_limiter import QuotaExceededError
+from utils.response_cache import RESPONSE_CACHES, ResponseCache, canonical_key
+
+QUERY_NOISE_PATTERN = re.compile(r"[^\w\s#+&.-]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+MAX_RESULTS = 5
+
+# Searches being run right now, by cache key: identical queries wait for the same one
+_IN_FLIGHT: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+# The model running the grounded searches, created on first use (the benchmark installs a fake one here)
+SEARCH_MODELS: Dict[str, BaseLlm] = {}
+
+
+def normalize_query(query: str) -> str:
+    """ Case, punctuation and spacing do not change what a search returns: 'Coffee  shop, Design!' -> 'coffee shop design'. """
+    query = unicodedata.normalize("NFKC", str(query or "")).lower()
+    query = QUERY_NOISE_PATTERN.sub(" ", query)
+    return WHITESPACE_PATTERN.sub(" ", query).strip(" .-")
+
+
+def get_search_cache() -> ResponseCache:
+    """ Search results shared by every session, kept on disk in WEB_SEARCH_CACHE_DIR for WEB_SEARCH_CACHE_TTL seconds. """
+    if "web_search" not in RESPONSE_CACHES:
+        RESPONSE_CACHES["web_search"] = ResponseCache(
+            name="web_search",
+            max_entries=int(os.getenv("WEB_SEARCH_CACHE_SIZE", 512)),
+            ttl=float(os.getenv("WEB_SEARCH_CACHE_TTL", 86400)),
+            disk_dir=os.getenv("WEB_SEARCH_CACHE_DIR", os.path.join("data", "search_cache")) or None
+        )
+    return RESPONSE_CACHES["web_search"]
+
+
+def get_search_model() -> BaseLlm:
+    """ The "web_search" stage model of model_routes.json. """
+    if "default" not in SEARCH_MODELS:
+        model = model_for("web_search")
+        SEARCH_MODELS["default"] = LLMRegistry.new_llm(model) if isinstance(model, str) else model
+    return SEARCH_MODELS["default"]
+
+
+async def _run_search(query: str) -> Dict[str, Any]:
+    """ One grounded google_search call: the model's summary plus the web sources it was grounded on. """
+    llm_request = LlmRequest(
+        model=get_search_model().model,
+        contents=[types.Content(role="user", parts=[types.Part(text=query)])],
+        config=types.GenerateContentConfig(
+            system_instruction="Search the web and summarize the most relevant results in at most five short bullet points.",
+            tools=[types.Tool(google_search=types.GoogleSearch())]
+        )
+    )
+    summary, results = [], []
+    async for response in get_search_model().generate_content_async(llm_request):
+        if response.partial:
+            continue
+        if response.content and response.content.parts:
+            summary.extend(part.text for part in response.content.parts if part.text)
+        for chunk in (response.grounding_metadata.grounding_chunks or []) if response.grounding_metadata else []:
+            if chunk.web and chunk.web.uri and len(results) < MAX_RESULTS:
+                results.append({"title": chunk.web.title, "url": chunk.web.uri})
+    return {"summary": "".join(summary).strip(), "results": results}
+
+
+async def _search_and_store(key: str, query: str) -> Dict[str, Any]:
+    found = await _run_search(query)
+    if os.getenv("WEB_SEARCH_CACHE_ENABLED", "1") != "0" and (found["summary"] or found["results"]):
+        await get_search_cache().set(key, found)
+    return found
+
+
+async def web_search(query: str) -> Dict[str, Any]:
+    """
+    Search the web with Google Search and return a short summary plus up to five result links.
+
+    Args:
+        query: The search query, e.g. "minimalist coffee shop landing page design".
+
+    Returns:
+        dict: {"status": "success", "query", "summary", "results": [{"title", "url"}], "cached"},
+        or {"status": "error", "message"} when the search could not be run.
+    """
+    normalized = normalize_query(query)
+    if not normalized:
+        return {"status": "error", "message": "The search query is empty."}
+
+    cache = get_search_cache()
+    key = canonical_key({"query": normalized})
+    if os.getenv("WEB_SEARCH_CACHE_ENABLED", "1") != "0":
+        cached = await cache.get(key)
+        if cached is not None:
+            WEB_SEARCHES.labels("hit").inc()
+            return {"status": "success", "query": normalized, **cached, "cached": True}
+
+    search = _IN_FLIGHT.get(key)
+    if search is not None:
+        WEB_SEARCHES.labels("coalesced").inc()
+    else:
+        WEB_SEARCHES.labels("miss").inc()
+        # A task of its own, so the search survives the cancellation of the caller that started it
+        search = _IN_FLIGHT[key] = asyncio.ensure_future(_search_and_store(key, normalized))
+        search.add_done_callback(lambda _: _IN_FLIGHT.pop(key, None))
+
+    try:
+        found = await asyncio.shield(search)
+    except (QuotaExceededError, errors.APIError) as e:
+        return {"status": "error", "message": f"Search failed: {e}"}
+    return {"status": "success", "query": normalized, **found, "cached": False}
@@ -1,2 +1,7 @@
 from .input_formatter import format_query
-from .agent_utils import call_agent_query_async, create_session, create_runner, retrieve_session
\ No newline at end of file
+from .agent_utils import call_agent_query_async, stream_agent_query_async, create_session, create_runner, retrieve_session
+from .state_template import build_initial_state
+from .session_manager import SessionManager
+from .session_store import SqliteSessionService, InMemorySessionStore, build_session_service
+from .context_compaction import ContextCompactor, build_context_compactor
+from .job_queue import JobQueue, QueueFullError, build_job_store
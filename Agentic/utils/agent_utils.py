@@ -1,6 +1,29 @@
 from .input_formatter import format_query
 from google.adk.runners import Runner
+from google.adk.events import Event
+from google.adk.plugins.base_plugin import BasePlugin
+from typing import Any, AsyncGenerator, Dict, List, Optional
 import logging
+from logging import INFO
+
+# State keys whose new values are forwarded to streaming clients as they change
+STREAMED_STATE_KEYS = ("generated_code",)
+
+def describe_event(event: Event) -> str:
+    """ One-line summary of an event for the logs: sizes and names instead of the full content. """
+    text_chars = sum(len(part.text) for part in event.content.parts if part.text) if event.content and event.content.parts else 0
+    summary = f"Author: {event.author}, Final: {event.is_final_response()}, Text: {text_chars} chars"
+    calls = [call.name for call in event.get_function_calls()]
+    if calls:
+        summary += f", Calls: {calls}"
+    responses = [response.name for response in event.get_function_responses()]
+    if responses:
+        summary += f", Responses: {responses}"
+    if event.actions and event.actions.state_delta:
+        summary += f", State: {list(event.actions.state_delta)}"
+    if event.actions and event.actions.escalate:
+        summary += ", Escalate: True"
+    return summary
 
 async def call_agent_query_async(query: str, runner: Runner, user_id: str, session_id: str, logging: logging.Logger) -> None:
     """
@@ -16,25 +39,86 @@ async def call_agent_query_async(query: str, runner: Runner, user_id: str, sessi
         str: The response from the agent.
     """
 
-    logging.info(f"\n>>> User Query: {query}")
+    logging.info("\n>>> User Query: %s", query)
 
     content = format_query(query)
 
     final_response_text = "Agent did not produce a final response."
     
     async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
-        logging.info(f"  [Event] Author: {event.author}, Type: {type(event).__name__}, Final: {event.is_final_response()}, Content: {event.content}")
+        if logging.isEnabledFor(INFO):
+            logging.info("  [Event] %s", describe_event(event), extra={"sampled": True})
 
+        # Sub-agents (Section_Planner, Creator, ...) finish with final responses of their own;
+        # keep consuming until the runner is done so the whole turn (and its plugins) completes.
         if event.is_final_response():
-            if event.content and event.content.parts:
+            if event.content and event.content.parts and event.content.parts[0].text:
                 final_response_text = event.content.parts[0].text
-            elif event.actions and event.actions.escalate: 
+            elif event.actions and event.actions.escalate:
                 final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
-            break
 
-    logging.info(f"\n<<< Agent Response: {final_response_text}")
+    logging.info("\n<<< Agent Response: %s", final_response_text)
     return final_response_text
 
+def event_to_payload(event: Event) -> Dict[str, Any]:
+    """ Convert an ADK event into a small JSON-serializable progress update for streaming clients. """
+    text = ""
+    if event.content and event.content.parts:
+        text = "".join(part.text for part in event.content.parts if part.text)
+
+    state_delta = event.actions.state_delta if event.actions else {}
+
+    return {
+        "type": "event",
+        "author": event.author,
+        "final": event.is_final_response(),
+        "partial": bool(event.partial),
+        "text": text,
+        "tool_calls": [
+            {"name": call.name, "args": call.args} for call in event.get_function_calls()
+        ],
+        "tool_responses": [
+            {"name": response.name} for response in event.get_function_responses()
+        ],
+        "state_delta": {key: state_delta[key] for key in STREAMED_STATE_KEYS if key in state_delta},
+        "state_keys": list(state_delta.keys())
+    }
+
+async def stream_agent_query_async(query: str, runner: Runner, user_id: str, session_id: str, logging: logging.Logger) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Call the agent asynchronously and yield a progress update for every event as soon as it arrives.
+
+    Args:
+        query (str): The user query to send to the agent.
+        runner (Runner): The runner instance that manages the agent.
+        user_id (str): The ID of the user making the request.
+        session_id (str): The ID of the session for this interaction.
+
+    Yields:
+        dict: One payload per agent event, followed by a final payload carrying the response text.
+    """
+
+    logging.info("\n>>> User Query (stream): %s", query)
+
+    content = format_query(query)
+
+    final_response_text = "Agent did not produce a final response."
+
+    async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
+        if logging.isEnabledFor(INFO):
+            logging.info("  [Event] %s", describe_event(event), extra={"sampled": True})
+
+        yield event_to_payload(event)
+
+        if event.is_final_response():
+            if event.content and event.content.parts and event.content.parts[0].text:
+                final_response_text = event.content.parts[0].text
+            elif event.actions and event.actions.escalate:
+                final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
+
+    logging.info("\n<<< Agent Response (stream): %s", final_response_text)
+    yield {"type": "final", "response": final_response_text}
+
 async def create_session(session_service, app_name: str, user_id: str, session_id: str, state: dict, logging: logging.Logger):
     """ Create a new session for the agent. """
     session = await session_service.create_session(
@@ -56,12 +140,13 @@ async def retrieve_session(session_service, app_name: str, user_id: str, session
     logging.info(f"Session retrieved: App='{app_name}', User='{user_id}', Session='{session_id}'")
     return session
 
-async def create_runner(agent, app_name: str, session_service, logging: logging.Logger) -> Runner:
+async def create_runner(agent, app_name: str, session_service, logging: logging.Logger, plugins: Optional[List[BasePlugin]] = None) -> Runner:
     """ Create a runner for the agent. """
     runner = Runner(
         agent=agent,
         app_name=app_name,
-        session_service=session_service
+        session_service=session_service,
+        plugins=plugins or None
     )
     logging.info(f"Runner created for agent '{runner.agent.name}'.")
     return runner
\ No newline at end of file
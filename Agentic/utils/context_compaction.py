@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.genai import types
+from .metrics import CONTEXT_COMPACTIONS, CONTEXT_TOKENS
+from .page_document import SLOT_PATTERN
+
+DOCUMENT_PATTERN = re.compile(r"<!DOCTYPE html.*?</html>|<html[\s>].*?</html>", re.DOTALL | re.IGNORECASE)
+HTML_FENCE_PATTERN = re.compile(r"```(?:html|HTML)\s*\n.*?```", re.DOTALL)
+PAGE_PLACEHOLDER = "[HTML page omitted; the latest version is in generated_code]"
+OMITTED_PATTERN = re.compile(r"\[(?:HTML page|section '[\w-]+' HTML) omitted[^\]]*\]")
+# State keys holding page revisions; only the newest event that wrote them keeps them
+PAGE_STATE_KEYS = ("generated_code", "page_index", "creator_output")
+SUMMARY_MARKER = "context_summary"
+SUMMARY_LINE_CHARS = 300
+SUMMARY_MAX_LINES = 40
+
+
+def event_text(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "\n".join(part.text for part in event.content.parts if part.text)
+
+
+def estimate_event_tokens(event: Event) -> int:
+    """ Rough token count of what an event adds to a prompt (4 characters per token). """
+    chars = len(event_text(event))
+    for call in event.get_function_calls():
+        chars += len(call.name or "") + len(json.dumps(call.args, default=str))
+    for response in event.get_function_responses():
+        chars += len(response.name or "") + len(json.dumps(response.response, default=str))
+    return chars // 4
+
+
+def estimate_tokens(events: List[Event]) -> int:
+    return sum(estimate_event_tokens(event) for event in events)
+
+
+def strip_page_html(text: str) -> str:
+    """ Replace whole pages and section blocks in a message with short placeholders. """
+    text = HTML_FENCE_PATTERN.sub(PAGE_PLACEHOLDER, text)
+    text = DOCUMENT_PATTERN.sub(PAGE_PLACEHOLDER, text)
+    return SLOT_PATTERN.sub(lambda match: f"[section '{match.group('slot')}' HTML omitted]", text)
+
+
+def _has_page(event: Event) -> bool:
+    text = event_text(event)
+    return bool(text) and strip_page_html(text) != text
+
+
+def _has_page_state(event: Event) -> bool:
+    return bool(event.actions and any(key in event.actions.state_delta for key in PAGE_STATE_KEYS))
+
+
+def _is_summary(event: Event) -> bool:
+    return bool(event.custom_metadata and event.custom_metadata.get(SUMMARY_MARKER))
+
+
+def _strip_event(event: Event, strip_text: bool, strip_state: bool) -> Event:
+    update = {}
+    if strip_text:
+        update["content"] = types.Content(
+            role=event.content.role,
+            parts=[types.Part(text=strip_page_html(part.text)) if part.text else part for part in event.content.parts]
+        )
+    if strip_state:
+        state_delta = {key: value for key, value in event.actions.state_delta.items() if key not in PAGE_STATE_KEYS}
+        update["actions"] = event.actions.model_copy(update={"state_delta": state_delta})
+    return event.model_copy(update=update)
+
+
+def _summary_event(events: List[Event]) -> Event:
+    """ One user-authored event standing in for the given (older) events. """
+    lines = []
+    for event in events:
+        if _is_summary(event):
+            lines.extend(event_text(event).splitlines()[1:])
+            continue
+        # Tool round-trips are dropped; their outcome lives in the session state
+        if event.partial or event.get_function_calls() or event.get_function_responses():
+            continue
+        text = " ".join(strip_page_html(event_text(event)).split())
+        # Messages that were nothing but HTML (Creator replies) add nothing to the summary
+        if not OMITTED_PATTERN.sub("", text).strip():
+            continue
+        if len(text) > SUMMARY_LINE_CHARS:
+            text = text[:SUMMARY_LINE_CHARS] + "..."
+        lines.append(f"- {'User' if event.author == 'user' else event.author}: {text}")
+
+    text = "Summary of the earlier conversation (older messages were compacted):\n" + "\n".join(lines[-SUMMARY_MAX_LINES:])
+    return Event(
+        invocation_id=events[-1].invocation_id,
+        author="user",
+        content=types.Content(role="user", parts=[types.Part(text=text)]),
+        timestamp=events[0].timestamp,
+        custom_metadata={SUMMARY_MARKER: True}
+    )
+
+
+def compact_events(events: List[Event], keep_turns: int = 2) -> List[Event]:
+    """
+    Compact a session history.
+
+    The last `keep_turns` user turns are kept as they are, except that only the
+    newest page revision keeps its HTML (in message text and in state deltas).
+    Everything older is folded into a single summary event.
+    """
+    turn_starts = [index for index, event in enumerate(events) if event.author == "user" and not _is_summary(event)]
+    if keep_turns <= 0:
+        cut = len(events)
+    elif len(turn_starts) > keep_turns:
+        cut = turn_starts[-keep_turns]
+    else:
+        cut = 0
+
+    latest_page = max((index for index, event in enumerate(events) if _has_page(event)), default=None)
+    latest_state = max((index for index, event in enumerate(events) if _has_page_state(event)), default=None)
+
+    compacted = [_summary_event(events[:cut])] if cut else []
+    for index in range(cut, len(events)):
+        event = events[index]
+        strip_text = index != latest_page and _has_page(event)
+        strip_state = index != latest_state and _has_page_state(event)
+        compacted.append(_strip_event(event, strip_text, strip_state) if strip_text or strip_state else event)
+    return compacted
+
+
+class ContextCompactor:
+    """
+    Keeps session histories under a token budget.
+
+    Once the estimated size of a session's events passes `token_budget`, the
+    history is rewritten by compact_events() and saved through the session
+    service's replace_events(). Token counts before and after are logged and
+    recorded as metrics.
+    """
+
+    def __init__(self, session_service, logging: logging.Logger, token_budget: int = 30000, keep_turns: int = 2):
+        self.session_service = session_service
+        self.logging = logging
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+
+    async def maybe_compact(self, session: Session) -> Optional[Dict[str, int]]:
+        """ Compact the session if it is over budget. Returns the before/after report, or None. """
+        if not hasattr(self.session_service, "replace_events"):
+            return None
+        tokens_before = estimate_tokens(session.events)
+        if tokens_before <= self.token_budget:
+            return None
+
+        events = compact_events(session.events, self.keep_turns)
+        tokens_after = estimate_tokens(events)
+        if tokens_after >= tokens_before:
+            return None
+
+        report = {
+            "events_before": len(session.events),
+            "events_after": len(events),
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after
+        }
+        await self.session_service.replace_events(session, events)
+
+        CONTEXT_COMPACTIONS.inc()
+        CONTEXT_TOKENS.labels("before").observe(tokens_before)
+        CONTEXT_TOKENS.labels("after").observe(tokens_after)
+        self.logging.info(
+            f"Compacted session '{session.id}': {report['events_before']} events / ~{tokens_before} tokens -> "
+            f"{report['events_after']} events / ~{tokens_after} tokens"
+        )
+        return report
+
+
+def build_context_compactor(session_service, logging: logging.Logger) -> Optional[ContextCompactor]:
+    """ Create the compactor from the CONTEXT_* settings; CONTEXT_COMPACTION=0 turns it off. """
+    if os.getenv("CONTEXT_COMPACTION", "1") == "0":
+        return None
+    return ContextCompactor(
+        session_service=session_service,
+        logging=logging,
+        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", 30000)),
+        keep_turns=int(os.getenv("CONTEXT_KEEP_TURNS", 2))
+    )
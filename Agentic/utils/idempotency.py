@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .metrics import IDEMPOTENT_REQUESTS
+
+# Outcomes of a request carrying an Idempotency-Key
+NEW, COALESCED, REPLAYED = "new", "coalesced", "replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflictError(Exception):
+    """ Raised when an Idempotency-Key is reused for a different request. """
+
+
+def request_fingerprint(**fields: Any) -> str:
+    """ Hash of what makes two requests the same request (the fields passed in). """
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    future: "asyncio.Future[Any]"
+    # None while the run is in flight
+    expires_at: Optional[float] = None
+
+
+class IdempotencyStore:
+    """
+    Runs each (user, Idempotency-Key) once.
+
+    The first request with a key runs; requests with the same key that arrive
+    while it is in flight wait for it and get the same result, and those arriving
+    after it finished get the stored result for `ttl` seconds. A failed or
+    abandoned run is forgotten, so a retry with the same key runs again. Reusing a
+    key with a different request body raises IdempotencyConflictError.
+    """
+
+    def __init__(self, logging: logging.Logger, ttl: float = 600, max_entries: int = 1000):
+        self.logging = logging
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._counts = {NEW: 0, COALESCED: 0, REPLAYED: 0, "conflict": 0}
+
+    def _purge(self):
+        now = time.monotonic()
+        for scope in [scope for scope, entry in self._entries.items() if entry.expires_at is not None and entry.expires_at <= now]:
+            del self._entries[scope]
+        # Over the limit, the oldest finished results go first; runs in flight are never dropped
+        finished = [scope for scope, entry in self._entries.items() if entry.expires_at is not None]
+        for scope in finished[:max(0, len(self._entries) - self.max_entries)]:
+            del self._entries[scope]
+
+    def _count(self, outcome: str):
+        self._counts[outcome] += 1
+        IDEMPOTENT_REQUESTS.labels(outcome).inc()
+
+    def claim(self, user_id: str, key: str, fingerprint: str) -> Tuple[str, "asyncio.Future[Any]"]:
+        """
+        (outcome, future) for a request. With NEW the caller runs the request and
+        reports it with complete() or release(); otherwise it awaits the future.
+        """
+        self._purge()
+        scope = (user_id, key)
+        entry = self._entries.get(scope)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self._count("conflict")
+                raise IdempotencyConflictError("This Idempotency-Key was already used for a different request")
+            outcome = COALESCED if entry.expires_at is None else REPLAYED
+            self._count(outcome)
+            self.logging.info(f"Idempotency-Key {key} of {user_id}: {outcome} request")
+            return outcome, entry.future
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting when a run fails: mark its exception as retrieved
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._entries[scope] = _Entry(fingerprint=fingerprint, future=future)
+        self._count(NEW)
+        return NEW, future
+
+    def complete(self, user_id: str, key: str, result: Any):
+        """ Share `result` with the waiting requests and keep it for replays. """
+        entry = self._entries.get((user_id, key))
+        if entry is None or entry.future.done():
+            return
+        entry.future.set_result(result)
+        entry.expires_at = time.monotonic() + self.ttl
+
+    def release(self, user_id: str, key: str, error: BaseException):
+        """ Fail the waiting requests with `error` and forget the key, so it can be retried. No-op once completed. """
+        entry = self._entries.get((user_id, key))
+        if entry is not None and not entry.future.done():
+            del self._entries[(user_id, key)]
+            if isinstance(error, asyncio.CancelledError):
+                # A future cannot hold a cancellation: the waiters get an error they can retry on
+                error = RuntimeError("The original request with this Idempotency-Key was cancelled; retry it")
+            entry.future.set_exception(error)
+
+    async def run(self, user_id: str, key: str, fingerprint: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        (result, outcome) of `call` run at most once per key. The run is a task of
+        its own, so it goes on (and serves the retries) if the first caller disconnects.
+        """
+        outcome, future = self.claim(user_id, key, fingerprint)
+        if outcome == NEW:
+            async def owner():
+                try:
+                    self.complete(user_id, key, await call())
+                except BaseException as e:
+                    self.release(user_id, key, e)
+                    raise
+
+            task = asyncio.create_task(owner())
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(future), outcome
+
+    def stats(self) -> Dict[str, Any]:
+        in_flight = sum(1 for entry in self._entries.values() if entry.expires_at is None)
+        return {"in_flight": in_flight, "stored": len(self._entries) - in_flight, "requests": dict(self._counts)}
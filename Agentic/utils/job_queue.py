@@ -0,0 +1,443 @@
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from .metrics import JOBS_FINISHED, JOBS_QUEUED, JOBS_REJECTED, JOBS_RUNNING
+from .session_store import SqliteConnectionPool
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    user_id     TEXT NOT NULL,
+    session_id  TEXT NOT NULL,
+    prompt      TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    response    TEXT,
+    error       TEXT,
+    owner       TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+JOB_COLUMNS = (
+    "job_id", "user_id", "session_id", "prompt", "status", "created_at", "started_at", "finished_at",
+    "response", "error", "owner", "lease_expires"
+)
+# Columns added after the first release, for databases created before them
+JOB_MIGRATIONS = {"owner": "TEXT", "lease_expires": "REAL"}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class QueueFullError(Exception):
+    """ Raised by JobQueue.submit when the queue, or the user's share of it, is full. """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    """ One queued agent query. """
+
+    job_id: str
+    user_id: str
+    session_id: str
+    prompt: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    response: Optional[str] = None
+    error: Optional[str] = None
+    # Worker process running the job, and until when its claim holds without a heartbeat
+    owner: Optional[str] = None
+    lease_expires: Optional[float] = None
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        job = asdict(self)
+        for internal in ("prompt", "owner", "lease_expires"):
+            job.pop(internal)
+        if not include_result:
+            job.pop("response")
+        return job
+
+
+class InMemoryJobStore:
+    """ Keeps jobs in process memory; queued jobs are lost on restart. """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+
+    async def save(self, job: Job):
+        self._jobs[job.job_id] = job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def claim(self, job: Job, owner: str, lease_expires: float) -> bool:
+        stored = self._jobs.get(job.job_id)
+        if stored is None or stored.status != QUEUED:
+            return False
+        stored.status, stored.started_at, stored.owner, stored.lease_expires = RUNNING, time.time(), owner, lease_expires
+        if stored is not job:
+            job.status, job.started_at, job.owner, job.lease_expires = RUNNING, stored.started_at, owner, lease_expires
+        return True
+
+    async def renew(self, job_ids: List[str], owner: str, lease_expires: float):
+        for job_id in job_ids:
+            job = self._jobs.get(job_id)
+            if job is not None and job.owner == owner and job.status == RUNNING:
+                job.lease_expires = lease_expires
+
+    async def finish(self, job: Job, owner: str) -> bool:
+        stored = self._jobs.get(job.job_id)
+        if stored is None or stored.owner != owner:
+            return False
+        job.owner, job.lease_expires = None, None
+        self._jobs[job.job_id] = job
+        return True
+
+    async def requeue_expired(self, now: float) -> int:
+        expired = [
+            job for job in self._jobs.values()
+            if job.status == RUNNING and (job.lease_expires is None or job.lease_expires < now)
+        ]
+        for job in expired:
+            job.status, job.started_at, job.owner, job.lease_expires = QUEUED, None, None, None
+        return len(expired)
+
+    async def queued(self) -> List[Job]:
+        jobs = [job for job in self._jobs.values() if job.status == QUEUED]
+        return sorted(jobs, key=lambda job: job.created_at)
+
+    async def purge_finished(self, cutoff: float) -> int:
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    def close(self):
+        self._jobs.clear()
+
+
+class SqliteJobStore:
+    """ Persists jobs in SQLite so queued and interrupted jobs survive a restart. """
+
+    def __init__(self, db_path: str, pool_size: int = 2):
+        self.pool = SqliteConnectionPool(db_path, size=pool_size, schema=JOB_SCHEMA)
+        with self.pool.transaction() as connection:
+            existing = {row[1] for row in connection.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in JOB_MIGRATIONS.items():
+                if column not in existing:
+                    connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _save(self, job: Job):
+        placeholders = ", ".join("?" for _ in JOB_COLUMNS)
+        with self.pool.transaction() as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({placeholders})",
+                tuple(getattr(job, column) for column in JOB_COLUMNS)
+            )
+
+    def _select(self, where: str, params: tuple) -> List[Job]:
+        with self.pool.connection() as connection:
+            rows = connection.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE {where}", params).fetchall()
+        return [Job(**dict(zip(JOB_COLUMNS, row))) for row in rows]
+
+    def _claim(self, job: Job, owner: str, lease_expires: float) -> bool:
+        started_at = time.time()
+        with self.pool.transaction() as connection:
+            claimed = connection.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner = ?, lease_expires = ? WHERE job_id = ? AND status = ?",
+                (RUNNING, started_at, owner, lease_expires, job.job_id, QUEUED)
+            ).rowcount == 1
+        if claimed:
+            job.status, job.started_at, job.owner, job.lease_expires = RUNNING, started_at, owner, lease_expires
+        return claimed
+
+    def _renew(self, job_ids: List[str], owner: str, lease_expires: float):
+        with self.pool.transaction() as connection:
+            connection.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND owner = ? AND status = ?",
+                [(lease_expires, job_id, owner, RUNNING) for job_id in job_ids]
+            )
+
+    def _finish(self, job: Job, owner: str) -> bool:
+        with self.pool.transaction() as connection:
+            finished = connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, response = ?, error = ?, owner = NULL, lease_expires = NULL "
+                "WHERE job_id = ? AND owner = ?",
+                (job.status, job.finished_at, job.response, job.error, job.job_id, owner)
+            ).rowcount == 1
+        if finished:
+            job.owner, job.lease_expires = None, None
+        return finished
+
+    def _requeue_expired(self, now: float) -> int:
+        with self.pool.transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires = NULL "
+                "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+                (QUEUED, RUNNING, now)
+            ).rowcount
+
+    def _delete_finished(self, cutoff: float) -> int:
+        with self.pool.transaction() as connection:
+            return connection.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+            ).rowcount
+
+    async def save(self, job: Job):
+        await asyncio.to_thread(self._save, job)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        jobs = await asyncio.to_thread(self._select, "job_id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    async def claim(self, job: Job, owner: str, lease_expires: float) -> bool:
+        """ Atomically move a queued job to running under `owner`; False when another worker got it first. """
+        return await asyncio.to_thread(self._claim, job, owner, lease_expires)
+
+    async def renew(self, job_ids: List[str], owner: str, lease_expires: float):
+        await asyncio.to_thread(self._renew, job_ids, owner, lease_expires)
+
+    async def finish(self, job: Job, owner: str) -> bool:
+        """ Record the outcome, unless the lease was lost and the job handed to another worker. """
+        return await asyncio.to_thread(self._finish, job, owner)
+
+    async def requeue_expired(self, now: float) -> int:
+        """ Queue again the running jobs whose worker stopped renewing its lease. """
+        return await asyncio.to_thread(self._requeue_expired, now)
+
+    async def queued(self) -> List[Job]:
+        return await asyncio.to_thread(self._select, "status = ? ORDER BY created_at", (QUEUED,))
+
+    async def purge_finished(self, cutoff: float) -> int:
+        return await asyncio.to_thread(self._delete_finished, cutoff)
+
+    def close(self):
+        self.pool.close()
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue drained by a pool of asyncio workers.
+
+    Waiting jobs are kept per user and workers take them round-robin across
+    users, so one user submitting a burst cannot starve the others. submit()
+    raises QueueFullError once `max_queued` jobs are waiting, or the user already
+    has `max_per_user` waiting. Every status change is written to the store.
+
+    Several processes can share one store: a worker claims a job atomically
+    (queued -> running) before running it and renews the claim every
+    `lease_seconds / 3` seconds. On start, and on every heartbeat, running jobs
+    whose lease expired (their process died) are queued again; jobs another
+    live process is running are left alone. Finished jobs are kept for
+    `result_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        store,
+        handler: Callable[[Job], Awaitable[str]],
+        logging: logging.Logger,
+        workers: int = 2,
+        max_queued: int = 100,
+        max_per_user: int = 10,
+        result_ttl: float = 3600,
+        purge_interval: float = 300,
+        lease_seconds: float = 60
+    ):
+        self.store = store
+        self.handler = handler
+        self.logging = logging
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.result_ttl = result_ttl
+        self.purge_interval = purge_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Jobs this process is running, whose leases the heartbeat renews
+        self._owned: Dict[str, Job] = {}
+        # user_id -> waiting jobs; the first user in the dict is served next
+        self._queues: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._available = asyncio.Condition()
+        self._tasks: List[asyncio.Task] = []
+        self._last_purge = 0.0
+        # Running average of job duration, used for the Retry-After hint
+        self._average_duration = 30.0
+
+    # ------------------ Fair queue ------------------
+    def _enqueue(self, job: Job):
+        self._queues.setdefault(job.user_id, deque()).append(job)
+        self._queued += 1
+        JOBS_QUEUED.set(self._queued)
+
+    def _next_job(self) -> Job:
+        user_id, jobs = next(iter(self._queues.items()))
+        job = jobs.popleft()
+        # Send this user to the back of the rotation
+        del self._queues[user_id]
+        if jobs:
+            self._queues[user_id] = jobs
+        self._queued -= 1
+        JOBS_QUEUED.set(self._queued)
+        return job
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._average_duration * (self._queued + 1) / self.workers))
+
+    # ------------------ Lifecycle ------------------
+    async def _load_queued(self) -> int:
+        """ Queue the store's waiting jobs not already queued here; the claim decides which process runs each. """
+        async with self._available:
+            waiting = {job.job_id for jobs in self._queues.values() for job in jobs}
+            loaded = [job for job in await self.store.queued() if job.job_id not in waiting and job.job_id not in self._owned]
+            for job in loaded:
+                self._enqueue(job)
+            if loaded:
+                self._available.notify(len(loaded))
+        return len(loaded)
+
+    async def start(self):
+        """ Re-queue jobs whose worker died, queue the waiting ones and start the workers. """
+        expired = await self.store.requeue_expired(time.time())
+        if expired:
+            self.logging.info(f"Re-queued {expired} job(s) left running by a stopped worker")
+        loaded = await self._load_queued()
+        if loaded:
+            self.logging.info(f"Loaded {loaded} queued job(s) from the store")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        self.logging.info(f"Job queue started with {self.workers} worker(s) as {self.worker_id}")
+
+    async def stop(self):
+        """ Stop the workers. Interrupted jobs are re-queued once their lease expires. """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    # ------------------ API ------------------
+    async def submit(self, user_id: str, session_id: str, prompt: str) -> Job:
+        """ Queue a job and return it immediately. """
+        # Check and enqueue under one lock, so concurrent submits cannot all pass the bounds
+        async with self._available:
+            if self._queued >= self.max_queued:
+                JOBS_REJECTED.labels("queue_full").inc()
+                raise QueueFullError(f"The job queue is full ({self.max_queued} jobs waiting).", self._retry_after())
+            if len(self._queues.get(user_id, ())) >= self.max_per_user:
+                JOBS_REJECTED.labels("user_limit").inc()
+                raise QueueFullError(f"User '{user_id}' already has {self.max_per_user} jobs waiting.", self._retry_after())
+
+            job = Job(job_id=uuid.uuid4().hex, user_id=user_id, session_id=session_id, prompt=prompt)
+            await self.store.save(job)
+            self._enqueue(job)
+            self._available.notify()
+
+        if time.time() - self._last_purge >= self.purge_interval:
+            self._last_purge = time.time()
+            await self.store.purge_finished(self._last_purge - self.result_ttl)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self.store.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self._queued, "running": self._running, "workers": self.workers, "users_waiting": len(self._queues)}
+
+    # ------------------ Workers ------------------
+    async def _worker(self):
+        while True:
+            async with self._available:
+                await self._available.wait_for(lambda: self._queued > 0)
+                job = self._next_job()
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The store failed (e.g. "database is locked"): record the job as failed, keep the worker
+                self.logging.error(f"Job {job.job_id} could not be processed: {e}")
+                job.status, job.error, job.finished_at = FAILED, str(e), time.time()
+                JOBS_FINISHED.labels(FAILED).inc()
+                try:
+                    await self.store.save(job)
+                except Exception as save_error:
+                    self.logging.error(f"Job {job.job_id} could not be marked failed: {save_error}")
+
+    async def _process(self, job: Job):
+        if not await self.store.claim(job, self.worker_id, time.time() + self.lease_seconds):
+            # Another worker process claimed it first
+            return
+
+        self._owned[job.job_id] = job
+        self._running += 1
+        JOBS_RUNNING.set(self._running)
+        try:
+            try:
+                job.response = await self.handler(job)
+                job.status = SUCCEEDED
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.status, job.error = FAILED, str(e)
+                self.logging.error(f"Job {job.job_id} failed: {e}")
+
+            job.finished_at = time.time()
+            self._average_duration = 0.8 * self._average_duration + 0.2 * (job.finished_at - job.started_at)
+            if not await self.store.finish(job, self.worker_id):
+                self.logging.warning(f"Job {job.job_id} lost its lease; its result was not recorded")
+            JOBS_FINISHED.labels(job.status).inc()
+        finally:
+            self._owned.pop(job.job_id, None)
+            self._running -= 1
+            JOBS_RUNNING.set(self._running)
+
+    async def _heartbeat(self):
+        """ Renew the leases of the jobs running here and pick up the jobs of stopped workers. """
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if self._owned:
+                    await self.store.renew(list(self._owned), self.worker_id, time.time() + self.lease_seconds)
+                if await self.store.requeue_expired(time.time()):
+                    await self._load_queued()
+            except Exception as e:
+                self.logging.error(f"Job lease heartbeat failed: {e}")
+
+
+def build_job_store(logging: logging.Logger):
+    """
+    Create the job store selected by the JOB_STORE environment variable.
+
+    "memory" (default) keeps jobs in process; "sqlite" persists them in
+    JOB_DB_PATH so queued jobs survive restarts.
+    """
+    backend = os.getenv("JOB_STORE", "memory").lower()
+
+    if backend == "memory":
+        logging.info("Using in-memory job store")
+        return InMemoryJobStore()
+
+    if backend == "sqlite":
+        db_path = os.getenv("JOB_DB_PATH", os.path.join("data", "jobs.db"))
+        logging.info(f"Using SQLite job store at '{db_path}'")
+        return SqliteJobStore(db_path=db_path)
+
+    raise ValueError(f"Unknown JOB_STORE '{backend}'. Expected 'memory' or 'sqlite'.")
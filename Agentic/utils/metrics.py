@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+from google.adk.agents.base_agent import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Agent calls take anything from milliseconds (cache hits) to minutes (full builds)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+STAGE_DURATION = Histogram(
+    "pagegenie_stage_duration_seconds", "Wall time of one agent stage run.", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_FIRST_EVENT = Histogram(
+    "pagegenie_stage_first_event_seconds", "Time from a stage starting to its first event.", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_RUNS = Counter("pagegenie_stage_runs_total", "Agent stage runs.", ["stage"])
+MODEL_CALLS = Counter("pagegenie_model_calls_total", "Model responses received per stage.", ["stage"])
+TOKENS = Counter("pagegenie_tokens_total", "Model tokens per stage.", ["stage", "kind"])
+MODEL_LATENCY = Histogram(
+    "pagegenie_model_latency_seconds", "Wall time of one model call, by stage and the model that served it.",
+    ["stage", "model"], buckets=LATENCY_BUCKETS
+)
+MODEL_ESCALATIONS = Counter("pagegenie_model_escalations_total", "Model calls moved to a stage's stronger model.", ["stage", "model"])
+RATE_LIMIT_WAIT = Histogram(
+    "pagegenie_rate_limit_wait_seconds", "Time a call waited for the shared rate limiter.", ["resource"], buckets=LATENCY_BUCKETS
+)
+RATE_LIMIT_RETRIES = Counter("pagegenie_rate_limit_retries_total", "Model calls retried after a provider error, by status code.", ["code"])
+TOOL_DURATION = Histogram(
+    "pagegenie_tool_duration_seconds", "Wall time of one tool call.", ["tool"], buckets=LATENCY_BUCKETS
+)
+TOOL_CALLS = Counter("pagegenie_tool_calls_total", "Tool calls by outcome.", ["tool", "status"])
+RUN_DURATION = Histogram(
+    "pagegenie_run_duration_seconds", "Wall time of one runner invocation (one user turn).", buckets=LATENCY_BUCKETS
+)
+BUILDER_ITERATIONS = Histogram(
+    "pagegenie_builder_iterations", "Creator rounds per user turn that ran the page builder.",
+    buckets=(1, 2, 3, 5, 8, 12, 20, 30, 50)
+)
+BUILD_OUTCOMES = Counter("pagegenie_build_outcomes_total", "Page builder loop runs by how they ended.", ["outcome"])
+CONTEXT_COMPACTIONS = Counter("pagegenie_context_compactions_total", "Session histories compacted to fit the token budget.")
+PROMPT_TOKENS = Counter("pagegenie_prompt_tokens_total", "Estimated instruction tokens per stage of the sampled calls: as plain state injection would render them (full) and after state projection (projected).", ["stage", "kind"])
+CONTEXT_TOKENS = Histogram(
+    "pagegenie_context_tokens", "Estimated session history tokens around a compaction.", ["phase"],
+    buckets=(1000, 2500, 5000, 10000, 20000, 40000, 80000, 160000, 320000)
+)
+WEB_SEARCHES = Counter("pagegenie_web_searches_total", "web_search tool calls: cache hits, new searches, and calls joining one in flight.", ["result"])
+TEMPLATE_LOOKUPS = Counter("pagegenie_template_lookups_total", "Template library lookups for a new page.", ["result"])
+TEMPLATES_LEARNED = Counter("pagegenie_templates_learned_total", "Finished pages added to the template library.")
+PAGE_EDITS = Counter("pagegenie_page_edits_total", "Requirement edits on a built page, by what they required.", ["scope"])
+ARTIFACT_RESPONSES = Counter("pagegenie_artifact_responses_total", "Page artifact responses by status and content encoding.", ["status", "encoding"])
+ARTIFACT_BYTES = Counter("pagegenie_artifact_bytes_total", "Page artifact body bytes sent, by content encoding.", ["encoding"])
+IDEMPOTENT_REQUESTS = Counter("pagegenie_idempotent_requests_total", "Agent queries carrying an Idempotency-Key: new runs, duplicates joining a run in flight, replays of a stored result and conflicting reuses.", ["result"])
+JOBS_QUEUED = Gauge("pagegenie_jobs_queued", "Jobs waiting in the background job queue.")
+JOBS_RUNNING = Gauge("pagegenie_jobs_running", "Jobs being processed by the job workers.")
+JOBS_FINISHED = Counter("pagegenie_jobs_finished_total", "Finished background jobs by outcome.", ["status"])
+JOBS_REJECTED = Counter("pagegenie_jobs_rejected_total", "Job submissions refused with HTTP 429.", ["reason"])
+
+
+def stage_label(agent_name: str) -> str:
+    """ Collapse per-section Creator clones (Creator_section_3, ...) into one 'Creator' stage. """
+    return "Creator" if agent_name.startswith("Creator_") else agent_name
+
+
+def is_agent_tool_run(invocation_context: InvocationContext) -> bool:
+    """ True for the nested runner AgentTool starts for its agent, which names its app after that agent. """
+    return invocation_context.app_name == invocation_context.agent.name
+
+
+def metrics_payload() -> tuple:
+    """ (body, content type) for the /metrics route. """
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsPlugin(BasePlugin):
+    """
+    Runner plugin recording per-stage latency, time to first event, token usage,
+    tool calls and builder iterations as Prometheus metrics.
+
+    When `trace_dir` is set, every invocation's spans are also written to
+    `<trace_dir>/<invocation_id>.json`.
+
+    A stage whose before_agent_callback answers for it (cache hits, the
+    deterministic Determiner pass, template starts) never reaches
+    after_agent_callback: it is closed at its final response event, as soon as
+    the next agent callback shows it has ended. Invocations that raised (no
+    after_run_callback) are dropped after `stale_after` seconds.
+
+    AgentTool runs its agent (Web_info) in a nested runner that shares the
+    plugins. Its stages, model and tool calls are recorded, but it is not a
+    user turn, so it is left out of the run duration.
+    """
+
+    def __init__(self, trace_dir: Optional[str] = None, stale_after: float = 3600):
+        super().__init__(name="pagegenie_metrics")
+        self.trace_dir = trace_dir
+        if trace_dir:
+            os.makedirs(trace_dir, exist_ok=True)
+        self.stale_after = stale_after
+        # invocation_id -> {"start", "stages", "ended", "first_event", "iterations", "spans"}
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        # function_call_id -> start time
+        self._tools: Dict[str, float] = {}
+        # (invocation_id, agent name) -> (start time, model) of the model call in flight
+        self._models: Dict[tuple, tuple] = {}
+
+    def _run(self, invocation_id: str) -> Dict[str, Any]:
+        return self._runs.setdefault(
+            invocation_id,
+            {"start": time.perf_counter(), "stages": {}, "ended": {}, "first_event": set(), "iterations": 0, "spans": []}
+        )
+
+    def _span(self, invocation_id: str, **span):
+        if self.trace_dir:
+            self._run(invocation_id)["spans"].append(span)
+
+    def _evict_stale(self):
+        """ Drop the bookkeeping of invocations that raised, which never reach after_run_callback. """
+        cutoff = time.perf_counter() - self.stale_after
+        for invocation_id in [invocation_id for invocation_id, run in self._runs.items() if run["start"] < cutoff]:
+            del self._runs[invocation_id]
+        for key in [key for key, (started, _) in self._models.items() if started < cutoff]:
+            del self._models[key]
+        for call_id in [call_id for call_id, started in self._tools.items() if started < cutoff]:
+            del self._tools[call_id]
+
+    def _close_stage(self, invocation_id: str, run: Dict[str, Any], name: str, ended: float):
+        started = run["stages"].pop(name, None)
+        run["ended"].pop(name, None)
+        stage = stage_label(name)
+        STAGE_RUNS.labels(stage).inc()
+        if started is not None:
+            duration = ended - started
+            STAGE_DURATION.labels(stage).observe(duration)
+            self._span(invocation_id, kind="agent", stage=stage, name=name, start=started - run["start"], duration=duration)
+        if stage == "Creator":
+            run["iterations"] += 1
+
+    def _close_short_circuited(self, invocation_id: str, run: Dict[str, Any], keep: Optional[str] = None):
+        """ Close the stages that gave their final response but were never closed by after_agent_callback. """
+        for name, ended in list(run["ended"].items()):
+            if name != keep:
+                self._close_stage(invocation_id, run, name, ended)
+
+    async def before_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        self._evict_stale()
+        self._run(invocation_context.invocation_id)
+        return None
+
+    async def before_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> None:
+        run = self._run(callback_context.invocation_id)
+        self._close_short_circuited(callback_context.invocation_id, run)
+        run["stages"][agent.name] = time.perf_counter()
+        run["first_event"].discard(agent.name)
+        return None
+
+    async def on_event_callback(self, *, invocation_context: InvocationContext, event: Event) -> None:
+        run = self._runs.get(invocation_context.invocation_id)
+        if run is None or event.author not in run["stages"]:
+            return None
+        now = time.perf_counter()
+        if event.author not in run["first_event"]:
+            run["first_event"].add(event.author)
+            STAGE_FIRST_EVENT.labels(stage_label(event.author)).observe(now - run["stages"][event.author])
+        if event.is_final_response() and not event.partial:
+            # Closed here if no after_agent_callback follows (a before_agent_callback answered for the stage)
+            run["ended"][event.author] = now
+        return None
+
+    async def after_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> None:
+        run = self._run(callback_context.invocation_id)
+        self._close_short_circuited(callback_context.invocation_id, run, keep=agent.name)
+        self._close_stage(callback_context.invocation_id, run, agent.name, time.perf_counter())
+        return None
+
+    async def before_model_callback(self, *, callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+        # Registered after the routing plugin, so the model is the one that will serve the call
+        self._models[(callback_context.invocation_id, callback_context.agent_name)] = (time.perf_counter(), llm_request.model)
+        return None
+
+    async def after_model_callback(self, *, callback_context: CallbackContext, llm_response: LlmResponse) -> None:
+        # Streaming responses report usage once, on the final chunk
+        if llm_response.partial:
+            return None
+        stage = stage_label(callback_context.agent_name)
+        MODEL_CALLS.labels(stage).inc()
+        started = self._models.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if started is not None:
+            MODEL_LATENCY.labels(stage, started[1] or "unknown").observe(time.perf_counter() - started[0])
+        usage = llm_response.usage_metadata
+        prompt_tokens = (usage.prompt_token_count or 0) if usage else 0
+        completion_tokens = (usage.candidates_token_count or 0) if usage else 0
+        TOKENS.labels(stage, "prompt").inc(prompt_tokens)
+        TOKENS.labels(stage, "completion").inc(completion_tokens)
+        self._span(callback_context.invocation_id, kind="model", stage=stage,
+                   end=time.perf_counter() - self._run(callback_context.invocation_id)["start"],
+                   prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        return None
+
+    async def before_tool_callback(self, *, tool: BaseTool, tool_args: dict, tool_context: ToolContext) -> None:
+        self._tools[tool_context.function_call_id] = time.perf_counter()
+        return None
+
+    def _finish_tool(self, tool: BaseTool, tool_context: ToolContext, status: str):
+        started = self._tools.pop(tool_context.function_call_id, None)
+        TOOL_CALLS.labels(tool.name, status).inc()
+        if started is not None:
+            duration = time.perf_counter() - started
+            TOOL_DURATION.labels(tool.name).observe(duration)
+            self._span(tool_context.invocation_id, kind="tool", stage=stage_label(tool_context.agent_name),
+                       name=tool.name, status=status, duration=duration)
+
+    async def after_tool_callback(self, *, tool: BaseTool, tool_args: dict, tool_context: ToolContext, result: dict) -> None:
+        self._finish_tool(tool, tool_context, "ok")
+        return None
+
+    async def on_tool_error_callback(self, *, tool: BaseTool, tool_args: dict, tool_context: ToolContext, error: Exception) -> None:
+        self._finish_tool(tool, tool_context, "error")
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        for key in [key for key in self._models if key[0] == invocation_context.invocation_id]:
+            del self._models[key]
+        run = self._runs.get(invocation_context.invocation_id)
+        if run is None:
+            return None
+        self._close_short_circuited(invocation_context.invocation_id, run)
+        del self._runs[invocation_context.invocation_id]
+        duration = time.perf_counter() - run["start"]
+        if not is_agent_tool_run(invocation_context):
+            RUN_DURATION.observe(duration)
+        if run["iterations"]:
+            BUILDER_ITERATIONS.observe(run["iterations"])
+
+        if self.trace_dir:
+            trace = {
+                "invocation_id": invocation_context.invocation_id,
+                "user_id": invocation_context.user_id,
+                "session_id": invocation_context.session.id,
+                "agent": invocation_context.agent.name,
+                "duration": duration,
+                "builder_iterations": run["iterations"],
+                "spans": run["spans"]
+            }
+            path = os.path.join(self.trace_dir, f"{invocation_context.invocation_id}.json")
+            await asyncio.to_thread(self._write_trace, path, trace)
+        return None
+
+    @staticmethod
+    def _write_trace(path: str, trace: Dict[str, Any]):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(trace, file, indent=2, default=str)
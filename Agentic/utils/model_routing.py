@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.models import LlmRequest
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from .metrics import MODEL_ESCALATIONS, stage_label
+from .rate_limiter import RateLimitedGemini
+
+ROUTES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model_routes.json")
+DEFAULT_MODEL = "gemini-2.5-flash"
+# Escalation triggers: consecutive failed page validations, or a tool call of the stage that returned an error
+ESCALATE_ON_VALIDATION = "validation"
+ESCALATE_ON_TOOL_ERROR = "tool_error"
+
+
+@dataclass
+class StageRoute:
+    """ Model of one stage and, optionally, the stronger model it escalates to. """
+
+    model: str
+    escalate_to: Optional[str] = None
+    escalate_on: str = ESCALATE_ON_VALIDATION
+    escalate_after: int = 1
+
+
+def load_routes(path: Optional[str] = None) -> Tuple[str, Dict[str, StageRoute]]:
+    """
+    Read (default model, {stage: StageRoute}) from the routes file.
+
+    The file is MODEL_ROUTES_PATH, or model_routes.json next to main.py. MODEL_DEFAULT
+    overrides its default model, and MODEL_ROUTING=0 ignores the file so every stage
+    uses the default model without escalation.
+    """
+    default = os.getenv("MODEL_DEFAULT")
+    if os.getenv("MODEL_ROUTING", "1") == "0":
+        return default or DEFAULT_MODEL, {}
+
+    path = path or os.getenv("MODEL_ROUTES_PATH", ROUTES_PATH)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            config = json.load(file)
+    except (OSError, ValueError):
+        return default or DEFAULT_MODEL, {}
+
+    routes = {stage: StageRoute(**route) for stage, route in (config.get("stages") or {}).items()}
+    return default or config.get("default") or DEFAULT_MODEL, routes
+
+
+# Read once at import: the agents take their model from here when they are defined
+DEFAULT_STAGE_MODEL, ROUTES = load_routes()
+
+
+def model_for(stage: str) -> Union[str, RateLimitedGemini]:
+    """
+    Base model of a stage (agent name), wrapped in the shared rate limiter
+    unless RATE_LIMIT_ENABLED=0 or the model is not a Gemini model.
+    """
+    route = ROUTES.get(stage)
+    model = route.model if route else DEFAULT_STAGE_MODEL
+    if os.getenv("RATE_LIMIT_ENABLED", "1") == "0" or not model.startswith("gemini-"):
+        return model
+    return RateLimitedGemini(model=model)
+
+
+class ModelRoutingPlugin(BasePlugin):
+    """
+    Runner plugin moving a model call to the stage's stronger model when it is struggling.
+
+    A stage with `escalate_to` set is escalated when {validation_failures} (consecutive
+    failed page checks) reaches `escalate_after` ("validation"), or once one of its own
+    tool calls failed in the current invocation ("tool_error"). The request's model
+    name is swapped in before_model_callback, so the stronger model must be served by
+    the same backend as the stage's base model.
+
+    Tool failures are forgotten in after_run_callback; runs that fail before it
+    is reached have theirs dropped after `stale_after` seconds.
+    """
+
+    def __init__(self, logging: logging.Logger, routes: Optional[Dict[str, StageRoute]] = None, stale_after: float = 3600):
+        super().__init__(name="pagegenie_model_routing")
+        self.logging = logging
+        self.routes = ROUTES if routes is None else routes
+        self.stale_after = stale_after
+        # (invocation_id, stage) -> when its last tool call failed
+        self._tool_errors: Dict[Tuple[str, str], float] = {}
+
+    def _evict_stale(self):
+        cutoff = time.monotonic() - self.stale_after
+        for key in [key for key, failed_at in self._tool_errors.items() if failed_at < cutoff]:
+            del self._tool_errors[key]
+
+    def _should_escalate(self, route: StageRoute, stage: str, callback_context: CallbackContext) -> bool:
+        if route.escalate_on == ESCALATE_ON_TOOL_ERROR:
+            return (callback_context.invocation_id, stage) in self._tool_errors
+        return (callback_context.state.get("validation_failures") or 0) >= route.escalate_after
+
+    async def before_model_callback(self, *, callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+        stage = stage_label(callback_context.agent_name)
+        route = self.routes.get(stage)
+        if route is None or not route.escalate_to or llm_request.model == route.escalate_to:
+            return None
+        if self._should_escalate(route, stage, callback_context):
+            self.logging.info(f"Escalating {callback_context.agent_name} from {llm_request.model} to {route.escalate_to}")
+            MODEL_ESCALATIONS.labels(stage, route.escalate_to).inc()
+            llm_request.model = route.escalate_to
+        return None
+
+    def _tool_failed(self, tool_context: ToolContext):
+        self._evict_stale()
+        self._tool_errors[(tool_context.invocation_id, stage_label(tool_context.agent_name))] = time.monotonic()
+
+    async def after_tool_callback(self, *, tool: BaseTool, tool_args: dict, tool_context: ToolContext, result: dict) -> None:
+        if isinstance(result, dict) and result.get("status") == "error":
+            self._tool_failed(tool_context)
+        return None
+
+    async def on_tool_error_callback(self, *, tool: BaseTool, tool_args: dict, tool_context: ToolContext, error: Exception) -> None:
+        self._tool_failed(tool_context)
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        for key in [key for key in self._tool_errors if key[0] == invocation_context.invocation_id]:
+            del self._tool_errors[key]
+        return None
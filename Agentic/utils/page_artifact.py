@@ -0,0 +1,282 @@
+import gzip
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from .metrics import ARTIFACT_BYTES, ARTIFACT_RESPONSES
+
+# Optional: brotli compression when the brotli package (requirements.txt) is installed; gzip otherwise
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+START_TAG_PATTERN = re.compile(r"<([a-zA-Z][\w-]*)(\s[^<>]*?)?(/?)>")
+STYLE_ATTR_PATTERN = re.compile(r"""\sstyle\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+CLASS_ATTR_PATTERN = re.compile(r"""(\sclass\s*=\s*)(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+# Blocks whose contents minify() must not touch (the CSS of <style> is minified on its own)
+RAW_BLOCK_PATTERN = re.compile(r"<(script|pre|textarea|style)\b[^>]*>.*?</\1\s*>", re.DOTALL | re.IGNORECASE)
+# Conditional comments (<!--[if IE]>) carry markup and are kept
+COMMENT_PATTERN = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+CSS_COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_SPACE_PATTERN = re.compile(r"\s*([{};,>])\s*")
+# Only after a colon: before one it may separate a descendant selector from a pseudo-class
+CSS_COLON_PATTERN = re.compile(r":\s+")
+# A whole tag, quoted attribute values (which may hold whitespace or ">") included
+TAG_PATTERN = re.compile(r"""<[a-zA-Z/!][^<>"']*(?:(?:"[^"]*"|'[^']*')[^<>"']*)*>""")
+# Selectors (the text before a "{") naming an element by id, e.g. "#main p"
+CSS_SELECTOR_PATTERN = re.compile(r"([^{}]+)\{")
+CSS_ID_SELECTOR_PATTERN = re.compile(r"#[A-Za-z_-]")
+STYLE_BLOCK_PATTERN = re.compile(r"<style\b[^>]*>(.*?)</style\s*>", re.DOTALL | re.IGNORECASE)
+HEAD_END_PATTERN = re.compile(r"</head\s*>", re.IGNORECASE)
+BODY_START_PATTERN = re.compile(r"<body\b[^>]*>", re.IGNORECASE)
+ID_ATTR_PATTERN = re.compile(r"\sid\s*=", re.IGNORECASE)
+HOISTED_CLASS_PREFIX = "pg-s"
+# The hoisted class is repeated in its selector (.pg-s1.pg-s1...) to outrank the page's class rules
+HOISTED_SPECIFICITY = 4
+
+
+def _normalize_declarations(style: str) -> str:
+    declarations = [declaration.strip() for declaration in style.split(";")]
+    return ";".join(declaration for declaration in declarations if declaration)
+
+
+def _has_id_rules(html: str) -> bool:
+    """ True when a <style> block of the page has a rule with an id selector. """
+    for block in STYLE_BLOCK_PATTERN.finditer(html):
+        css = CSS_COMMENT_PATTERN.sub("", block.group(1))
+        for selector in CSS_SELECTOR_PATTERN.findall(css):
+            if not selector.strip().startswith("@") and CSS_ID_SELECTOR_PATTERN.search(selector):
+                return True
+    return False
+
+
+def hoist_inline_styles(html: str, min_repeats: int = 2) -> str:
+    """
+    Replace every inline style attribute used at least `min_repeats` times by a
+    class (pg-s1, pg-s2, ...) defined once in a <style> block added to the head.
+
+    The shared rules repeat their class (HOISTED_SPECIFICITY times) so they keep
+    taking precedence over the page's class and element rules like the inline
+    attributes did, without !important: a script setting element.style still
+    overrides them. Id rules would still outrank the class, so elements with an
+    id are left alone, and a page whose <style> blocks have any id selector
+    (e.g. "#main p") is not changed at all. Stylesheets the page links to are
+    not checked: the option stays opt-in for that reason.
+    """
+    if _has_id_rules(html):
+        return html
+
+    def hoistable_style(attributes: str):
+        if ID_ATTR_PATTERN.search(attributes):
+            return None
+        return STYLE_ATTR_PATTERN.search(attributes)
+
+    counts: Dict[str, int] = {}
+    for match in START_TAG_PATTERN.finditer(html):
+        style = hoistable_style(match.group(2) or "")
+        if style:
+            declarations = _normalize_declarations(style.group(1) if style.group(1) is not None else style.group(2))
+            if declarations:
+                counts[declarations] = counts.get(declarations, 0) + 1
+
+    classes: "OrderedDict[str, str]" = OrderedDict()
+    for declarations, count in counts.items():
+        if count >= min_repeats:
+            classes[declarations] = f"{HOISTED_CLASS_PREFIX}{len(classes) + 1}"
+    if not classes:
+        return html
+
+    def rewrite(match):
+        attributes = match.group(2) or ""
+        style = hoistable_style(attributes)
+        if not style:
+            return match.group(0)
+        name = classes.get(_normalize_declarations(style.group(1) if style.group(1) is not None else style.group(2)))
+        if name is None:
+            return match.group(0)
+
+        attributes = attributes[:style.start()] + attributes[style.end():]
+        existing = CLASS_ATTR_PATTERN.search(attributes)
+        if existing:
+            current = existing.group(2) if existing.group(2) is not None else existing.group(3)
+            attributes = f'{attributes[:existing.start()]}{existing.group(1)}"{current} {name}"{attributes[existing.end():]}'
+        else:
+            attributes = f' class="{name}"{attributes}'
+        return f"<{match.group(1)}{attributes}{match.group(3)}>"
+
+    # Only rewrite markup, never the inside of scripts or existing style blocks
+    parts: List[str] = []
+    position = 0
+    for block in RAW_BLOCK_PATTERN.finditer(html):
+        parts.append(START_TAG_PATTERN.sub(rewrite, html[position:block.start()]))
+        parts.append(block.group(0))
+        position = block.end()
+    parts.append(START_TAG_PATTERN.sub(rewrite, html[position:]))
+    html = "".join(parts)
+
+    stylesheet = "<style>" + "".join(
+        f"{f'.{name}' * HOISTED_SPECIFICITY}{{{declarations}}}" for declarations, name in classes.items()
+    ) + "</style>"
+    head_end = HEAD_END_PATTERN.search(html)
+    if head_end:
+        return html[:head_end.start()] + stylesheet + html[head_end.start():]
+    body_start = BODY_START_PATTERN.search(html)
+    if body_start:
+        return html[:body_start.end()] + stylesheet + html[body_start.end():]
+    return stylesheet + html
+
+
+def _minify_css(css: str) -> str:
+    css = CSS_COMMENT_PATTERN.sub("", css)
+    css = CSS_COLON_PATTERN.sub(":", CSS_SPACE_PATTERN.sub(r"\1", css))
+    return re.sub(r"\s+", " ", css).replace(";}", "}").strip()
+
+
+def minify_html(html: str) -> str:
+    """
+    Drop comments (section markers included), collapse whitespace runs between
+    tags to one space (which renders the same) and minify <style> blocks. Tags are
+    kept as they are, since attribute values such as onclick handlers may depend
+    on their line breaks; <script>, <pre> and <textarea> contents are left alone too.
+    """
+    def minify_text(text: str) -> str:
+        text = COMMENT_PATTERN.sub("", text)
+        pieces: List[str] = []
+        position = 0
+        for tag in TAG_PATTERN.finditer(text):
+            pieces.append(re.sub(r"\s+", " ", text[position:tag.start()]))
+            pieces.append(tag.group(0))
+            position = tag.end()
+        pieces.append(re.sub(r"\s+", " ", text[position:]))
+        return "".join(pieces)
+
+    parts: List[str] = []
+    position = 0
+    for block in RAW_BLOCK_PATTERN.finditer(html):
+        parts.append(minify_text(html[position:block.start()]))
+        if block.group(1).lower() == "style":
+            open_end = block.group(0).index(">") + 1
+            close_start = block.group(0).lower().rindex("</style")
+            parts.append(block.group(0)[:open_end] + _minify_css(block.group(0)[open_end:close_start]) + "</style>")
+        else:
+            parts.append(block.group(0))
+        position = block.end()
+    parts.append(minify_text(html[position:]))
+    return "".join(parts).strip()
+
+
+def optimize_html(html: str) -> str:
+    """ Post-processing for the published page: shared stylesheet for repeated inline styles, then minification. """
+    return minify_html(hoist_inline_styles(html, int(os.getenv("ARTIFACT_HOIST_MIN_REPEATS", 2))))
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> str:
+    """ br, gzip or identity, by what the client accepts and what is installed. """
+    accepted = _accepted_encodings(accept_encoding)
+
+    def quality(name: str) -> float:
+        return accepted.get(name, accepted.get("*", 0.0))
+
+    if BROTLI_AVAILABLE and quality("br") > 0:
+        return "br"
+    if quality("gzip") > 0:
+        return "gzip"
+    return "identity"
+
+
+def _etag_matches(if_none_match: Optional[str], digest: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        # Weak comparison, ignoring the encoding suffix: the content is the same
+        tag = tag[2:] if tag.startswith("W/") else tag
+        if tag.strip('"').split("-")[0] == digest:
+            return True
+    return False
+
+
+class ArtifactCache:
+    """
+    Bodies of recently served pages by (content hash, encoding), so polling clients
+    and repeated downloads do not optimize and compress the same page again.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._bodies: "OrderedDict[Tuple[str, bool, str], bytes]" = OrderedDict()
+
+    def body(self, html: str, digest: str, optimize: bool, encoding: str) -> bytes:
+        key = (digest, optimize, encoding)
+        if key in self._bodies:
+            self._bodies.move_to_end(key)
+            return self._bodies[key]
+
+        raw = (optimize_html(html) if optimize else html).encode("utf-8")
+        if encoding == "br":
+            body = brotli.compress(raw, mode=brotli.MODE_TEXT, quality=int(os.getenv("ARTIFACT_BROTLI_QUALITY", 9)))
+        elif encoding == "gzip":
+            body = gzip.compress(raw, compresslevel=int(os.getenv("ARTIFACT_GZIP_LEVEL", 6)), mtime=0)
+        else:
+            body = raw
+
+        self._bodies[key] = body
+        while len(self._bodies) > self.max_entries:
+            self._bodies.popitem(last=False)
+        return body
+
+
+ARTIFACT_CACHE = ArtifactCache(max_entries=int(os.getenv("ARTIFACT_CACHE_SIZE", 64)))
+
+
+def render_artifact(html: str, accept_encoding: Optional[str] = None, if_none_match: Optional[str] = None,
+                    optimize: bool = False) -> Tuple[int, bytes, Dict[str, str]]:
+    """
+    (status, body, headers) of the page served as a downloadable artifact.
+
+    The ETag is a hash of the page and of whether it was optimized, with the
+    content encoding as a suffix; a matching If-None-Match gives 304 without a
+    body. Pages under ARTIFACT_MIN_COMPRESS_BYTES are sent uncompressed.
+    """
+    digest = hashlib.sha256(html.encode("utf-8") + (b"\x00optimized" if optimize else b"")).hexdigest()[:32]
+    encoding = choose_encoding(accept_encoding)
+    if len(html) < int(os.getenv("ARTIFACT_MIN_COMPRESS_BYTES", 512)):
+        encoding = "identity"
+
+    headers = {
+        "ETag": f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"',
+        # Pages change on every build: clients keep them but revalidate with the ETag
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    if _etag_matches(if_none_match, digest):
+        ARTIFACT_RESPONSES.labels("304", encoding).inc()
+        return 304, b"", headers
+
+    body = ARTIFACT_CACHE.body(html, digest, optimize, encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    ARTIFACT_RESPONSES.labels("200", encoding).inc()
+    ARTIFACT_BYTES.labels(encoding).inc(len(body))
+    return 200, body, headers
@@ -0,0 +1,253 @@
+import copy
+import json
+import math
+import re
+from typing import Any, Dict, List, Optional
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+from .metrics import PAGE_EDITS
+from .page_document import build_page_index, fill_slots, list_slots, parse_section_plan, section_slots, set_slots
+
+HEAD = "head"
+PLAN = "plan"
+# Fields rendered in <head>; title, description and keywords are rewritten locally
+HEAD_KEYS = {
+    "Page Title", "Meta Description", "Keywords", "Favicon", "Social Sharing Metadata", "Custom Fonts", "External Scripts"
+}
+LOCAL_HEAD_KEYS = {"Page Title", "Meta Description", "Keywords"}
+# Fields that reshape the page: a change needs a new section plan
+STRUCTURE_KEYS = {"Page Structure", "Page Purpose"}
+# Fields styling every section
+PAGE_WIDE_KEYS = {"Layout & Styling", "Accessibility Attributes", "Animations / Effects"}
+# Fields whose usual home is a kind of section, matched against slot ids
+SECTION_HINTS = {
+    "Navigation Menu": ("header", "nav", "navbar", "navigation"),
+    "Footer Content": ("footer",),
+    "Primary Media": ("hero", "banner"),
+    "Forms": ("contact", "form", "signup", "registration", "newsletter", "booking")
+}
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9'-]{2,}")
+TAG_PATTERN = re.compile(r"<[^>]+>")
+STOPWORDS = {"the", "and", "for", "with", "that", "this", "from", "are", "our", "your", "you", "its", "has", "all"}
+# Share of a value's words a section must contain to count as using it
+MENTION_RATIO = 0.5
+# Token overlap above which a re-planned section counts as unchanged
+KEEP_SECTION_SIMILARITY = 0.8
+
+
+def _tokens(value: Any) -> set:
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str)
+    return {token for token in TOKEN_PATTERN.findall(TAG_PATTERN.sub(" ", value).lower()) if token not in STOPWORDS}
+
+
+def _similarity(left: Any, right: Any) -> float:
+    left, right = _tokens(left), _tokens(right)
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+def _mentions(value: Any, section_tokens: set) -> bool:
+    tokens = _tokens(value)
+    if not tokens:
+        return False
+    return len(tokens & section_tokens) >= max(1, math.ceil(MENTION_RATIO * len(tokens)))
+
+
+def build_dependencies(fields: Dict[str, Any], section_plan: Dict[str, Any], html: Optional[str]) -> Dict[str, Any]:
+    """
+    Map each filled requirement field to the page regions built from it.
+
+    Targets are slot ids, "head" for <head> metadata, or "plan" when the field
+    shapes the section plan itself (or no section can be traced to it). A section
+    depends on a field when the field's usual section kind matches its slot id, or
+    when its plan entry or HTML contains most of the field's words. The plan the
+    page was built from is kept too, so a re-plan can tell which sections changed.
+    """
+    slots = section_slots(section_plan)
+    contents = list_slots(html)
+    section_tokens = {
+        slug: _tokens(section_plan[name]) | _tokens(contents.get(slug, "")) | _tokens(name)
+        for name, slug in slots.items()
+    }
+
+    keys: Dict[str, List[str]] = {}
+    for key, value in fields.items():
+        if not value:
+            continue
+        targets = [HEAD] if key in HEAD_KEYS else []
+        if key in STRUCTURE_KEYS:
+            targets.append(PLAN)
+        elif key in PAGE_WIDE_KEYS:
+            targets.extend(slots.values())
+        else:
+            hints = SECTION_HINTS.get(key, ())
+            targets.extend(
+                slug for slug in slots.values()
+                if any(hint in slug for hint in hints) or _mentions(value, section_tokens[slug])
+            )
+        keys[key] = targets or [PLAN]
+
+    return {"keys": keys, "plan": {slots[name]: entry for name, entry in section_plan.items()}}
+
+
+def _fields(state) -> Dict[str, Any]:
+    return {**(state.get("details") or {}), **(state.get("problem_config") or {})}
+
+
+def plan_regeneration(state, previous: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    After requirement fields changed on a built page, work out what has to be rebuilt.
+
+    `previous` maps each changed field to its old value. Title, description and
+    keywords are written into the page right away; the rest is queued in
+    {regeneration}: sections to regenerate, <head> fields for Creator, and whether
+    the section plan has to be redone. Returns the updated {regeneration}, or None
+    when there is no page yet.
+    """
+    html = state.get("generated_code")
+    if not html or not previous:
+        return None
+    section_plan = parse_section_plan(state.get("section_plan"))
+    dependencies = state.get("page_dependencies")
+    if not dependencies:
+        # Page built before dependencies were recorded: trace them against the old values
+        dependencies = build_dependencies({**_fields(state), **previous}, section_plan, html)
+
+    regeneration = copy.deepcopy(state.get("regeneration")) or {"keys": {}, "sections": [], "head": [], "replan": False}
+    fields = _fields(state)
+    local_head = set()
+    for key in previous:
+        regeneration["keys"][key] = fields.get(key)
+        targets = dependencies["keys"].get(key)
+        if not targets:
+            # The field was empty when the page was built: trace its new value instead
+            targets = build_dependencies({key: fields.get(key)}, section_plan, html)["keys"].get(key, [PLAN])
+        for target in targets:
+            if target == PLAN:
+                regeneration["replan"] = True
+            elif target == HEAD and key in LOCAL_HEAD_KEYS:
+                local_head.add(key)
+            elif target == HEAD:
+                if key not in regeneration["head"]:
+                    regeneration["head"].append(key)
+            elif target not in regeneration["sections"]:
+                regeneration["sections"].append(target)
+
+    if local_head:
+        # Imported here: the template library depends on the validator in tools/
+        from .template_library import personalize
+        html = personalize(html, state.get("problem_config") or {})
+        state["generated_code"] = html
+        state["page_index"] = build_page_index(html)
+        PAGE_EDITS.labels("head_local").inc()
+
+    if regeneration["replan"]:
+        PAGE_EDITS.labels("replan").inc()
+    elif regeneration["sections"] or regeneration["head"]:
+        PAGE_EDITS.labels("sections").inc()
+    state["regeneration"] = regeneration
+    return regeneration
+
+
+def describe_regeneration(regeneration: Optional[Dict[str, Any]]) -> Optional[str]:
+    """ One line for tool responses telling the coordinator what the edit requires. """
+    if not regeneration:
+        return None
+    if regeneration["replan"]:
+        return "The page structure changed: run Section_Planner, then Webpage_Builder (unchanged sections are kept)."
+    if regeneration["sections"] or regeneration["head"]:
+        parts = regeneration["sections"] + (["<head>"] if regeneration["head"] else [])
+        return f"Run Webpage_Builder to regenerate only: {', '.join(parts)}. Do not run Section_Planner."
+    return "The page was updated in place; no rebuild is needed."
+
+
+def regeneration_instruction(state) -> Optional[str]:
+    """
+    Next instruction for Creator from {regeneration}, or None when nothing is queued.
+    The queued item is removed, so each region is regenerated once.
+    """
+    regeneration = state.get("regeneration")
+    if not regeneration or regeneration["replan"]:
+        return None
+    changes = "; ".join(f"{key}: {json.dumps(value, default=str)}" for key, value in regeneration["keys"].items())
+
+    if regeneration["head"]:
+        keys = ", ".join(regeneration["head"])
+        state["regeneration"] = {**regeneration, "head": []}
+        return (
+            f"The user changed these requirements: {changes}. Update the <head> ({keys}) to match. "
+            "Return the full skeleton with empty section placeholders; the filled sections are kept automatically."
+        )
+
+    section_plan = parse_section_plan(state.get("section_plan"))
+    names = {slug: name for name, slug in section_slots(section_plan).items()}
+    while regeneration["sections"]:
+        slug, remaining = regeneration["sections"][0], regeneration["sections"][1:]
+        regeneration = {**regeneration, "sections": remaining}
+        state["regeneration"] = regeneration
+        if slug in names:
+            return (
+                f"Regenerate the '{names[slug]}' section inside its <!-- section:{slug} --> placeholder. "
+                f"The user changed these requirements: {changes}. "
+                f"Section plan content: {json.dumps(section_plan[names[slug]], default=str)}. "
+                "Keep its current structure and styling where the change does not affect them. "
+                "Use inline CSS and alt text on images, and keep the main <script> at the end of body."
+            )
+    return None
+
+
+def record_dependencies(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ after_agent_callback for Webpage_Builder: remember which fields each region of the page came from. """
+    html = callback_context.state.get("generated_code")
+    section_plan = parse_section_plan(callback_context.state.get("section_plan"))
+    if html and section_plan:
+        callback_context.state["page_dependencies"] = build_dependencies(_fields(callback_context.state), section_plan, html)
+    return None
+
+
+def reconcile_page(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    before_agent_callback for Webpage_Builder: start the build's bookkeeping and, after
+    an edit that needed a new section plan, fit the existing page to the current plan.
+
+    A new build gets its own final model review, so final_review_done from the
+    previous build is cleared; an edit of a reviewed page ({regeneration} queued)
+    only needs the local checks and keeps it.
+
+    Sections whose plan entry is (nearly) unchanged and that no edited field feeds
+    keep their HTML; the others are emptied so the builder regenerates only them.
+    Running here rather than after Section_Planner also covers plans replayed from
+    the response cache, which skip the planner's after callbacks.
+    """
+    state = callback_context.state
+    html = state.get("generated_code")
+    dependencies = state.get("page_dependencies")
+    regeneration = state.get("regeneration")
+    if not regeneration and state.get("final_review_done"):
+        state["final_review_done"] = False
+    if state.get("build_complete"):
+        state["build_complete"] = False
+    if not html or not dependencies or not regeneration or not regeneration["replan"]:
+        return None
+
+    section_plan = parse_section_plan(state.get("section_plan"))
+    slots = section_slots(section_plan)
+    edited = {
+        target for key in regeneration["keys"] for target in dependencies["keys"].get(key, ())
+        if target not in (HEAD, PLAN)
+    }
+    contents = list_slots(html)
+    kept = {
+        slug: contents[slug] for name, slug in slots.items()
+        if contents.get(slug) and slug not in edited and slug in dependencies["plan"]
+        and _similarity(dependencies["plan"][slug], section_plan[name]) >= KEEP_SECTION_SIMILARITY
+    }
+
+    html = fill_slots(set_slots(html, slots.values()), kept)
+    state["generated_code"] = html
+    state["page_index"] = build_page_index(html)
+    # Emptied sections are picked up as pending; head fields still queued stay queued
+    state["regeneration"] = {**regeneration, "sections": [], "replan": False}
+    return None
@@ -0,0 +1,214 @@
+import json
+import re
+from typing import Any, Dict, Optional
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+
+# Every section of the page lives between a pair of marker comments:
+#   <!-- section:<slot id> --> ... <!-- /section:<slot id> -->
+# The markers let fragments be generated independently and stitched in place.
+SLOT_PATTERN = re.compile(
+    r"(<!--\s*section:(?P<slot>[\w-]+)\s*-->)(?P<content>.*?)(<!--\s*/section:(?P=slot)\s*-->)",
+    re.DOTALL
+)
+# First placeholder mentioned in an instruction, e.g. "... inside its <!-- section:hero --> placeholder"
+TARGET_SLOT_PATTERN = re.compile(r"<!--\s*section:([\w-]+)\s*-->")
+CODE_FENCE_PATTERN = re.compile(r"```(?:html|json|HTML|JSON)?\s*\n?(.*?)```", re.DOTALL)
+TRAILING_SCRIPT_PATTERN = re.compile(r"<script[^>]*>(?:(?!<script).)*?</script>\s*</body>", re.DOTALL | re.IGNORECASE)
+
+
+def strip_code_fence(text: Optional[str]) -> str:
+    """ Return the contents of the first markdown code block in text, or the text itself. """
+    if not text:
+        return ""
+    match = CODE_FENCE_PATTERN.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def parse_section_plan(value: Any) -> Dict[str, Any]:
+    """ Turn the Section_Planner output (a dict, or JSON text possibly inside a code block) into a dict. """
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return {}
+
+    text = strip_code_fence(value)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        plan = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    return plan if isinstance(plan, dict) else {}
+
+
+def slot_id(section_name: str) -> str:
+    """ Stable, HTML-safe identifier for a section name, e.g. 'About Us' -> 'about-us'. """
+    slug = re.sub(r"[^a-z0-9]+", "-", str(section_name).lower()).strip("-")
+    return slug or "section"
+
+
+def section_slots(section_plan: Dict[str, Any]) -> Dict[str, str]:
+    """ Map each section name of the plan to its slot id, keeping ids unique. """
+    slots = {}
+    used = set()
+    for name in section_plan:
+        slug = base = slot_id(name)
+        counter = 2
+        while slug in used:
+            slug = f"{base}-{counter}"
+            counter += 1
+        used.add(slug)
+        slots[name] = slug
+    return slots
+
+
+def empty_slot(slug: str) -> str:
+    """ Placeholder markup for a section that has not been generated yet. """
+    return f"<!-- section:{slug} --><!-- /section:{slug} -->"
+
+
+def list_slots(html: Optional[str]) -> Dict[str, str]:
+    """ Slot id -> current inner HTML of every slot in the document, in document order. """
+    if not html:
+        return {}
+    return {match.group("slot"): match.group("content").strip() for match in SLOT_PATTERN.finditer(html)}
+
+
+def ensure_slots(html: str, slugs) -> str:
+    """ Add empty slots for any slug missing from the document, before the closing <script> block or </body>. """
+    present = set(list_slots(html))
+    missing = [slug for slug in slugs if slug not in present]
+    if not missing:
+        return html
+
+    placeholders = "\n".join(empty_slot(slug) for slug in missing) + "\n"
+    match = TRAILING_SCRIPT_PATTERN.search(html)
+    if match:
+        return html[:match.start()] + placeholders + html[match.start():]
+    body_end = html.lower().rfind("</body>")
+    if body_end != -1:
+        return html[:body_end] + placeholders + html[body_end:]
+    return html + "\n" + placeholders
+
+
+def set_slots(html: str, slugs) -> str:
+    """
+    Make the document's slots exactly `slugs`, in that order and empty, placed where
+    its first slot was. Used to fit a stored skeleton to a different section plan.
+    """
+    first = SLOT_PATTERN.search(html)
+    if not first:
+        return ensure_slots(html, slugs)
+
+    line_start = html.rfind("\n", 0, first.start()) + 1
+    indent = html[line_start:first.start()] if not html[line_start:first.start()].strip() else ""
+    placeholders = f"\n{indent}".join(empty_slot(slug) for slug in slugs)
+    marker = "\x00slots\x00"
+    html = html[:first.start()] + marker + html[first.end():]
+    # Drop every other slot together with the line it sat on
+    html = re.sub(r"[ \t]*" + SLOT_PATTERN.pattern + r"[ \t]*\n?", "", html, flags=re.DOTALL)
+    return html.replace(marker, placeholders, 1)
+
+
+def fill_slots(html: str, fragments: Dict[str, str]) -> str:
+    """ Replace the contents of each slot named in fragments, leaving every other slot untouched. """
+    def replace(match):
+        slug = match.group("slot")
+        if slug not in fragments:
+            return match.group(0)
+        return f"{match.group(1)}\n{fragments[slug].strip()}\n{match.group(4)}"
+
+    return SLOT_PATTERN.sub(replace, html)
+
+
+def skeleton(html: Optional[str]) -> str:
+    """ The document with every slot emptied: head, layout and placeholders only. """
+    if not html:
+        return ""
+    return SLOT_PATTERN.sub(lambda match: f"{match.group(1)}{match.group(4)}", html)
+
+
+def build_page_index(html: Optional[str]) -> Dict[str, Any]:
+    """ Compact description of the document kept in state for Creator: its skeleton and which slots are filled. """
+    slots = list_slots(html)
+    return {
+        "has_document": bool(html and html.strip()),
+        "skeleton": skeleton(html),
+        "slots": {slug: "filled" if content else "empty" for slug, content in slots.items()}
+    }
+
+
+def is_full_document(text: str) -> bool:
+    """ True when text is a whole HTML page rather than section fragments. """
+    head = text.lstrip()[:200].lower()
+    return head.startswith("<!doctype") or head.startswith("<html")
+
+
+def apply_patch(html: Optional[str], reply: str, target_slot: Optional[str] = None) -> str:
+    """
+    Apply a Creator reply to the document.
+
+    The reply is either a full document, or one or more section blocks wrapped in
+    their placeholder comments. A full document keeps the contents of slots it
+    left empty, so a head/layout fix never drops already generated sections. A
+    bare fragment without markers goes into `target_slot`.
+    """
+    reply = strip_code_fence(reply)
+    if not reply:
+        return html or ""
+
+    if is_full_document(reply) or not html:
+        previous, replied = list_slots(html), list_slots(reply)
+        kept = {slug: content for slug, content in previous.items() if content and not replied.get(slug)}
+        return fill_slots(reply, kept) if kept else reply
+
+    blocks = list_slots(reply)
+    if not blocks and target_slot:
+        blocks = {target_slot: reply}
+    if not blocks:
+        return html
+
+    html = ensure_slots(html, blocks.keys())
+    return fill_slots(html, blocks)
+
+
+def apply_creator_output(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    after_agent_callback for Creator: merge its reply ({creator_output}) into {generated_code}
+    and refresh {page_index}, so only the changed sections travel through the model.
+    """
+    reply = callback_context.state.get("creator_output")
+    if not isinstance(reply, str) or not reply.strip():
+        return None
+
+    # A bare fragment belongs to the section the instruction pointed at
+    instruct = callback_context.state.get("instruct") or ""
+    target = TARGET_SLOT_PATTERN.search(instruct) if isinstance(instruct, str) else None
+
+    html = apply_patch(callback_context.state.get("generated_code"), reply, target.group(1) if target else None)
+    callback_context.state["generated_code"] = html
+    callback_context.state["page_index"] = build_page_index(html)
+    callback_context.state["creator_output"] = None
+    return None
+
+
+def skip_idle_round(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    before_agent_callback for Creator: once the page exists, Creator only acts on {instruct}.
+    With nothing to act on (the first loop round of a follow-up turn), skip the model.
+    """
+    if callback_context.state.get("generated_code") and not callback_context.state.get("instruct"):
+        return types.Content(role="model", parts=[types.Part(text="No pending instruction; the page is unchanged.")])
+    return None
+
+
+def close_build(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    after_agent_callback for Webpage_Builder: the build is over, so whatever is left in
+    {instruct} (such as Determiner's closing remark) is spent and must not reach Creator next turn.
+    """
+    if callback_context.state.get("instruct"):
+        callback_context.state["instruct"] = None
+    return None
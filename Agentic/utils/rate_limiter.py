@@ -0,0 +1,237 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import AsyncGenerator, Dict, List, Optional
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.models.google_llm import Gemini
+from google.genai import errors
+from .metrics import RATE_LIMIT_RETRIES, RATE_LIMIT_WAIT
+
+INTERACTIVE, BACKGROUND = 0, 1
+# Priority of the model calls made by the current request; lower values are served first
+REQUEST_PRIORITY: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+# Provider errors worth retrying: quota, overload and transient server errors
+RETRYABLE_CODES = {429, 500, 503}
+
+logger = logging.getLogger("orion_logs")
+
+
+class QuotaExceededError(Exception):
+    """ Raised when a model call could not get through the rate limits or the provider quota in time. """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def request_priority(priority: int):
+    """ Run the enclosed agent turn at the given priority (INTERACTIVE or BACKGROUND). """
+    token = REQUEST_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        REQUEST_PRIORITY.reset(token)
+
+
+class TokenBucket:
+    """ Classic token bucket refilled continuously at `per_minute`, holding at most one minute's worth. """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """ Seconds until `amount` can be taken (0 when it can be taken now). """
+        if not self.per_minute:
+            return 0.0
+        self._refill()
+        # A request larger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) * 60 / self.per_minute)
+
+    def take(self, amount: float):
+        if self.per_minute:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        """ Correct an estimate after the fact; a negative amount leaves the bucket in debt. """
+        if self.per_minute:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits shared by every call to one provider resource.
+
+    Callers wait in priority order (then arrival order): only the head of the line
+    may take from the buckets, so interactive turns get ahead of background builds
+    queued behind the same limit. A provider quota error pauses everyone for the
+    backoff delay, so the whole process slows down instead of hammering the quota.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._waiting: List[tuple] = []
+        self._sequence = itertools.count()
+        self._changed = asyncio.Condition()
+        self._paused_until = 0.0
+
+    def _wait_time(self, tokens: float) -> float:
+        return max(self._paused_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    async def acquire(self, tokens: float = 0, priority: int = INTERACTIVE, max_wait: Optional[float] = None):
+        """ Wait for a request slot and `tokens` tokens. Raises QuotaExceededError after `max_wait` seconds. """
+        entry = (priority, next(self._sequence))
+        started = time.monotonic()
+        async with self._changed:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    wait = self._wait_time(tokens) if self._waiting[0] == entry else None
+                    if wait is not None and wait <= 0:
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        break
+                    if max_wait is not None:
+                        remaining = max_wait - (time.monotonic() - started)
+                        if remaining <= 0 or (wait is not None and wait > remaining):
+                            raise QuotaExceededError(
+                                f"Rate limit '{self.name}' is saturated; try again later.",
+                                retry_after=max(1, round(wait if wait is not None else max_wait))
+                            )
+                        wait = remaining if wait is None else wait
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._changed.notify_all()
+        RATE_LIMIT_WAIT.labels(self.name).observe(time.monotonic() - started)
+
+    def settle(self, estimated: float, actual: float):
+        """ Replace a call's estimated token count by its real usage. """
+        self.tokens.give_back(estimated - actual)
+
+    def pause(self, seconds: float):
+        """ Hold every caller back for `seconds`, e.g. after the provider reported its quota exhausted. """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "waiting": len(self._waiting),
+            "requests_available": round(self.requests.level, 2),
+            "tokens_available": round(self.tokens.level, 2),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2)
+        }
+
+
+# Limiters by resource name ("model", "search"), exposed through the /cache/stats route
+RATE_LIMITERS: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """ Shared limiter for a resource: "model" uses MODEL_RPM/MODEL_TPM, "search" uses SEARCH_RPM. """
+    if name not in RATE_LIMITERS:
+        if name == "search":
+            RATE_LIMITERS[name] = RateLimiter(name, rpm=float(os.getenv("SEARCH_RPM", 60)))
+        else:
+            RATE_LIMITERS[name] = RateLimiter(
+                name, rpm=float(os.getenv("MODEL_RPM", 150)), tpm=float(os.getenv("MODEL_TPM", 1000000))
+            )
+    return RATE_LIMITERS[name]
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, float]]:
+    return {name: limiter.stats() for name, limiter in RATE_LIMITERS.items()}
+
+
+def estimate_request_tokens(llm_request: LlmRequest) -> int:
+    """ Prompt tokens (4 characters per token) plus the expected completion size. """
+    chars = 0
+    if llm_request.config and isinstance(llm_request.config.system_instruction, str):
+        chars += len(llm_request.config.system_instruction)
+    for content in llm_request.contents or []:
+        for part in content.parts or []:
+            chars += len(part.text or "")
+    return chars // 4 + int(os.getenv("RATE_LIMIT_OUTPUT_ESTIMATE", 1000))
+
+
+def _uses_search(llm_request: LlmRequest) -> bool:
+    tools = llm_request.config.tools if llm_request.config and llm_request.config.tools else []
+    return any(getattr(tool, "google_search", None) or getattr(tool, "google_search_retrieval", None) for tool in tools)
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 30.0) -> float:
+    """ Exponential backoff with full jitter. """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateLimitedGemini(Gemini):
+    """
+    Gemini client whose calls go through the shared rate limiters.
+
+    Every call waits for the "model" limiter (one request plus its estimated
+    tokens, settled against the real usage afterwards); calls carrying the
+    google_search tool also wait for the "search" limiter. Quota, overload and
+    server errors are retried with jittered exponential backoff as long as nothing
+    was streamed yet; when the retries or RATE_LIMIT_MAX_WAIT run out,
+    QuotaExceededError is raised.
+    """
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        limiter = get_rate_limiter("model")
+        priority = REQUEST_PRIORITY.get()
+        max_wait = float(os.getenv("RATE_LIMIT_MAX_WAIT", 60))
+        retries = int(os.getenv("RATE_LIMIT_RETRIES", 4))
+        base_delay = float(os.getenv("RATE_LIMIT_BACKOFF", 1.0))
+        estimate = estimate_request_tokens(llm_request)
+
+        for attempt in range(retries + 1):
+            await limiter.acquire(estimate, priority, max_wait)
+            if _uses_search(llm_request):
+                await get_rate_limiter("search").acquire(0, priority, max_wait)
+
+            streamed = False
+            try:
+                async for response in super().generate_content_async(llm_request, stream):
+                    streamed = True
+                    if response.usage_metadata and not response.partial:
+                        limiter.settle(estimate, response.usage_metadata.total_token_count or estimate)
+                    yield response
+                return
+            except errors.APIError as e:
+                if e.code not in RETRYABLE_CODES or streamed:
+                    raise
+                RATE_LIMIT_RETRIES.labels(str(e.code)).inc()
+                # A rejected call used no tokens
+                limiter.settle(estimate, 0)
+                if attempt == retries:
+                    raise QuotaExceededError(
+                        f"The model provider is over quota or unavailable ({e.code}); try again later.",
+                        retry_after=max(1, round(base_delay * 2 ** retries))
+                    ) from e
+                delay = backoff_delay(attempt, base_delay)
+                if e.code == 429:
+                    limiter.pause(delay)
+                logger.warning(f"Model call failed with {e.code}; retry {attempt + 1}/{retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
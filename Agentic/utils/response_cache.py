@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(value: Any) -> Any:
+    """ Normalize values so that insignificant differences (spacing, key order) hash the same. """
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", value).strip()
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items() if item not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def canonical_key(fields: Dict[str, Any]) -> str:
+    """ Return a content hash of the given fields, independent of key order and whitespace. """
+    canonical = json.dumps(_normalize(fields), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU cache with a time-to-live, optionally backed by a directory of JSON files.
+
+    The in-memory tier holds at most `max_entries` values. When `disk_dir` is set,
+    every value is also written there so it survives restarts and can be shared
+    between workers; a disk hit is promoted back into memory.
+    """
+
+    def __init__(self, name: str, max_entries: int = 256, ttl: float = 86400, disk_dir: Optional[str] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        # key -> (value, creation time)
+        self._entries: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return record["value"], record["created"]
+
+    def _write_disk(self, key: str, value: Any, created: float):
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"created": created, "value": value}, file, default=str)
+        os.replace(temp_path, path)
+
+    def _remember(self, key: str, value: Any, created: float):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """ Return the cached value for key, or None on a miss or expired entry. """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, created = entry
+            if now - created <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self.disk_dir:
+            record = await asyncio.to_thread(self._read_disk, key)
+            if record is not None and now - record[1] <= self.ttl:
+                self._remember(key, record[0], record[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return record[0]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        """ Store value under key in memory and, if configured, on disk. """
+        created = time.time()
+        self._remember(key, value, created)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value, created)
+
+    def stats(self) -> Dict[str, Any]:
+        """ Hit/miss counters and current size. """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "disk": bool(self.disk_dir)
+        }
+
+
+# Caches by stage name, exposed through the /cache/stats route
+RESPONSE_CACHES: Dict[str, ResponseCache] = {}
+
+
+def get_response_cache(name: str) -> ResponseCache:
+    """ Return the shared cache for a stage, creating it from the RESPONSE_CACHE_* settings. """
+    if name not in RESPONSE_CACHES:
+        RESPONSE_CACHES[name] = ResponseCache(
+            name=name,
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", 256)),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", 86400)),
+            disk_dir=os.getenv("RESPONSE_CACHE_DIR") or None
+        )
+    return RESPONSE_CACHES[name]
+
+
+def response_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """ Stats of every stage cache. """
+    return {name: cache.stats() for name, cache in RESPONSE_CACHES.items()}
+
+
+def make_stage_cache_callbacks(
+    stage: str,
+    output_key: str,
+    config_fields: Optional[Iterable[str]] = None,
+    input_keys: Optional[Iterable[str]] = None
+):
+    """
+    Build (before_agent_callback, after_agent_callback) caching a stage's output.
+
+    The cache key is a canonical hash of `problem_config`, restricted to
+    `config_fields` when given, and of the other state entries the stage reads
+    (`input_keys`), so a change in any of its inputs misses the cache. On a hit
+    the before callback writes the cached value to `output_key` and returns it
+    as the agent's reply, so the model is never called. On a miss the after
+    callback stores whatever the agent wrote to `output_key`. Set
+    RESPONSE_CACHE_ENABLED=0 to turn caching off.
+    """
+    fields = list(config_fields) if config_fields else None
+    inputs = list(input_keys) if input_keys else []
+
+    def cache_key(callback_context: CallbackContext) -> Optional[str]:
+        if os.getenv("RESPONSE_CACHE_ENABLED", "1") == "0":
+            return None
+        problem_config = callback_context.state.get("problem_config") or {}
+        relevant = {key: problem_config.get(key) for key in fields} if fields else dict(problem_config)
+        # Nothing gathered yet: the output would not be worth reusing
+        if not any(relevant.values()):
+            return None
+        return canonical_key({
+            "stage": stage,
+            "problem_config": relevant,
+            "inputs": {key: callback_context.state.get(key) for key in inputs}
+        })
+
+    async def before_agent_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+        key = cache_key(callback_context)
+        if key is None:
+            return None
+
+        cached = await get_response_cache(stage).get(key)
+        if cached is None:
+            return None
+        # The session already holds this output: the agent is being asked something
+        # else (a follow-up turn or a hand-off), so let the model answer it
+        if callback_context.state.get(output_key) == cached:
+            return None
+
+        callback_context.state[output_key] = cached
+        text = cached if isinstance(cached, str) else json.dumps(cached)
+        return types.Content(role="model", parts=[types.Part(text=text)])
+
+    async def after_agent_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+        key = cache_key(callback_context)
+        output = callback_context.state.get(output_key)
+        if key is not None and output:
+            await get_response_cache(stage).set(key, output)
+        return None
+
+    return before_agent_callback, after_agent_callback
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import Optional
+from weakref import WeakValueDictionary
+from .agent_utils import create_session, retrieve_session
+from .context_compaction import ContextCompactor
+from .state_template import build_initial_state
+
+class SessionManager:
+    """
+    Hands out one ADK session per (user_id, session_id) pair.
+
+    Sessions are created lazily on the first request of a client. Every session
+    gets its own asyncio.Lock so requests of one conversation run one after the
+    other while different conversations run fully in parallel. With a
+    `compactor`, an existing session's history is compacted before the next
+    turn whenever it has grown past the token budget.
+    """
+
+    def __init__(self, session_service, app_name: str, logging: logging.Logger, compactor: Optional[ContextCompactor] = None):
+        self.session_service = session_service
+        self.app_name = app_name
+        self.logging = logging
+        self.compactor = compactor
+        # Locks disappear on their own once no request holds a reference to them.
+        self._locks: "WeakValueDictionary[tuple[str, str], asyncio.Lock]" = WeakValueDictionary()
+
+    def lock(self, user_id: str, session_id: str) -> asyncio.Lock:
+        """ Return the lock guarding the given session, creating it if needed. """
+        key = (user_id, session_id)
+        session_lock = self._locks.get(key)
+        if session_lock is None:
+            session_lock = asyncio.Lock()
+            self._locks[key] = session_lock
+        return session_lock
+
+    async def ensure_session(self, user_id: str, session_id: str):
+        """ Retrieve (and compact, if needed) the session, creating it from the state template if it does not exist yet. """
+        session = await retrieve_session(
+            session_service=self.session_service,
+            app_name=self.app_name,
+            user_id=user_id,
+            session_id=session_id,
+            logging=self.logging
+        )
+
+        if session and self.compactor:
+            await self.compactor.maybe_compact(session)
+
+        if not session:
+            session = await create_session(
+                session_service=self.session_service,
+                app_name=self.app_name,
+                user_id=user_id,
+                session_id=session_id,
+                state=build_initial_state(),
+                logging=self.logging
+            )
+
+        return session
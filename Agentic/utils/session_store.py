@@ -0,0 +1,478 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import queue
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session, State
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name    TEXT NOT NULL,
+    user_id     TEXT NOT NULL,
+    id          TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_update_time ON sessions (update_time);
+CREATE TABLE IF NOT EXISTS events (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name   TEXT NOT NULL,
+    user_id    TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_session ON events (app_name, user_id, session_id, seq);
+"""
+
+
+class SqliteConnectionPool:
+    """ A fixed-size pool of SQLite connections opened in WAL mode and shared across threads. """
+
+    def __init__(self, db_path: str, size: int = 4, schema: str = SCHEMA):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connections: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+        for _ in range(size):
+            connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=30000")
+            self._connections.put(connection)
+
+        with self.connection() as connection:
+            connection.executescript(schema)
+
+    @contextmanager
+    def connection(self):
+        """ Borrow a connection, blocking until one is free. """
+        connection = self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        """ Borrow a connection and run the block inside one write transaction. """
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self):
+        """ Close every pooled connection. """
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+class SqliteSessionService(BaseSessionService):
+    """
+    Session service persisting sessions and events in SQLite (WAL mode).
+
+    Several uvicorn workers can share one database file. Each process keeps a
+    bounded LRU cache of recently used sessions in front of the database. A
+    cached copy is only reused while its update time still matches the row, so
+    writes from other workers are picked up. Appending an event checks the same
+    update time inside its transaction: when another worker wrote the session
+    since the caller read it, the event's state delta is applied to the stored
+    state instead of overwriting it, and the caller's session is reloaded with
+    the result. Cache entries expire after `cache_ttl` idle seconds. Sessions
+    untouched for `idle_ttl` seconds are purged from the database, checked at
+    most every `purge_interval` seconds on any session access.
+
+    'app:' and 'user:' prefixed state keys are stored with the session they were
+    written in; they are not shared across sessions.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        logging: logging.Logger,
+        pool_size: int = 4,
+        cache_size: int = 256,
+        cache_ttl: float = 900,
+        idle_ttl: float = 86400,
+        purge_interval: float = 300
+    ):
+        self.logging = logging
+        self.pool = SqliteConnectionPool(db_path, size=pool_size)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.idle_ttl = idle_ttl
+        self.purge_interval = purge_interval
+        # (app_name, user_id, session_id) -> (session, last access time)
+        self._cache: "OrderedDict[tuple[str, str, str], tuple[Session, float]]" = OrderedDict()
+        self._last_purge = 0.0
+
+    # ------------------ Cache helpers ------------------
+    def _cache_get(self, key: tuple) -> Optional[Session]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        session, last_access = entry
+        if time.time() - last_access > self.cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache[key] = (session, time.time())
+        self._cache.move_to_end(key)
+        return session
+
+    def _cache_put(self, key: tuple, session: Session):
+        self._cache[key] = (session, time.time())
+        self._cache.move_to_end(key)
+        self._evict_expired()
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.cache_ttl
+        # Entries are ordered by last access, so expired ones sit at the front
+        while self._cache:
+            key, (_, last_access) = next(iter(self._cache.items()))
+            if last_access >= cutoff:
+                break
+            del self._cache[key]
+
+    # ------------------ Database helpers (run in worker threads) ------------------
+    def _insert_session(self, session: Session):
+        with self.pool.transaction() as connection:
+            connection.execute(
+                "INSERT INTO sessions (app_name, user_id, id, state, update_time) VALUES (?, ?, ?, ?, ?)",
+                (session.app_name, session.user_id, session.id, json.dumps(session.state, default=str), session.last_update_time)
+            )
+
+    def _select_update_time(self, app_name: str, user_id: str, session_id: str) -> Optional[float]:
+        with self.pool.connection() as connection:
+            row = connection.execute(
+                "SELECT update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _select_session(self, app_name: str, user_id: str, session_id: str) -> Optional[Session]:
+        with self.pool.connection() as connection:
+            row = connection.execute(
+                "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id)
+            ).fetchone()
+            if row is None:
+                return None
+            event_rows = connection.execute(
+                "SELECT event FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq",
+                (app_name, user_id, session_id)
+            ).fetchall()
+
+        return Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=json.loads(row[0]),
+            events=[Event.model_validate_json(event_row[0]) for event_row in event_rows],
+            last_update_time=row[1]
+        )
+
+    def _select_sessions(self, app_name: str, user_id: str) -> list:
+        with self.pool.connection() as connection:
+            rows = connection.execute(
+                "SELECT id, state, update_time FROM sessions WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id)
+            ).fetchall()
+        return [
+            Session(id=row[0], app_name=app_name, user_id=user_id, state=json.loads(row[1]), last_update_time=row[2])
+            for row in rows
+        ]
+
+    def _delete_session_rows(self, app_name: str, user_id: str, session_id: str):
+        with self.pool.transaction() as connection:
+            connection.execute(
+                "DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (app_name, user_id, session_id)
+            )
+            connection.execute(
+                "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id)
+            )
+
+    def _insert_event(self, session: Session, event: Event, read_update_time: float) -> Optional[Dict[str, Any]]:
+        """
+        Store the event and the session's new state. Returns the merged state when the
+        row changed since the caller read it at `read_update_time` (another worker wrote it).
+        """
+        with self.pool.transaction() as connection:
+            row = connection.execute(
+                "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (session.app_name, session.user_id, session.id)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Session {session.id} does not exist (it may have been purged)")
+
+            merged = None
+            state = session.state
+            if row[1] != read_update_time:
+                # Stale copy: apply only this event's changes on top of what the other worker stored
+                merged = json.loads(row[0])
+                for key, value in ((event.actions and event.actions.state_delta) or {}).items():
+                    if not key.startswith(State.TEMP_PREFIX):
+                        merged[key] = value
+                state = merged
+
+            connection.execute(
+                "INSERT INTO events (app_name, user_id, session_id, event) VALUES (?, ?, ?, ?)",
+                (session.app_name, session.user_id, session.id, event.model_dump_json(exclude_none=True))
+            )
+            if merged is not None or (event.actions and event.actions.state_delta):
+                connection.execute(
+                    "UPDATE sessions SET state = ?, update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                    (json.dumps(state, default=str), session.last_update_time, session.app_name, session.user_id, session.id)
+                )
+            else:
+                connection.execute(
+                    "UPDATE sessions SET update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                    (session.last_update_time, session.app_name, session.user_id, session.id)
+                )
+        return merged
+
+    def _replace_event_rows(self, session: Session, events: List[Event], update_time: float):
+        with self.pool.transaction() as connection:
+            connection.execute(
+                "DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (session.app_name, session.user_id, session.id)
+            )
+            connection.executemany(
+                "INSERT INTO events (app_name, user_id, session_id, event) VALUES (?, ?, ?, ?)",
+                [(session.app_name, session.user_id, session.id, event.model_dump_json(exclude_none=True)) for event in events]
+            )
+            connection.execute(
+                "UPDATE sessions SET update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                (update_time, session.app_name, session.user_id, session.id)
+            )
+
+    def _delete_idle_rows(self, cutoff: float) -> int:
+        with self.pool.transaction() as connection:
+            connection.execute(
+                "DELETE FROM events WHERE EXISTS ("
+                " SELECT 1 FROM sessions s WHERE s.app_name = events.app_name AND s.user_id = events.user_id"
+                " AND s.id = events.session_id AND s.update_time < ?)",
+                (cutoff,)
+            )
+            return connection.execute("DELETE FROM sessions WHERE update_time < ?", (cutoff,)).rowcount
+
+    # ------------------ BaseSessionService API ------------------
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None
+    ) -> Session:
+        await self._maybe_purge_idle_sessions()
+
+        session = Session(
+            id=session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4()),
+            app_name=app_name,
+            user_id=user_id,
+            state=copy.deepcopy(state) if state else {},
+            last_update_time=time.time()
+        )
+        await asyncio.to_thread(self._insert_session, session)
+        self._cache_put((app_name, user_id, session.id), copy.deepcopy(session))
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None
+    ) -> Optional[Session]:
+        await self._maybe_purge_idle_sessions()
+        key = (app_name, user_id, session_id)
+        cached = self._cache_get(key)
+
+        update_time = await asyncio.to_thread(self._select_update_time, app_name, user_id, session_id)
+        if update_time is None:
+            self._cache.pop(key, None)
+            return None
+
+        if cached is None or cached.last_update_time != update_time:
+            # Missing or written to by another worker since it was cached
+            cached = await asyncio.to_thread(self._select_session, app_name, user_id, session_id)
+            if cached is None:
+                return None
+            self._cache_put(key, cached)
+
+        session = copy.deepcopy(cached)
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [event for event in session.events if event.timestamp >= config.after_timestamp]
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        sessions = await asyncio.to_thread(self._select_sessions, app_name, user_id)
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._cache.pop((app_name, user_id, session_id), None)
+        await asyncio.to_thread(self._delete_session_rows, app_name, user_id, session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+
+        key = (session.app_name, session.user_id, session.id)
+        cached = self._cache_get(key)
+        previous_update_time = session.last_update_time
+
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        merged = await asyncio.to_thread(self._insert_event, session, event, previous_update_time)
+        if merged is not None:
+            self.logging.warning(f"Session {session.id} was written by another worker; merged this event into the stored state")
+            session.state.clear()
+            session.state.update(merged)
+            self._cache.pop(key, None)
+        # Keep the cached copy in step when it mirrored the caller's session
+        elif cached is not None and cached.last_update_time == previous_update_time:
+            await super().append_event(session=cached, event=event)
+            cached.last_update_time = event.timestamp
+        else:
+            self._cache.pop(key, None)
+        return event
+
+    async def replace_events(self, session: Session, events: List[Event]) -> None:
+        """ Overwrite the stored event history of a session (used by context compaction). State is untouched. """
+        update_time = time.time()
+        await asyncio.to_thread(self._replace_event_rows, session, events, update_time)
+        session.events = list(events)
+        session.last_update_time = update_time
+        self._cache_put((session.app_name, session.user_id, session.id), copy.deepcopy(session))
+
+    # ------------------ Idle eviction ------------------
+    async def purge_idle_sessions(self) -> int:
+        """ Delete sessions that have been idle for longer than idle_ttl. Returns the number removed. """
+        self._last_purge = time.time()
+        cutoff = self._last_purge - self.idle_ttl
+        removed = await asyncio.to_thread(self._delete_idle_rows, cutoff)
+        for key in [key for key, (session, _) in self._cache.items() if session.last_update_time < cutoff]:
+            del self._cache[key]
+        if removed:
+            self.logging.info(f"Purged {removed} idle session(s) older than {self.idle_ttl}s")
+        return removed
+
+    async def _maybe_purge_idle_sessions(self):
+        if time.time() - self._last_purge >= self.purge_interval:
+            await self.purge_idle_sessions()
+
+    def close(self):
+        """ Release the pooled connections. """
+        self._cache.clear()
+        self.pool.close()
+
+
+class InMemorySessionStore(InMemorySessionService):
+    """
+    ADK's in-memory session service, bounded: sessions idle for `idle_ttl` seconds
+    are dropped, and past `max_sessions` the least recently used ones go first.
+    Also adds replace_events, so context compaction works on both backends.
+    """
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 86400):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # (app_name, user_id, session_id) -> last access time, least recently used first
+        self._access: "OrderedDict[tuple[str, str, str], float]" = OrderedDict()
+
+    def _touch(self, app_name: str, user_id: str, session_id: str):
+        key = (app_name, user_id, session_id)
+        self._access[key] = time.time()
+        self._access.move_to_end(key)
+        cutoff = time.time() - self.idle_ttl
+        while self._access:
+            (oldest, last_access) = next(iter(self._access.items()))
+            if last_access >= cutoff and len(self._access) <= self.max_sessions:
+                break
+            del self._access[oldest]
+            self.sessions.get(oldest[0], {}).get(oldest[1], {}).pop(oldest[2], None)
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session = await super().create_session(app_name=app_name, user_id=user_id, state=state, session_id=session_id)
+        self._touch(app_name, user_id, session.id)
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        session = await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+        if session is not None:
+            self._touch(app_name, user_id, session_id)
+        return session
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        if (session.app_name, session.user_id, session.id) in self._access:
+            self._touch(session.app_name, session.user_id, session.id)
+        return event
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._access.pop((app_name, user_id, session_id), None)
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def replace_events(self, session: Session, events: List[Event]) -> None:
+        """ Overwrite the stored event history of a session. State is untouched. """
+        stored = self.sessions.get(session.app_name, {}).get(session.user_id, {}).get(session.id)
+        if stored is not None:
+            stored.events = copy.deepcopy(list(events))
+        session.events = list(events)
+
+
+def build_session_service(logging: logging.Logger) -> BaseSessionService:
+    """
+    Create the session service selected by the SESSION_BACKEND environment variable.
+
+    "memory" (default) keeps sessions in process; "sqlite" persists them in
+    SESSION_DB_PATH so they survive restarts and can be shared by several workers.
+    """
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+
+    if backend == "memory":
+        logging.info("Using in-memory session service")
+        return InMemorySessionStore(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", 10000)),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL", 86400))
+        )
+
+    if backend == "sqlite":
+        db_path = os.getenv("SESSION_DB_PATH", os.path.join("data", "sessions.db"))
+        logging.info(f"Using SQLite session service at '{db_path}'")
+        return SqliteSessionService(
+            db_path=db_path,
+            logging=logging,
+            pool_size=int(os.getenv("SESSION_DB_POOL_SIZE", 4)),
+            cache_size=int(os.getenv("SESSION_CACHE_SIZE", 256)),
+            cache_ttl=float(os.getenv("SESSION_CACHE_TTL", 900)),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL", 86400))
+        )
+
+    raise ValueError(f"Unknown SESSION_BACKEND '{backend}'. Expected 'memory' or 'sqlite'.")
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import random
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+from google.adk.agents.readonly_context import ReadonlyContext
+from .metrics import PROMPT_TOKENS, stage_label
+from .page_document import SLOT_PATTERN
+
+# Same placeholder syntax as ADK's own state injection: {key} and {key?}
+PLACEHOLDER_PATTERN = re.compile(r"{+[^{}]*}+")
+# Values longer than this are written once; later placeholders refer back to it
+REPEAT_MIN_CHARS = 200
+
+logger = logging.getLogger("orion_logs")
+
+
+@dataclass(frozen=True)
+class FieldProjection:
+    """
+    How one state entry is written into an agent's instruction.
+
+    keys:       only these keys of a dict value are kept
+    drop_empty: leave out None, "" and empty containers (the state template's unset fields)
+    max_chars:  longer strings are cut there, with a note of how much was left out. Only for
+                fields an agent can do without the end of; None (the default) keeps them whole
+    transform:  fn(value, state) applied first, for projections that depend on other state
+    once:       write a long value at its first placeholder only, later ones refer back to it
+    """
+
+    keys: Optional[Tuple[str, ...]] = None
+    drop_empty: bool = True
+    max_chars: Optional[int] = None
+    transform: Optional[Callable[[Any, Any], Any]] = None
+    once: bool = True
+
+
+DEFAULT_PROJECTION = FieldProjection()
+# Passed through exactly as ADK would render it
+FULL = FieldProjection(drop_empty=False, once=False)
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _drop_empty(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _drop_empty(item) for key, item in value.items() if not _is_empty(item)}
+    if isinstance(value, list):
+        return [_drop_empty(item) for item in value if not _is_empty(item)]
+    return value
+
+
+def truncate(text: str, max_chars: int) -> str:
+    return f"{text[:max_chars]}... [+{len(text) - max_chars} chars]"
+
+
+def page_around_findings(html: Any, state) -> Any:
+    """
+    Transform for generated_code: when {validation_report} has located errors, only the
+    sections they fall in are kept whole; the other filled sections are replaced by a
+    one-line note. The skeleton around the sections is always kept, and without
+    located errors (the final review) the whole page is.
+    """
+    report = state.get("validation_report") or {}
+    lines = {
+        finding["line"] for finding in report.get("findings") or []
+        if finding.get("severity") == "error" and finding.get("line")
+    }
+    if not isinstance(html, str) or not lines:
+        return html
+
+    def focus(match):
+        content = match.group("content").strip()
+        first = html.count("\n", 0, match.start()) + 1
+        last = first + match.group(0).count("\n")
+        if not content or any(first <= line <= last for line in lines):
+            return match.group(0)
+        return f"{match.group(1)}[section '{match.group('slot')}' filled, {len(content)} chars, no errors]{match.group(4)}"
+
+    return SLOT_PATTERN.sub(focus, html)
+
+
+def project_value(value: Any, projection: FieldProjection, state) -> Any:
+    if projection.transform is not None:
+        value = projection.transform(value, state)
+    if projection.keys is not None and isinstance(value, dict):
+        value = {key: value.get(key) for key in projection.keys if key in value}
+    if projection.drop_empty:
+        value = _drop_empty(value)
+    if projection.max_chars is not None and isinstance(value, str) and len(value) > projection.max_chars:
+        value = truncate(value, projection.max_chars)
+    return value
+
+
+def render_value(value: Any, compact: bool) -> str:
+    """ ADK renders str(value); projected values are written as compact JSON instead. """
+    if value is None:
+        return ""
+    if not compact or isinstance(value, str):
+        return str(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def render_instruction(template: str, state, projections: Optional[Dict[str, FieldProjection]] = None) -> str:
+    """
+    Fill the {key} / {key?} placeholders of an instruction from state.
+
+    Without `projections` this is what ADK's state injection produces; with them,
+    every value goes through its FieldProjection (DEFAULT_PROJECTION when not listed).
+    """
+    written = set()
+
+    def replace(match):
+        name = match.group().lstrip("{").rstrip("}").strip()
+        optional = name.endswith("?")
+        name = name.removesuffix("?")
+        if not name.isidentifier():
+            return match.group()
+        if name not in state:
+            if optional:
+                return ""
+            raise KeyError(f"Context variable not found: `{name}`.")
+        value = state[name]
+        if projections is None:
+            return render_value(value, compact=False)
+        projection = projections.get(name, DEFAULT_PROJECTION)
+        rendered = render_value(project_value(value, projection, state), compact=projection is not FULL)
+        if projection.once and len(rendered) > REPEAT_MIN_CHARS:
+            if name in written:
+                return f"{name} (given above)"
+            written.add(name)
+        return rendered
+
+    return PLACEHOLDER_PATTERN.sub(replace, template)
+
+
+def projected_instruction(template: str, projections: Optional[Dict[str, FieldProjection]] = None):
+    """
+    InstructionProvider giving an agent only the state it needs.
+
+    Each placeholder of `template` is filled through its FieldProjection, so
+    unset fields are left out, dicts are cut down to the keys the agent uses and
+    long values repeated in the template are written once. Values are never cut
+    unless their projection says so (the page around the findings for the
+    Determiner, for instance), since a shortened {section_plan} or {instruct}
+    would silently lose sections. Set STATE_PROJECTION=0 to fill the template the
+    way ADK does.
+
+    Measuring the savings means rendering the instruction a second time without
+    projection, so it is only done for a sample of the calls
+    (STATE_PROJECTION_SAMPLE_RATE, default 0.05; 1 measures every call).
+    Measured calls are counted per stage (pagegenie_prompt_tokens_total) and logged.
+    """
+    projections = projections or {}
+
+    def provider(ctx: ReadonlyContext) -> str:
+        if os.getenv("STATE_PROJECTION", "1") == "0":
+            return render_instruction(template, ctx.state)
+        projected = render_instruction(template, ctx.state, projections)
+        sample_rate = float(os.getenv("STATE_PROJECTION_SAMPLE_RATE", 0.05))
+        if random.random() >= sample_rate:
+            return projected
+
+        full = render_instruction(template, ctx.state)
+        stage = stage_label(ctx.agent_name)
+        full_tokens, projected_tokens = len(full) // 4, len(projected) // 4
+        PROMPT_TOKENS.labels(stage, "full").inc(full_tokens)
+        PROMPT_TOKENS.labels(stage, "projected").inc(projected_tokens)
+        if full_tokens > projected_tokens:
+            logger.info(
+                f"State projection for {ctx.agent_name}: {full_tokens} -> {projected_tokens} instruction tokens "
+                f"({(full_tokens - projected_tokens) / full_tokens:.0%} saved)"
+            )
+        return projected
+
+    return provider
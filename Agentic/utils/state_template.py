@@ -0,0 +1,46 @@
+def build_initial_state() -> dict:
+    """ Build a fresh copy of the state every new session starts with. """
+    return {
+        "details":  {
+            "Page Purpose": None,
+            "Content": None,
+            "Layout & Styling": None,
+            "Images": None,
+            "External Resources": None,
+            "Simple Interactivity": None
+        },
+        "problem_config":   {
+            #Mandatory keys
+            "Page Title": None,
+            "Main Content": None,
+            "Page Structure": None,
+            "Navigation Menu": None,
+            "Primary Media": None,
+
+            #Optional keys
+            "Meta Description": None,
+            "Keywords": None,
+            "Favicon": None,
+            "Secondary Content": None,
+            "Footer Content": None,
+            "External Scripts": None,
+            "Custom Fonts": None,
+            "Accessibility Attributes": None,
+            "Social Sharing Metadata": None,
+            "Forms": None,
+            "Animations / Effects": None
+        },
+        "web_info_output": None,
+        "section_plan": {},
+        "generated_code": None,
+        "page_index": None,
+        "creator_output": None,
+        "instruct": None,
+        "validation_report": None,
+        "validation_failures": 0,
+        "final_review_done": False,
+        "build_complete": False,
+        "build_outcome": None,
+        "page_dependencies": None,
+        "regeneration": None
+    }
@@ -0,0 +1,365 @@
+import asyncio
+import html as html_lib
+import json
+import math
+import os
+import re
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+from tools.html_validator import validate_html
+from .metrics import TEMPLATE_LOOKUPS, TEMPLATES_LEARNED
+from .page_document import SLOT_PATTERN, build_page_index, list_slots, parse_section_plan, section_slots, set_slots
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "boilerplates.json")
+# problem_config/details fields describing what kind of page it is, with their weight in the vector
+FEATURE_WEIGHTS = {
+    "Page Purpose": 2.0,
+    "Page Structure": 2.0,
+    "Main Content": 1.0,
+    "Navigation Menu": 0.5,
+    "Layout & Styling": 0.5
+}
+SLOT_WEIGHT = 3.0
+DIMENSIONS = 1024
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "are", "our", "your", "you", "its", "has",
+    "page", "website", "site", "section", "sections", "web"
+}
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9]{2,}")
+TITLE_PATTERN = re.compile(r"(<title[^>]*>).*?(</title>)", re.DOTALL | re.IGNORECASE)
+META_DESCRIPTION_MAX_CHARS = 160
+# What a learned skeleton keeps of a page: a fixed head, and in <body> only these layout
+# elements with these attributes. Everything else (text, links, images, scripts, head
+# tags) could carry the content of the user the page was built for.
+SKELETON_HEAD = (
+    "<head>\n"
+    '  <meta charset="UTF-8">\n'
+    '  <meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+    "  <title>Page Title</title>\n"
+    '  <meta name="description" content="">\n'
+    '  <meta name="keywords" content="">\n'
+    "</head>"
+)
+LAYOUT_TAGS = {"main", "div", "section", "header", "footer", "nav", "aside", "article", "ul", "ol", "li"}
+LAYOUT_ATTRIBUTES = {"class", "style", "role"}
+BODY_PATTERN = re.compile(r"<body\b([^>]*)>(.*)</body\s*>", re.DOTALL | re.IGNORECASE)
+LANG_PATTERN = re.compile(r"<html\b[^>]*\blang=[\"']([\w-]{1,20})[\"']", re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r"([\w:-]+)\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+SLOT_MARKER_PATTERN = re.compile(r"<!--\s*/?section:[\w-]+\s*-->")
+# Raw blocks, comments, tags and text of a body, in document order
+BODY_TOKEN_PATTERN = re.compile(
+    r"(?P<raw><(?P<raw_tag>script|style|svg|template|noscript|iframe)\b.*?</(?P=raw_tag)\s*>)"
+    r"|(?P<comment><!--.*?-->)"
+    r"|(?P<tag></?(?P<name>[a-zA-Z][\w-]*)(?P<attributes>[^<>]*)>)"
+    r"|(?P<text>[^<]+)",
+    re.DOTALL | re.IGNORECASE
+)
+
+
+def feature_vector(features: Dict[str, Any], slots: List[str]) -> Dict[int, float]:
+    """
+    Hashed bag-of-words vector of a page description, L2-normalized.
+
+    Words of each FEATURE_WEIGHTS field count with that field's weight; the
+    section slot ids count as their own tokens, since the skeleton's layout is
+    built around them.
+    """
+    vector: Dict[int, float] = {}
+
+    def add(token: str, weight: float):
+        bucket = zlib.crc32(token.encode("utf-8")) % DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + weight
+
+    for field, weight in FEATURE_WEIGHTS.items():
+        value = features.get(field)
+        if isinstance(value, list):
+            value = " ".join(str(item) for item in value)
+        for token in TOKEN_PATTERN.findall(str(value or "").lower()):
+            if token not in STOPWORDS:
+                add(token, weight)
+    for slug in slots:
+        add(f"slot:{slug}", SLOT_WEIGHT)
+
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {bucket: weight / norm for bucket, weight in vector.items()} if norm else {}
+
+
+def cosine(left: Dict[int, float], right: Dict[int, float]) -> float:
+    if len(left) > len(right):
+        left, right = right, left
+    return sum(weight * right.get(bucket, 0.0) for bucket, weight in left.items())
+
+
+def page_features(state) -> Dict[str, Any]:
+    """ The FEATURE_WEIGHTS fields of a session, read from problem_config and details. """
+    problem_config = state.get("problem_config") or {}
+    details = state.get("details") or {}
+    return {field: problem_config.get(field) or details.get(field) for field in FEATURE_WEIGHTS
+            if problem_config.get(field) or details.get(field)}
+
+
+def _set_meta(html: str, name: str, content: str) -> str:
+    tag = f'<meta name="{name}" content="{html_lib.escape(content, quote=True)}">'
+    pattern = re.compile(rf"<meta\s+name=[\"']{name}[\"'][^>]*>", re.IGNORECASE)
+    if pattern.search(html):
+        return pattern.sub(lambda _: tag, html, count=1)
+    match = TITLE_PATTERN.search(html)
+    if match:
+        return html[:match.end()] + f"\n  {tag}" + html[match.end():]
+    return html
+
+
+def _layout_attributes(attributes: str) -> str:
+    kept = []
+    for match in ATTRIBUTE_PATTERN.finditer(attributes or ""):
+        name = match.group(1).lower()
+        value = match.group(2) if match.group(2) is not None else match.group(3)
+        if name not in LAYOUT_ATTRIBUTES:
+            continue
+        if name == "style":
+            # Background images point at the original page's assets
+            value = ";".join(declaration for declaration in value.split(";") if "url(" not in declaration.lower())
+        if value.strip():
+            kept.append(f' {name}="{html_lib.escape(value, quote=True)}"')
+    return "".join(kept)
+
+
+def structural_skeleton(html: Optional[str]) -> str:
+    """
+    The layout of a page without any of its content: a fixed head with placeholder
+    title/description/keywords, and a body keeping only LAYOUT_TAGS (with their
+    LAYOUT_ATTRIBUTES), the emptied section slots and an empty closing <script>.
+    """
+    body = BODY_PATTERN.search(html or "")
+    if not body:
+        return ""
+
+    parts: List[str] = []
+    for token in BODY_TOKEN_PATTERN.finditer(body.group(2)):
+        if token.group("comment"):
+            if SLOT_MARKER_PATTERN.fullmatch(token.group("comment")):
+                parts.append(token.group("comment"))
+        elif token.group("tag") and token.group("name").lower() in LAYOUT_TAGS:
+            name = token.group("name").lower()
+            closing = token.group("tag").startswith("</")
+            parts.append(f"</{name}>" if closing else f"<{name}{_layout_attributes(token.group('attributes'))}>")
+        elif token.group("text") and not token.group("text").strip():
+            parts.append(token.group("text"))
+    layout = SLOT_PATTERN.sub(lambda match: f"{match.group(1)}{match.group(4)}", "".join(parts))
+    # Blank lines left where dropped elements were
+    layout = re.sub(r"\n[ \t]*(?=\n)", "", layout).rstrip()
+
+    lang = LANG_PATTERN.search(html)
+    return (
+        f'<!DOCTYPE html>\n<html lang="{lang.group(1) if lang else "en"}">\n{SKELETON_HEAD}\n'
+        f"<body{_layout_attributes(body.group(1))}>{layout}\n  <script></script>\n</body>\n</html>"
+    )
+
+
+def personalize(html: str, problem_config: Dict[str, Any]) -> str:
+    """ Write the session's title, meta description and keywords into a stored skeleton. """
+    title = problem_config.get("Page Title")
+    if title:
+        html = TITLE_PATTERN.sub(lambda match: f"{match.group(1)}{html_lib.escape(str(title))}{match.group(2)}", html, count=1)
+    description = problem_config.get("Meta Description") or problem_config.get("Main Content")
+    if description:
+        html = _set_meta(html, "description", str(description)[:META_DESCRIPTION_MAX_CHARS])
+    keywords = problem_config.get("Keywords")
+    if keywords:
+        html = _set_meta(html, "keywords", ", ".join(keywords) if isinstance(keywords, list) else str(keywords))
+    return html
+
+
+class TemplateLibrary:
+    """
+    Local nearest-match index of page skeletons (boilerplate plus empty section slots).
+
+    Entries come from the seed file shipped in templates/ and from pages the
+    builder completed, which are stored in `store_path` as structural_skeleton()
+    so no user's content reaches another user's page. Each entry is indexed by
+    feature_vector() of the page description it was built for; match() returns the
+    entry with the highest cosine similarity if it reaches `threshold`. At most
+    `max_entries` learned entries are kept, oldest dropped first.
+    """
+
+    def __init__(self, seed_path: Optional[str] = SEED_PATH, store_path: Optional[str] = None,
+                 threshold: float = 0.55, max_entries: int = 200):
+        self.store_path = store_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.seeds = self._load(seed_path)
+        # Entries learned before skeletons were stripped of content are cleaned on load
+        self.learned = [{**entry, "html": structural_skeleton(entry["html"])} for entry in self._load(store_path)]
+        self._vectors = {entry["id"]: feature_vector(entry["features"], entry["slots"]) for entry in self.seeds + self.learned}
+        self.hits = 0
+        self.misses = 0
+        # Pages finishing together must not write the file at the same time
+        self._save_lock = asyncio.Lock()
+
+    @staticmethod
+    def _load(path: Optional[str]) -> List[Dict[str, Any]]:
+        if not path:
+            return []
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return json.load(file).get("templates", [])
+        except (OSError, ValueError):
+            return []
+
+    def _save(self, entries: List[Dict[str, Any]]):
+        # Write to a temporary file first so a crash never leaves a truncated library
+        os.makedirs(os.path.dirname(self.store_path) or ".", exist_ok=True)
+        temp_path = f"{self.store_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"templates": entries}, file)
+        os.replace(temp_path, self.store_path)
+
+    def nearest(self, features: Dict[str, Any], slots: List[str]) -> Tuple[Optional[Dict[str, Any]], float]:
+        """ The most similar entry and its score, regardless of the threshold. """
+        query = feature_vector(features, slots)
+        best, best_score = None, 0.0
+        for entry in self.seeds + self.learned:
+            score = cosine(query, self._vectors[entry["id"]])
+            if score > best_score:
+                best, best_score = entry, score
+        return best, best_score
+
+    def match(self, features: Dict[str, Any], slots: List[str]) -> Optional[Tuple[Dict[str, Any], float]]:
+        """ (entry, score) of the closest entry at or above the threshold, or None. """
+        entry, score = self.nearest(features, slots)
+        if entry is None or score < self.threshold:
+            self.misses += 1
+            TEMPLATE_LOOKUPS.labels("miss").inc()
+            return None
+        self.hits += 1
+        TEMPLATE_LOOKUPS.labels("hit").inc()
+        return entry, score
+
+    async def add(self, features: Dict[str, Any], slots: List[str], html: str) -> Optional[str]:
+        """
+        Store the structural skeleton of a finished page. A learned entry for an almost identical
+        description is replaced instead of duplicated. Returns the entry id.
+        """
+        if not self.store_path:
+            return None
+        vector = feature_vector(features, slots)
+        entry = {
+            "id": uuid.uuid4().hex,
+            "source": "learned",
+            "features": features,
+            "slots": list(slots),
+            "html": structural_skeleton(html),
+            "created_at": time.time()
+        }
+        for index, existing in enumerate(self.learned):
+            if existing["slots"] == entry["slots"] and cosine(vector, self._vectors[existing["id"]]) >= 0.98:
+                del self._vectors[existing["id"]]
+                del self.learned[index]
+                break
+
+        self.learned.append(entry)
+        self._vectors[entry["id"]] = vector
+        while len(self.learned) > self.max_entries:
+            del self._vectors[self.learned.pop(0)["id"]]
+        async with self._save_lock:
+            await asyncio.to_thread(self._save, list(self.learned))
+        TEMPLATES_LEARNED.inc()
+        return entry["id"]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "seed_entries": len(self.seeds),
+            "learned_entries": len(self.learned),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "threshold": self.threshold
+        }
+
+
+_LIBRARY: Dict[str, TemplateLibrary] = {}
+
+
+def get_template_library() -> Optional[TemplateLibrary]:
+    """ The shared library built from the TEMPLATE_* settings; None when TEMPLATE_LIBRARY_ENABLED=0. """
+    if os.getenv("TEMPLATE_LIBRARY_ENABLED", "1") == "0":
+        return None
+    if "default" not in _LIBRARY:
+        _LIBRARY["default"] = TemplateLibrary(
+            seed_path=os.getenv("TEMPLATE_SEED_PATH", SEED_PATH) or None,
+            store_path=os.getenv("TEMPLATE_LIBRARY_PATH", os.path.join("data", "template_library.json")) or None,
+            threshold=float(os.getenv("TEMPLATE_MATCH_THRESHOLD", 0.55)),
+            max_entries=int(os.getenv("TEMPLATE_LIBRARY_SIZE", 200))
+        )
+    return _LIBRARY["default"]
+
+
+def template_library_stats() -> Optional[Dict[str, Any]]:
+    library = _LIBRARY.get("default")
+    return library.stats() if library else None
+
+
+def template_boilerplate(state, section_plan: Dict[str, Any]) -> Optional[Tuple[str, str, float]]:
+    """
+    A ready boilerplate for the session from the closest library entry, fitted to the
+    plan's slots and carrying the session's title and meta tags.
+    Returns (html, entry id, score), or None when nothing is close enough.
+    """
+    library = get_template_library()
+    if library is None or not section_plan:
+        return None
+    slots = list(section_slots(section_plan).values())
+    found = library.match(page_features(state), slots)
+    if found is None:
+        return None
+
+    entry, score = found
+    html = personalize(set_slots(entry["html"], slots), state.get("problem_config") or {})
+    # A stored skeleton that no longer passes the checks is not worth starting from
+    if not validate_html(html, section_plan)["valid"]:
+        return None
+    return html, entry["id"], score
+
+
+def start_from_template(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    before_agent_callback for Creator: when there is no page yet and the library holds a
+    close match, start {generated_code} from it and skip the boilerplate model round.
+    The page passes the local checks, so Determiner moves straight on to the first section.
+    """
+    if callback_context.state.get("generated_code"):
+        return None
+    section_plan = parse_section_plan(callback_context.state.get("section_plan"))
+    found = template_boilerplate(callback_context.state, section_plan)
+    if found is None:
+        return None
+
+    html, entry_id, score = found
+    callback_context.state["generated_code"] = html
+    callback_context.state["page_index"] = build_page_index(html)
+    callback_context.state["creator_output"] = None
+    return types.Content(role="model", parts=[types.Part(
+        text=f"Started the page from template '{entry_id}' (similarity {score:.2f}); sections are added next."
+    )])
+
+
+async def learn_from_page(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    after_agent_callback for Webpage_Builder: add the layout of a finished page (valid,
+    every section filled) to the library, without its content, so similar requests can start from it.
+    """
+    library = get_template_library()
+    if library is None:
+        return None
+    section_plan = parse_section_plan(callback_context.state.get("section_plan"))
+    html = callback_context.state.get("generated_code")
+    report = validate_html(html, section_plan)
+    if not section_plan or not report["valid"] or report["pending_sections"]:
+        return None
+    await library.add(page_features(callback_context.state), list(list_slots(html)), html)
+    return None
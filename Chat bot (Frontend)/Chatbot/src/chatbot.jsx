@@ -14,10 +14,17 @@ const WebPageGeneratorUI = () => {
   ]);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [progress, setProgress] = useState('');
   const [error, setError] = useState(null);
   const [apiUrl, setApiUrl] = useState('http://localhost:8000');
   const [copySuccess, setCopySuccess] = useState(false);
+  // Server-issued session id; null until the first reply starts a new conversation
+  const [sessionId, setSessionId] = useState(null);
   const messagesEndRef = useRef(null);
+  // The message still waiting for a reply and its Idempotency-Key, kept until it succeeds
+  const pendingRef = useRef(null);
+  // Set synchronously, so a double click cannot send before isLoading re-renders the button
+  const inFlightRef = useRef(false);
   const [generatedCode, setGeneratedCode] = useState(`<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -55,29 +62,87 @@ const WebPageGeneratorUI = () => {
 </body>
 </html>`);
 
-  // Function to call FastAPI backend
-  const callAgentAPI = async (prompt) => {
+  // Call the FastAPI streaming endpoint; onEvent receives every progress update as it arrives.
+  // Requests sent with the same idempotencyKey share one agent run on the server.
+  const streamAgentAPI = async (prompt, onEvent, idempotencyKey) => {
     try {
-      const response = await fetch(`${apiUrl}/agent/query`, {
+      const response = await fetch(`${apiUrl}/agent/query/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey,
         },
-        body: JSON.stringify({ prompt }),
+        body: JSON.stringify({ prompt, session_id: sessionId }),
       });
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
-      return data;
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finalResponse = null;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events frames are separated by a blank line
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+
+        for (const frame of frames) {
+          const data = frame
+            .split('\n')
+            .filter(line => line.startsWith('data: '))
+            .map(line => line.slice(6))
+            .join('\n');
+          if (!data) continue;
+
+          const payload = JSON.parse(data);
+          if (payload.type === 'session') {
+            setSessionId(payload.session_id);
+          } else if (payload.type === 'error') {
+            throw new Error(payload.detail);
+          } else if (payload.type === 'final') {
+            finalResponse = payload.response;
+          }
+          onEvent(payload);
+        }
+      }
+
+      if (finalResponse === null) {
+        throw new Error('Stream ended before the agent finished');
+      }
+      return { status: 'success', response: finalResponse };
     } catch (error) {
       console.error('API call failed:', error);
       throw error;
     }
   };
 
+  // Render agent progress while the stream is open
+  const handleStreamEvent = (payload) => {
+    if (payload.type !== 'event') return;
+
+    if (payload.tool_calls && payload.tool_calls.length > 0) {
+      setProgress(`${payload.author} is calling ${payload.tool_calls.map(call => call.name).join(', ')}...`);
+    } else if (payload.author && payload.author !== 'user') {
+      setProgress(`${payload.author} is working...`);
+    }
+
+    // Show partial pages in the preview as soon as the builder produces them
+    const partialCode = payload.state_delta && payload.state_delta.generated_code;
+    if (partialCode) {
+      const htmlCode = extractHTMLFromResponse(partialCode);
+      if (htmlCode) {
+        setGeneratedCode(htmlCode);
+      }
+    }
+  };
+
   // Helper function to force newlines to render correctly in Markdown
   const formatNewlinesForMarkdown = (text) => {
     // Replace single newlines with two spaces and a newline, which forces a line break in Markdown
@@ -139,7 +204,7 @@ const WebPageGeneratorUI = () => {
   };
 
   const handleSendMessage = async () => {
-    if (!inputMessage.trim() || isLoading) return;
+    if (!inputMessage.trim() || isLoading || inFlightRef.current) return;
 
     const userMessage = {
       id: Date.now(),
@@ -150,16 +215,33 @@ const WebPageGeneratorUI = () => {
     };
 
     setMessages(prev => [...prev, userMessage]);
-    const currentInput = inputMessage;
     setInputMessage('');
+    await sendPrompt(inputMessage);
+  };
+
+  // Send the unanswered message again with its original key, so the server
+  // replays or joins the run it already started instead of running it twice
+  const retryMessage = async (prompt) => {
+    if (isLoading || inFlightRef.current) return;
+    await sendPrompt(prompt);
+  };
+
+  const sendPrompt = async (currentInput) => {
+    // One key per message: resending the same unanswered message reuses it
+    const pending = pendingRef.current;
+    const idempotencyKey = pending && pending.prompt === currentInput ? pending.idempotencyKey : crypto.randomUUID();
+    pendingRef.current = { prompt: currentInput, idempotencyKey };
+    inFlightRef.current = true;
     setIsLoading(true);
+    setProgress('');
     setError(null);
 
     try {
-      // Call the FastAPI backend
-      const response = await callAgentAPI(currentInput);
+      // Call the FastAPI backend and follow the agents' progress
+      const response = await streamAgentAPI(currentInput, handleStreamEvent, idempotencyKey);
       
       if (response.status === 'success') {
+        pendingRef.current = null;
         // Extract HTML code first
         const htmlCode = extractHTMLFromResponse(response.response);
         
@@ -189,13 +271,16 @@ const WebPageGeneratorUI = () => {
         type: 'bot',
         content: `Sorry, I encountered an error: ${error.message}. Please check your connection and try again.`,
         timestamp: new Date(),
-        isError: true
+        isError: true,
+        retryPrompt: currentInput
       };
 
       setMessages(prev => [...prev, errorMessage]);
       setError(error.message);
     } finally {
+      inFlightRef.current = false;
       setIsLoading(false);
+      setProgress('');
     }
   };
 
@@ -245,6 +330,8 @@ const WebPageGeneratorUI = () => {
       timestamp: new Date(),
       isError: false
     }]);
+    setSessionId(null);
+    pendingRef.current = null;
     setError(null);
   };
 
@@ -342,6 +429,15 @@ const WebPageGeneratorUI = () => {
                   ) : (
                     <p className="text-sm whitespace-pre-wrap">{message.content}</p>
                   )}
+                  {message.retryPrompt && (
+                    <button
+                      onClick={() => retryMessage(message.retryPrompt)}
+                      disabled={isLoading}
+                      className="text-xs font-medium text-red-600 hover:text-red-800 underline disabled:text-red-300 disabled:cursor-not-allowed"
+                    >
+                      Retry
+                    </button>
+                  )}
                   <p className={`text-xs mt-1 ${
                     message.type === 'user' ? 'text-blue-100' : message.isError ? 'text-red-400' : 'text-gray-400'
                   }`}>
@@ -362,7 +458,7 @@ const WebPageGeneratorUI = () => {
                 <div className="px-4 py-2 rounded-2xl bg-white text-gray-800 shadow-sm rounded-bl-sm border">
                   <div className="flex items-center space-x-2">
                     <Loader2 className="w-4 h-4 animate-spin" />
-                    <p className="text-sm">Bot is thinking...</p>
+                    <p className="text-sm">{progress || 'Bot is thinking...'}</p>
                   </div>
                 </div>
               </div>